@@ -0,0 +1,52 @@
+"""Add foreign key and keyset indexes
+
+Revision ID: 3f1c9a7d52e4
+Revises: daab2cfc2bb9
+Create Date: 2026-10-18 10:12:41.118305
+
+"""
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision = "3f1c9a7d52e4"
+down_revision = "daab2cfc2bb9"
+branch_labels = None
+depends_on = None
+
+# the foreign key leads every per-parent index, so it also serves the
+# lookups of ON DELETE CASCADE and no separate single-column index is needed
+INDEXES = [
+    ("ix_fleets_date_created_id", "fleets", ["date_created", "id"]),
+    ("ix_drivers_date_created_id", "drivers", ["date_created", "id"]),
+    ("ix_vehicles_date_created_id", "vehicles", ["date_created", "id"]),
+    (
+        "ix_vehicles_owner_id_date_created_id",
+        "vehicles",
+        ["owner_id", "date_created", "id"],
+    ),
+    ("ix_routes_date_created_id", "routes", ["date_created", "id"]),
+    (
+        "ix_routes_driver_id_date_created_id",
+        "routes",
+        ["driver_id", "date_created", "id"],
+    ),
+    (
+        "ix_routes_vehicle_id_date_created_id",
+        "routes",
+        ["vehicle_id", "date_created", "id"],
+    ),
+]
+
+
+def upgrade() -> None:
+    # CONCURRENTLY keeps the tables writable while the indexes build, but
+    # cannot run inside the migration transaction
+    with op.get_context().autocommit_block():
+        for name, table, columns in INDEXES:
+            op.create_index(name, table, columns, postgresql_concurrently=True)
+
+
+def downgrade() -> None:
+    with op.get_context().autocommit_block():
+        for name, table, _ in INDEXES:
+            op.drop_index(name, table, postgresql_concurrently=True)
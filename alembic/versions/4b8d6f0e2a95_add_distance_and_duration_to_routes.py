@@ -0,0 +1,27 @@
+"""Add distance and duration to routes
+
+Revision ID: 4b8d6f0e2a95
+Revises: e1a7c3d9f5b2
+Create Date: 2026-10-18 19:02:17.551630
+
+"""
+import sqlalchemy as sql
+
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision = "4b8d6f0e2a95"
+down_revision = "e1a7c3d9f5b2"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    # filled for existing routes by python -m app.jobs.measure_routes
+    op.add_column("routes", sql.Column("distance_m", sql.Float, nullable=True))
+    op.add_column("routes", sql.Column("duration_s", sql.Float, nullable=True))
+
+
+def downgrade() -> None:
+    op.drop_column("routes", "duration_s")
+    op.drop_column("routes", "distance_m")
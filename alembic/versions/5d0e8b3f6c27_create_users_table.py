@@ -0,0 +1,69 @@
+"""Create users table
+
+Revision ID: 5d0e8b3f6c27
+Revises: b7e24d0c9a61
+Create Date: 2026-10-18 16:05:48.310274
+
+"""
+from uuid import uuid4
+
+import sqlalchemy as sql
+from sqlalchemy.dialects.postgresql import UUID
+
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision = "5d0e8b3f6c27"
+down_revision = "b7e24d0c9a61"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    users = op.create_table(
+        "users",
+        sql.Column("id", UUID(as_uuid=True), primary_key=True),
+        sql.Column("username", sql.String, nullable=False, unique=True),
+        sql.Column("full_name", sql.String, nullable=True),
+        sql.Column("email", sql.String, nullable=True),
+        sql.Column("hashed_password", sql.String, nullable=False),
+        sql.Column(
+            "disabled",
+            sql.Boolean,
+            nullable=False,
+            server_default=sql.text("false"),
+        ),
+        sql.Column(
+            "fleet_id",
+            UUID(as_uuid=True),
+            sql.ForeignKey("fleets.id", ondelete="CASCADE"),
+            nullable=True,
+        ),
+        sql.Column(
+            "date_created",
+            sql.TIMESTAMP(timezone=True),
+            nullable=False,
+            server_default=sql.text("now()"),
+        ),
+    )
+    op.create_index("ix_users_username", "users", ["username"])
+    op.create_index("ix_users_fleet_id", "users", ["fleet_id"])
+    # the account that used to be hard-coded in app/database.py
+    op.bulk_insert(
+        users,
+        [
+            {
+                "id": uuid4(),
+                "username": "bao",
+                "full_name": "bao hua",
+                "email": "bao@example.com",
+                "hashed_password": (
+                    "$2b$12$VjHOYBKb77976bZoTOIABekHde3FJAHZyJwte2z6.zfqkvOBu1.4u"
+                ),
+            }
+        ],
+    )
+
+
+def downgrade() -> None:
+    op.drop_table("users")
@@ -0,0 +1,34 @@
+"""Restrict deleting fleets with users
+
+Revision ID: 6e3b9d1f4a70
+Revises: 7d2e5a9c3f14
+Create Date: 2026-10-19 10:12:37.840516
+
+"""
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision = "6e3b9d1f4a70"
+down_revision = "7d2e5a9c3f14"
+branch_labels = None
+depends_on = None
+
+
+def _fleet_foreign_key(ondelete: str) -> None:
+    op.drop_constraint("users_fleet_id_fkey", "users", type_="foreignkey")
+    op.create_foreign_key(
+        "users_fleet_id_fkey",
+        "users",
+        "fleets",
+        ["fleet_id"],
+        ["id"],
+        ondelete=ondelete,
+    )
+
+
+def upgrade() -> None:
+    _fleet_foreign_key("RESTRICT")
+
+
+def downgrade() -> None:
+    _fleet_foreign_key("CASCADE")
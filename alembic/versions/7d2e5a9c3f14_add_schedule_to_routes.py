@@ -0,0 +1,53 @@
+"""Add schedule to routes
+
+Revision ID: 7d2e5a9c3f14
+Revises: 4b8d6f0e2a95
+Create Date: 2026-10-18 20:11:42.306518
+
+"""
+import sqlalchemy as sql
+
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision = "7d2e5a9c3f14"
+down_revision = "4b8d6f0e2a95"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.add_column(
+        "routes",
+        sql.Column("starts_at", sql.TIMESTAMP(timezone=True), nullable=True),
+    )
+    op.add_column(
+        "routes",
+        sql.Column("ends_at", sql.TIMESTAMP(timezone=True), nullable=True),
+    )
+    op.create_check_constraint(
+        "ck_routes_schedule",
+        "routes",
+        "(starts_at IS NULL) = (ends_at IS NULL)"
+        " AND (starts_at IS NULL OR ends_at > starts_at)",
+    )
+    # gist indexes of (id, window) that refuse overlapping windows of one
+    # driver or vehicle, even from writes racing the app's own checks;
+    # btree_gist lets a gist index compare the uuids
+    op.execute("CREATE EXTENSION IF NOT EXISTS btree_gist")
+    for column in ("driver_id", "vehicle_id"):
+        resource = column.removesuffix("_id")
+        op.execute(
+            f"ALTER TABLE routes ADD CONSTRAINT ex_routes_{resource}_schedule"
+            f" EXCLUDE USING gist ({column} WITH =,"
+            " tstzrange(starts_at, ends_at) WITH &&)"
+            " WHERE (starts_at IS NOT NULL)"
+        )
+
+
+def downgrade() -> None:
+    op.drop_constraint("ex_routes_vehicle_schedule", "routes")
+    op.drop_constraint("ex_routes_driver_schedule", "routes")
+    op.drop_constraint("ck_routes_schedule", "routes")
+    op.drop_column("routes", "ends_at")
+    op.drop_column("routes", "starts_at")
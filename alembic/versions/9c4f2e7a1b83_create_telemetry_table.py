@@ -0,0 +1,40 @@
+"""Create telemetry table
+
+Revision ID: 9c4f2e7a1b83
+Revises: 5d0e8b3f6c27
+Create Date: 2026-10-18 17:12:03.418752
+
+"""
+import sqlalchemy as sql
+from sqlalchemy.dialects.postgresql import UUID
+
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision = "9c4f2e7a1b83"
+down_revision = "5d0e8b3f6c27"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    # daily partitions are created ahead of time by the app; the default
+    # one holds whatever arrives before they exist
+    op.create_table(
+        "telemetry",
+        sql.Column("vehicle_id", UUID(as_uuid=True), nullable=False),
+        sql.Column("ts", sql.TIMESTAMP(timezone=True), nullable=False),
+        sql.Column("lat", sql.Float, nullable=False),
+        sql.Column("lon", sql.Float, nullable=False),
+        sql.Column("speed", sql.Float, nullable=False),
+        sql.Column("heading", sql.Float, nullable=False),
+        postgresql_partition_by="RANGE (ts)",
+    )
+    op.execute("CREATE TABLE telemetry_default PARTITION OF telemetry DEFAULT")
+    op.create_index(
+        "ix_telemetry_vehicle_id_ts", "telemetry", ["vehicle_id", "ts"]
+    )
+
+
+def downgrade() -> None:
+    op.drop_table("telemetry")
@@ -0,0 +1,36 @@
+"""Add version columns
+
+Revision ID: b7e24d0c9a61
+Revises: 3f1c9a7d52e4
+Create Date: 2026-10-18 14:37:05.482913
+
+"""
+import sqlalchemy as sql
+
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision = "b7e24d0c9a61"
+down_revision = "3f1c9a7d52e4"
+branch_labels = None
+depends_on = None
+
+TABLES = ["fleets", "vehicles", "drivers", "routes"]
+
+
+def upgrade() -> None:
+    for table in TABLES:
+        op.add_column(
+            table,
+            sql.Column(
+                "version",
+                sql.Integer,
+                nullable=False,
+                server_default=sql.text("1"),
+            ),
+        )
+
+
+def downgrade() -> None:
+    for table in TABLES:
+        op.drop_column(table, "version")
@@ -0,0 +1,24 @@
+"""Add geometry to routes
+
+Revision ID: e1a7c3d9f5b2
+Revises: 9c4f2e7a1b83
+Create Date: 2026-10-18 18:24:41.906215
+
+"""
+import sqlalchemy as sql
+
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision = "e1a7c3d9f5b2"
+down_revision = "9c4f2e7a1b83"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.add_column("routes", sql.Column("geometry", sql.String, nullable=True))
+
+
+def downgrade() -> None:
+    op.drop_column("routes", "geometry")
@@ -0,0 +1,337 @@
+"""
+cache.py
+read-through helpers around the shared Redis client
+"""
+
+import asyncio
+import hashlib
+import json
+import logging
+import time
+from collections import Counter, OrderedDict
+from typing import (
+    TYPE_CHECKING,
+    Any,
+    Awaitable,
+    Callable,
+    Dict,
+    Generic,
+    NamedTuple,
+    Set,
+    Tuple,
+    TypeVar,
+)
+from uuid import uuid4
+
+from fastapi import Response
+from pydantic import TypeAdapter
+
+from app.config import settings
+from app.ctrl.versions import ETAG_HEADER, etag
+
+if TYPE_CHECKING:
+    from aioredis import Redis
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+# how long one worker may hold the rebuild lock of a key
+LOCK_TIMEOUT_MS = 5000
+# how long the other workers wait for that rebuild before querying anyway
+LOCK_POLL_INTERVAL = 0.05
+LOCK_POLLS = 40
+
+# compare-and-delete, so an expired lock is never released by its old owner
+_RELEASE_LOCK = """
+if redis.call("get", KEYS[1]) == ARGV[1] then
+    return redis.call("del", KEYS[1])
+end
+return 0
+"""
+
+# stored for rows that do not exist; not valid JSON, so it cannot collide
+# with a cached body
+NOT_FOUND = b"\x00not-found"
+
+# every worker drops the keys published here from its local cache
+INVALIDATION_CHANNEL = "cache_invalidation"
+# seconds the listener waits for a message before polling again
+LISTEN_POLL_INTERVAL = 1.0
+
+# per-process counters, served by GET /api/stats/cache
+stats: Counter = Counter()
+
+_inflight: Dict[str, "asyncio.Task"] = {}
+
+
+class Codec(Generic[T]):
+    """
+    Serialize ORM rows straight to the JSON body the API responds with, so
+    a cached entry is returned as-is instead of being decoded, validated
+    against the ``response_model`` and encoded again on every hit.
+    """
+
+    def __init__(self, schema: Any):
+        self.adapter = TypeAdapter(schema)
+
+    def dump(self, value: Any) -> bytes:
+        return self.adapter.dump_json(
+            self.adapter.validate_python(value, from_attributes=True),
+            by_alias=True,
+        )
+
+    def dump_entry(self, row: Any) -> bytes:
+        """Cache entry of a versioned row: its ETag and its body."""
+        return pack(etag(row.version), self.dump(row))
+
+
+class CachedJSONResponse(Response):
+    """Response for a body that is already serialized JSON."""
+
+    media_type = "application/json"
+
+
+class Entry(NamedTuple):
+    body: bytes
+    etag: str
+
+
+def pack(etag: str, body: bytes) -> bytes:
+    """Cache entry of a body and its ETag, split on the first newline."""
+    return etag.encode() + b"\n" + body
+
+
+def unpack(entry: bytes) -> Entry:
+    etag, _, body = entry.partition(b"\n")
+    return Entry(body, etag.decode())
+
+
+def content_etag(body: bytes) -> str:
+    """Strong ETag of a body that has no version of its own, like a page."""
+    return f'"{hashlib.blake2b(body, digest_size=16).hexdigest()}"'
+
+
+def _not_modified(if_none_match: str | None, etag: str) -> bool:
+    # If-None-Match uses the weak comparison, so W/ prefixes are ignored
+    if if_none_match is None:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    return any(
+        tag.strip().removeprefix("W/") == etag
+        for tag in if_none_match.split(",")
+    )
+
+
+def cached_response(
+    entry,
+    if_none_match: str | None,
+    headers: Dict[str, str] | None = None,
+) -> Response:
+    """
+    Respond with a cached ``entry`` (anything with a ``body`` and an
+    ``etag``), or with an empty 304 when the client already has it.
+    """
+    headers = {**(headers or {}), ETAG_HEADER: entry.etag}
+    if _not_modified(if_none_match, entry.etag):
+        return Response(status_code=304, headers=headers)
+    return CachedJSONResponse(entry.body, headers=headers)
+
+
+class LocalCache:
+    """
+    Bounded LRU of Redis entries kept by each worker, addressed like Redis
+    as a key plus an optional hash field. Invalidating a key drops all of
+    its fields.
+    """
+
+    def __init__(self, max_entries: int, ttl: float):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        # bumped on every invalidation; a value read from Redis before the
+        # latest invalidation is not stored, since it may already be stale
+        self.generation = 0
+        self.entries: OrderedDict[Tuple[str, str], Tuple[float, bytes]] = (
+            OrderedDict()
+        )
+        self.fields: Dict[str, Set[str]] = {}
+
+    def get(self, key: str, field: str = "") -> bytes | None:
+        if (entry := self.entries.get((key, field))) is None:
+            return None
+        expires_at, value = entry
+        if expires_at < time.monotonic():
+            self._pop(key, field)
+            return None
+        self.entries.move_to_end((key, field))
+        return value
+
+    def set(
+        self,
+        key: str,
+        value: bytes,
+        generation: int,
+        field: str = "",
+        ttl: float | None = None,
+    ) -> None:
+        if generation != self.generation:
+            return
+        ttl = self.ttl if ttl is None else ttl
+        if value == NOT_FOUND:
+            ttl = min(ttl, settings.cache_negative_ttl)
+        self.entries[(key, field)] = (time.monotonic() + ttl, value)
+        self.entries.move_to_end((key, field))
+        self.fields.setdefault(key, set()).add(field)
+        while len(self.entries) > self.max_entries:
+            (old_key, old_field), _ = self.entries.popitem(last=False)
+            self._forget(old_key, old_field)
+
+    def invalidate(self, *keys: str) -> None:
+        self.generation += 1
+        for key in keys:
+            for field in self.fields.pop(key, ()):
+                self.entries.pop((key, field), None)
+
+    def clear(self) -> None:
+        self.generation += 1
+        self.entries.clear()
+        self.fields.clear()
+
+    def _pop(self, key: str, field: str) -> None:
+        self.entries.pop((key, field), None)
+        self._forget(key, field)
+
+    def _forget(self, key: str, field: str) -> None:
+        if (fields := self.fields.get(key)) is not None:
+            fields.discard(field)
+            if not fields:
+                del self.fields[key]
+
+
+local = LocalCache(
+    max_entries=settings.cache_local_max_entries,
+    ttl=settings.cache_local_ttl,
+)
+
+
+async def _single_flight(key: str, load: Callable[[], Awaitable[T]]) -> T:
+    """Share one in-flight ``load()`` between concurrent callers of a key."""
+    if (task := _inflight.get(key)) is None:
+        task = asyncio.ensure_future(load())
+        _inflight[key] = task
+        task.add_done_callback(lambda _: _inflight.pop(key, None))
+    return await asyncio.shield(task)
+
+
+async def _locked_load(
+    redis: "Redis",
+    key: str,
+    fetch: Callable[[], Awaitable[T | None]],
+    load: Callable[[], Awaitable[T]],
+) -> T:
+    lock, token = f"lock_{key}", uuid4().hex
+    if await redis.set(lock, token, nx=True, px=LOCK_TIMEOUT_MS):
+        try:
+            return await load()
+        finally:
+            await redis.eval(_RELEASE_LOCK, 1, lock, token)
+
+    for _ in range(LOCK_POLLS):
+        await asyncio.sleep(LOCK_POLL_INTERVAL)
+        if (value := await fetch()) is not None:
+            return value
+    return await load()
+
+
+async def read_through(
+    redis: "Redis",
+    key: str,
+    fetch: Callable[[], Awaitable[bytes | None]],
+    load: Callable[[], Awaitable[bytes]],
+    field: str = "",
+) -> bytes:
+    """
+    Return the entry for ``key`` (and hash ``field``) from the local cache,
+    then from ``fetch()`` on Redis, otherwise ``load()`` it from the db.
+    ``load`` must store what it returns, so that on a miss only one request
+    per process, and one process per key, runs the query while the rest
+    wait for the cache to be filled.
+    """
+    if (value := local.get(key, field)) is not None:
+        stats[
+            "local_negative_hits" if value == NOT_FOUND else "local_hits"
+        ] += 1
+        return value
+
+    generation = local.generation
+    if (value := await fetch()) is not None:
+        stats["negative_hits" if value == NOT_FOUND else "hits"] += 1
+    else:
+        stats["misses"] += 1
+        flight = f"{key}:{field}" if field else key
+        value = await _single_flight(
+            flight, lambda: _locked_load(redis, flight, fetch, load)
+        )
+    local.set(key, value, generation, field=field)
+    return value
+
+
+async def store(
+    redis: "Redis", key: str, payload: bytes | None, ex: int = 300
+) -> bytes:
+    """
+    Cache ``payload``, or a short-lived NOT_FOUND entry when the row does
+    not exist, and return what was stored.
+    """
+    if payload is None:
+        stats["negative_stores"] += 1
+        await redis.set(key, NOT_FOUND, ex=settings.cache_negative_ttl)
+        return NOT_FOUND
+    await redis.set(key, payload, ex=ex)
+    return payload
+
+
+def found(cached: bytes) -> Entry | None:
+    return None if cached == NOT_FOUND else unpack(cached)
+
+
+async def invalidate(redis: "Redis", *keys: str) -> None:
+    """
+    Drop ``keys`` from Redis and from the local cache of every worker, in
+    one round-trip. Writers call it once, after their commit, with every key
+    the write touched: invalidating earlier would let a concurrent reader
+    cache the rows as they were before the commit.
+    """
+    local.invalidate(*keys)
+    pipe = redis.pipeline(transaction=False)
+    # freed in the background, so large list hashes do not block redis
+    pipe.unlink(*keys)
+    pipe.publish(INVALIDATION_CHANNEL, json.dumps(keys))
+    await pipe.execute()
+
+
+async def listen_for_invalidations(redis: "Redis") -> None:
+    """Apply the invalidations published by other workers, until cancelled."""
+    while True:
+        try:
+            async with redis.pubsub() as pubsub:
+                await pubsub.subscribe(INVALIDATION_CHANNEL)
+                # whatever was published while unsubscribed is lost
+                local.clear()
+                while True:
+                    # listen() would read under the pool's socket_timeout and
+                    # fail whenever nothing is published for that long;
+                    # polling treats a quiet channel as the idle case it is
+                    message = await pubsub.get_message(
+                        ignore_subscribe_messages=True,
+                        timeout=LISTEN_POLL_INTERVAL,
+                    )
+                    if message is not None and message["type"] == "message":
+                        local.invalidate(*json.loads(message["data"]))
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            logger.exception("cache invalidation listener failed")
+            local.clear()
+            await asyncio.sleep(1)
@@ -9,13 +9,58 @@ class Settings(BaseSettings):
     database_name: str = Field(default=...)
     database_username: str = Field(default=...)
     database_password: str = Field(default=...)
+    # use the asyncpg engine; set DATABASE_ASYNC=false to fall back to
+    # psycopg2 sessions run in the threadpool
+    database_async: bool = Field(default=True)
+    database_pool_size: int = Field(default=20)
+    database_max_overflow: int = Field(default=10)
 
     secret_key: str = Field(default=...)
     algorithm: str = Field(default=...)
     access_token_expire_minutes: int = Field(default=...)
+    # bcrypt runs in its own pool, so a burst of logins cannot take over the
+    # threadpool or the event loop the rest of the api needs
+    login_hash_workers: int = Field(default=4)
+    # failed logins allowed per username and window (seconds)
+    login_rate_limit: int = Field(default=5)
+    login_rate_window: int = Field(default=60)
 
     redis_server: str = Field(default=...)
     redis_port: int = Field(default=...)
+    redis_max_connections: int = Field(default=100)
+    # seconds to wait for a free pooled connection before erroring
+    redis_pool_timeout: float = Field(default=5.0)
+    redis_socket_timeout: float = Field(default=5.0)
+    redis_socket_connect_timeout: float = Field(default=2.0)
+    redis_health_check_interval: int = Field(default=30)
+    # ttl of the entries remembering that a row does not exist
+    cache_negative_ttl: int = Field(default=30)
+    # per-worker cache in front of redis; pub/sub keeps it in sync, the ttl
+    # only bounds staleness if an invalidation message is ever lost
+    cache_local_max_entries: int = Field(default=10_000)
+    cache_local_ttl: float = Field(default=60.0)
+
+    # responses smaller than this are not worth compressing
+    gzip_minimum_size: int = Field(default=1000)
+    # JSON compresses nearly as well at 5 as at 9, for a fraction of the cpu
+    gzip_compresslevel: int = Field(default=5)
+
+    # points each worker buffers before telemetry requests have to wait
+    telemetry_buffer_max_points: int = Field(default=500_000)
+    # a flush runs once this many points are buffered, or every interval
+    telemetry_flush_points: int = Field(default=20_000)
+    telemetry_flush_interval: float = Field(default=1.0)
+    # how long a POST waits for room in a full buffer before a 503
+    telemetry_put_timeout: float = Field(default=2.0)
+    # daily partitions created ahead of time
+    telemetry_partition_days_ahead: int = Field(default=2)
+    # how far ahead of now a point may be dated (seconds; device clocks
+    # drift), and how far back (days; devices buffer while offline)
+    telemetry_max_clock_skew: float = Field(default=300.0)
+    telemetry_max_age_days: int = Field(default=30)
+
+    # ETAs of stored routes assume this average speed
+    route_average_speed_kmh: float = Field(default=40.0)
 
     model_config = SettingsConfigDict(env_file="app.env")
 
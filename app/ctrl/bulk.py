@@ -0,0 +1,54 @@
+"""
+bulk.py
+multi-row insert / ON CONFLICT upsert shared by the bulk controllers
+"""
+
+from collections import Counter
+from typing import Any, Dict, Iterable, List
+
+from sqlalchemy.dialects.postgresql import insert
+
+# rows accepted by one bulk request; the driver splits the statement into
+# multi-row VALUES batches on its own
+MAX_ITEMS = 10_000
+
+
+def duplicates(keys: Iterable[Any]) -> List[Any]:
+    """
+    The keys occurring more than once. ON CONFLICT cannot touch the same row
+    twice in one statement, and picking one of the rows would return fewer
+    objects than were sent, so upserts refuse them instead.
+    """
+    return [key for key, count in Counter(keys).items() if count > 1]
+
+
+async def insert_many(
+    model,
+    rows: List[Dict[str, Any]],
+    db,
+    upsert_on: str | None = None,
+) -> List[Any]:
+    """
+    Insert ``rows`` in one statement, or upsert them on the unique column
+    ``upsert_on``, and return the resulting ORM objects, in the order of
+    ``rows``. Upserted rows must not repeat a key, see ``duplicates``.
+    """
+    statement = insert(model)
+    if upsert_on is not None:
+        statement = statement.on_conflict_do_update(
+            index_elements=[upsert_on],
+            set_={
+                **{
+                    name: statement.excluded[name]
+                    for name in rows[0]
+                    if name != upsert_on
+                },
+                "version": model.version + 1,
+            },
+        )
+    # postgres does not promise RETURNING rows in VALUES order, and callers
+    # pair the results with their input by position
+    statement = statement.returning(
+        model, sort_by_parameter_order=True
+    ).execution_options(populate_existing=True)
+    return (await db.scalars(statement, rows)).all()
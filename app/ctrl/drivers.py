@@ -1,91 +1,144 @@
-import json
-from typing import TYPE_CHECKING, List
+from typing import TYPE_CHECKING, Any, Dict, List, Tuple
 from uuid import UUID
 
-from fastapi.encoders import jsonable_encoder
+import sqlalchemy as sql
+from sqlalchemy import select
 
-from app import models, schemas
+from app import cache, models, schemas
+from app.ctrl import bulk, pagination, routes, versions
 
 if TYPE_CHECKING:
     from aioredis import Redis
-    from sqlalchemy.orm import Session
+    from sqlalchemy.ext.asyncio import AsyncSession
+
+DRIVER = cache.Codec(schemas.Driver)
+DRIVERS = cache.Codec(List[schemas.Driver])
 
 
 async def create(
     driver: schemas.CreateDriver,
     redis: "Redis",
-    db: "Session",
+    db: "AsyncSession",
 ) -> schemas.Driver:
     driver = models.Driver(**driver.model_dump())
     db.add(driver)
-    db.commit()
-    db.refresh(driver)
-    await redis.delete("drivers")
+    await db.commit()
+    await db.refresh(driver)
+    await cache.invalidate(redis, "drivers", f"driver_{driver.id}")
     return schemas.Driver.model_validate(driver)
 
 
+async def create_many(
+    drivers_data: List[schemas.CreateDriver],
+    redis: "Redis",
+    db: "AsyncSession",
+    upsert: bool = False,
+) -> List[schemas.Driver]:
+    drivers = await bulk.insert_many(
+        models.Driver,
+        [driver.model_dump() for driver in drivers_data],
+        db,
+        upsert_on="phone_number" if upsert else None,
+    )
+    drivers = [schemas.Driver.model_validate(driver) for driver in drivers]
+    await db.commit()
+    await cache.invalidate(
+        redis, "drivers", *(f"driver_{driver.id}" for driver in drivers)
+    )
+    return drivers
+
+
 async def get_all(
     redis: "Redis",
-    db: "Session",
-) -> List[models.Driver]:
-    if (cached_profile := await redis.get("drivers")) is not None:
-        drivers = json.loads(cached_profile)
-        return drivers
-    else:
-        drivers = db.query(models.Driver).all()
-        await redis.set(
-            "drivers", json.dumps(jsonable_encoder(drivers)), ex=300
+    db: "AsyncSession",
+    limit: int = pagination.DEFAULT_LIMIT,
+    cursor: str | None = None,
+    driver_name: str | None = None,
+    phone_number: str | None = None,
+) -> pagination.Page:
+    filters = {"driver_name": driver_name, "phone_number": phone_number}
+    field = pagination.page_key(limit, cursor, **filters)
+
+    async def load() -> bytes:
+        statement = pagination.filter_by(select(models.Driver), **filters)
+        drivers = (
+            await db.scalars(
+                pagination.paginate(statement, models.Driver, limit, cursor)
+            )
+        ).all()
+        drivers, next_cursor = pagination.split_page(drivers, limit)
+        return await pagination.set_cached_page(
+            redis, "drivers", field, DRIVERS.dump(drivers), next_cursor
         )
-        return drivers
+
+    cached_page = await cache.read_through(
+        redis,
+        "drivers",
+        fetch=lambda: redis.hget("drivers", field),
+        load=load,
+        field=field,
+    )
+    return pagination.parse_page(cached_page)
 
 
 async def get(
     driver_id: UUID,
     redis: "Redis",
-    db: "Session",
-) -> models.Driver | None:
-    if (cached_profile := await redis.get(f"driver_{driver_id}")) is not None:
-        driver = json.loads(cached_profile)
-    else:
-        driver = (
-            db.query(models.Driver)
-            .filter(models.Driver.id == driver_id)
-            .first()
+    db: "AsyncSession",
+) -> cache.Entry | None:
+    async def load() -> bytes:
+        driver = await db.scalar(
+            select(models.Driver).filter(models.Driver.id == driver_id)
         )
-        await redis.set(
-            f"driver_{driver_id}", json.dumps(jsonable_encoder(driver)), ex=300
+        return await cache.store(
+            redis,
+            f"driver_{driver_id}",
+            None if driver is None else DRIVER.dump_entry(driver),
         )
-    return driver
+
+    cached_profile = await cache.read_through(
+        redis,
+        f"driver_{driver_id}",
+        fetch=lambda: redis.get(f"driver_{driver_id}"),
+        load=load,
+    )
+    return cache.found(cached_profile)
 
 
 async def delete(
     driver_id: UUID,
     redis: "Redis",
-    db: "Session",
-) -> None:
-    driver = (
-        db.query(models.Driver).filter(models.Driver.id == driver_id).first()
+    db: "AsyncSession",
+) -> bool:
+    # its routes would go with it, leaving their cache keys behind
+    stale = await routes.delete_where(models.Route.driver_id == driver_id, db)
+    deleted = await db.scalar(
+        sql.delete(models.Driver)
+        .filter(models.Driver.id == driver_id)
+        .returning(models.Driver.id)
     )
-    db.delete(driver)
-    db.commit()
-    await redis.delete(f"driver_{driver_id}")
-    await redis.delete("drivers")
+    if deleted is None:
+        await db.rollback()
+        return False
+    await db.commit()
+    await cache.invalidate(redis, "drivers", f"driver_{driver_id}", *stale)
+    return True
 
 
 async def update(
-    driver_data,
     driver_id: UUID,
+    changes: Dict[str, Any],
     redis: "Redis",
-    db: "Session",
-) -> schemas.Driver:
-    driver = (
-        db.query(models.Driver).filter(models.Driver.id == driver_id).first()
+    db: "AsyncSession",
+    if_match: List[int] | None = None,
+) -> Tuple[schemas.Driver, int] | None:
+    driver = await versions.update_row(
+        models.Driver, driver_id, changes, db, if_match=if_match
     )
-    if driver is not None:
-        driver.driver_name = driver_data.driver_name
-        driver.phone_number = driver_data.phone_number
-    db.commit()
-    db.refresh(driver)
-    await redis.delete(f"driver_{driver_id}")
-    await redis.delete("drivers")
-    return schemas.Driver.model_validate(driver)
+    if driver is None:
+        return None
+    version = driver.version
+    driver = schemas.Driver.model_validate(driver)
+    await db.commit()
+    await cache.invalidate(redis, "drivers", f"driver_{driver_id}")
+    return driver, version
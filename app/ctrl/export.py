@@ -0,0 +1,73 @@
+"""
+export.py
+stream query results as NDJSON or CSV without materializing the table
+"""
+
+import csv
+import io
+from enum import Enum
+from typing import AsyncIterator, Type
+
+from pydantic import BaseModel
+from sqlalchemy import Select
+
+# rows fetched per server-side cursor round-trip and per response chunk
+BATCH_SIZE = 1000
+
+
+class ExportFormat(str, Enum):
+    ndjson = "ndjson"
+    csv = "csv"
+
+
+MEDIA_TYPES = {
+    ExportFormat.ndjson: "application/x-ndjson",
+    ExportFormat.csv: "text/csv",
+}
+
+
+def _ndjson(partition, schema: Type[BaseModel]) -> bytes:
+    return b"".join(
+        schema.model_validate(row).model_dump_json(by_alias=True).encode()
+        + b"\n"
+        for row in partition
+    )
+
+
+def _csv_header(schema: Type[BaseModel]) -> bytes:
+    buffer = io.StringIO()
+    csv.writer(buffer).writerow(
+        field.alias or name for name, field in schema.model_fields.items()
+    )
+    return buffer.getvalue().encode()
+
+
+def _csv(partition, schema: Type[BaseModel]) -> bytes:
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    for row in partition:
+        writer.writerow(
+            schema.model_validate(row)
+            .model_dump(by_alias=True, mode="json")
+            .values()
+        )
+    return buffer.getvalue().encode()
+
+
+async def stream(
+    statement: Select,
+    schema: Type[BaseModel],
+    export_format: ExportFormat,
+    db,
+) -> AsyncIterator[bytes]:
+    """Yield one encoded chunk per BATCH_SIZE rows of ``statement``."""
+    result = await db.stream_scalars(
+        statement.execution_options(yield_per=BATCH_SIZE)
+    )
+    if export_format is ExportFormat.csv:
+        yield _csv_header(schema)
+        encode = _csv
+    else:
+        encode = _ndjson
+    async for partition in result.partitions():
+        yield encode(partition, schema)
@@ -1,85 +1,173 @@
-import json
-from typing import TYPE_CHECKING, List
+from typing import TYPE_CHECKING, Any, Dict, List, Set, Tuple
 from uuid import UUID
 
-from fastapi.encoders import jsonable_encoder
+import sqlalchemy as sql
+from sqlalchemy import select
+from sqlalchemy.exc import IntegrityError
 
-from app import models, schemas
+from app import cache, models, schemas
+from app.ctrl import bulk, pagination, positions, users, vehicles, versions
 
 if TYPE_CHECKING:
     from aioredis import Redis
-    from sqlalchemy.orm import Session
+    from sqlalchemy.ext.asyncio import AsyncSession
+
+FLEET = cache.Codec(schemas.Fleet)
+FLEETS = cache.Codec(List[schemas.Fleet])
+
+
+class FleetHasUsers(Exception):
+    def __init__(self, fleet_id: UUID):
+        super().__init__(f"Fleet {fleet_id} still has users")
+        self.fleet_id = fleet_id
 
 
 async def create(
     fleet: schemas.CreateFleet,
     redis: "Redis",
-    db: "Session",
+    db: "AsyncSession",
 ) -> schemas.Fleet:
     fleet = models.Fleet(**fleet.model_dump())
     db.add(fleet)
-    db.commit()
-    db.refresh(fleet)
-    await redis.delete("fleets")
+    await db.commit()
+    await db.refresh(fleet)
+    await cache.invalidate(redis, "fleets", f"fleet_{fleet.id}")
     return schemas.Fleet.model_validate(fleet)
 
 
+async def create_many(
+    fleets_data: List[schemas.CreateFleet],
+    redis: "Redis",
+    db: "AsyncSession",
+    upsert: bool = False,
+) -> List[schemas.Fleet]:
+    fleets = await bulk.insert_many(
+        models.Fleet,
+        [fleet.model_dump() for fleet in fleets_data],
+        db,
+        upsert_on="phone_number" if upsert else None,
+    )
+    fleets = [schemas.Fleet.model_validate(fleet) for fleet in fleets]
+    await db.commit()
+    await cache.invalidate(
+        redis, "fleets", *(f"fleet_{fleet.id}" for fleet in fleets)
+    )
+    return fleets
+
+
+async def get_missing(
+    fleet_ids: Set[UUID],
+    db: "AsyncSession",
+) -> Set[UUID]:
+    found = await db.scalars(
+        select(models.Fleet.id).filter(models.Fleet.id.in_(fleet_ids))
+    )
+    return fleet_ids - set(found.all())
+
+
 async def get_all(
     redis: "Redis",
-    db: "Session",
-) -> List[models.Fleet]:
-    if (cached_profile := await redis.get("fleets")) is not None:
-        fleets = json.loads(cached_profile)
-        return fleets
-    else:
-        fleets = db.query(models.Fleet).all()
-        await redis.set("fleets", json.dumps(jsonable_encoder(fleets)), ex=300)
-        return fleets
+    db: "AsyncSession",
+    limit: int = pagination.DEFAULT_LIMIT,
+    cursor: str | None = None,
+    fleet_name: str | None = None,
+    phone_number: str | None = None,
+) -> pagination.Page:
+    filters = {"fleet_name": fleet_name, "phone_number": phone_number}
+    field = pagination.page_key(limit, cursor, **filters)
+
+    async def load() -> bytes:
+        statement = pagination.filter_by(select(models.Fleet), **filters)
+        fleets = (
+            await db.scalars(
+                pagination.paginate(statement, models.Fleet, limit, cursor)
+            )
+        ).all()
+        fleets, next_cursor = pagination.split_page(fleets, limit)
+        return await pagination.set_cached_page(
+            redis, "fleets", field, FLEETS.dump(fleets), next_cursor
+        )
+
+    cached_page = await cache.read_through(
+        redis,
+        "fleets",
+        fetch=lambda: redis.hget("fleets", field),
+        load=load,
+        field=field,
+    )
+    return pagination.parse_page(cached_page)
 
 
 async def get(
     fleet_id: UUID,
     redis: "Redis",
-    db: "Session",
-) -> models.Fleet | None:
-    if (cached_profile := await redis.get(f"fleet_{fleet_id}")) is not None:
-        fleet = json.loads(cached_profile)
-    else:
-        fleet = (
-            db.query(models.Fleet).filter(models.Fleet.id == fleet_id).first()
+    db: "AsyncSession",
+) -> cache.Entry | None:
+    async def load() -> bytes:
+        fleet = await db.scalar(
+            select(models.Fleet).filter(models.Fleet.id == fleet_id)
         )
-
-        await redis.set(
-            f"fleet_{fleet_id}", json.dumps(jsonable_encoder(fleet)), ex=300
+        return await cache.store(
+            redis,
+            f"fleet_{fleet_id}",
+            None if fleet is None else FLEET.dump_entry(fleet),
         )
-    return fleet
+
+    cached_profile = await cache.read_through(
+        redis,
+        f"fleet_{fleet_id}",
+        fetch=lambda: redis.get(f"fleet_{fleet_id}"),
+        load=load,
+    )
+    return cache.found(cached_profile)
 
 
 async def delete(
     fleet_id: UUID,
     redis: "Redis",
-    db: "Session",
-) -> None:
-    fleet = db.query(models.Fleet).filter(models.Fleet.id == fleet_id).first()
-    db.delete(fleet)
-    db.commit()
-    await redis.delete(f"fleet_{fleet_id}")
-    await redis.delete("fleets")
+    db: "AsyncSession",
+) -> bool:
+    # login accounts are never deleted as a side effect: they have to be
+    # deleted first, and the foreign key refuses it too
+    if await users.any_of_fleet(fleet_id, db):
+        raise FleetHasUsers(fleet_id)
+    # what the delete would cascade to is deleted first, to learn which
+    # cache keys it leaves behind
+    stale = await vehicles.delete_of_fleet(fleet_id, db)
+    try:
+        deleted = await db.scalar(
+            sql.delete(models.Fleet)
+            .filter(models.Fleet.id == fleet_id)
+            .returning(models.Fleet.id)
+        )
+    except IntegrityError as exc:
+        # a user joined the fleet since the check
+        await db.rollback()
+        raise FleetHasUsers(fleet_id) from exc
+    if deleted is None:
+        await db.rollback()
+        return False
+    await db.commit()
+    await cache.invalidate(redis, "fleets", f"fleet_{fleet_id}", *stale)
+    # its vehicles went with it
+    await positions.forget_fleet(fleet_id, redis)
+    return True
 
 
 async def update(
-    fleet_data,
     fleet_id: UUID,
+    changes: Dict[str, Any],
     redis: "Redis",
-    db: "Session",
-) -> schemas.Fleet:
-    fleet = db.query(models.Fleet).filter(models.Fleet.id == fleet_id).first()
-    if fleet is not None:
-        fleet.fleet_name = fleet_data.fleet_name
-        fleet.fleet_info = fleet_data.fleet_info
-        fleet.phone_number = fleet_data.phone_number
-    db.commit()
-    db.refresh(fleet)
-    await redis.delete(f"fleet_{fleet_id}")
-    await redis.delete("fleets")
-    return schemas.Fleet.model_validate(fleet)
+    db: "AsyncSession",
+    if_match: List[int] | None = None,
+) -> Tuple[schemas.Fleet, int] | None:
+    fleet = await versions.update_row(
+        models.Fleet, fleet_id, changes, db, if_match=if_match
+    )
+    if fleet is None:
+        return None
+    version = fleet.version
+    fleet = schemas.Fleet.model_validate(fleet)
+    await db.commit()
+    await cache.invalidate(redis, "fleets", f"fleet_{fleet_id}")
+    return fleet, version
@@ -0,0 +1,129 @@
+"""
+geometry.py
+route geometries as encoded polylines, their Douglas-Peucker
+simplification and their length, vectorized with numpy
+"""
+
+from typing import List, Sequence, Tuple
+
+import numpy as np
+
+# decimal places kept of each coordinate, about a metre at 5
+PRECISION = 5
+
+EARTH_RADIUS_M = 6_371_008.8
+
+# 5-bit chunks needed by the largest value a coordinate delta encodes to
+MAX_CHUNKS = 7
+
+Point = Tuple[float, float]
+
+
+def encode(points, precision: int = PRECISION) -> str:
+    """Encode (lat, lon) points in the polyline format maps SDKs read."""
+    points = np.asarray(points, dtype=np.float64).reshape(-1, 2)
+    if not len(points):
+        return ""
+    scaled = np.round(points * 10**precision).astype(np.int64)
+    deltas = np.diff(scaled, axis=0, prepend=0).ravel()
+    values = np.where(deltas < 0, ~(deltas << 1), deltas << 1)
+    chunks = (values[:, None] >> (5 * np.arange(MAX_CHUNKS))) & 0x1F
+    # every value takes chunks up to its highest set one, and at least one
+    used = MAX_CHUNKS - np.argmax(chunks[:, ::-1] != 0, axis=1)
+    used[values == 0] = 1
+    positions = np.arange(MAX_CHUNKS)
+    chunks |= np.where(positions < (used - 1)[:, None], 0x20, 0)
+    return (
+        (chunks[positions < used[:, None]] + 63)
+        .astype(np.uint8)
+        .tobytes()
+        .decode()
+    )
+
+
+def to_array(polyline: str, precision: int = PRECISION) -> np.ndarray:
+    """The (lat, lon) points of a polyline, as an (n, 2) array."""
+    chunks = np.frombuffer(polyline.encode(), dtype=np.uint8) - 63
+    if not len(chunks):
+        return np.empty((0, 2))
+    chunks = chunks.astype(np.int64)
+    starts = np.flatnonzero(np.r_[True, chunks[:-1] < 0x20])
+    sizes = np.diff(np.r_[starts, len(chunks)])
+    shifts = 5 * (np.arange(len(chunks)) - np.repeat(starts, sizes))
+    values = np.add.reduceat((chunks & 0x1F) << shifts, starts)
+    deltas = np.where(values & 1, ~(values >> 1), values >> 1)
+    return np.cumsum(deltas.reshape(-1, 2), axis=0) / 10**precision
+
+
+def decode(polyline: str, precision: int = PRECISION) -> List[Point]:
+    return [tuple(point) for point in to_array(polyline, precision).tolist()]
+
+
+def segment_lengths(points: np.ndarray) -> np.ndarray:
+    """Haversine length in metres of each segment of (lat, lon) points."""
+    lat, lon = np.radians(points).T
+    a = (
+        np.sin(np.diff(lat) / 2) ** 2
+        + np.cos(lat[:-1]) * np.cos(lat[1:]) * np.sin(np.diff(lon) / 2) ** 2
+    )
+    return 2 * EARTH_RADIUS_M * np.arcsin(np.sqrt(a))
+
+
+def lengths(routes: Sequence[np.ndarray]) -> np.ndarray:
+    """
+    Length in metres of each route, measured in one pass over the points
+    of all of them.
+    """
+    if not routes:
+        return np.empty(0)
+    sizes = np.array([len(points) for points in routes])
+    ends = np.cumsum(sizes)
+    # distance along all points chained together; the segments joining one
+    # route to the next fall outside every route's own span
+    travelled = np.r_[0.0, np.cumsum(segment_lengths(np.concatenate(routes)))]
+    starts = np.minimum(ends - sizes, len(travelled) - 1)
+    return np.where(
+        sizes > 1, travelled[np.maximum(ends - 1, 0)] - travelled[starts], 0.0
+    )
+
+
+def _project(points: np.ndarray) -> np.ndarray:
+    """Metres on a plane tangent at the first point, fine for a route."""
+    lat, lon = np.radians(points).T
+    return EARTH_RADIUS_M * np.column_stack((lon * np.cos(lat[0]), lat))
+
+
+def simplify(points: Sequence[Point], tolerance: float) -> List[Point]:
+    """
+    Douglas-Peucker: drop the points that lie within ``tolerance`` metres
+    of the line kept around them. Iterative, so long routes cannot hit the
+    recursion limit.
+    """
+    if len(points) < 3:
+        return list(points)
+    projected = _project(np.asarray(points, dtype=np.float64))
+    keep = np.zeros(len(points), dtype=bool)
+    keep[[0, -1]] = True
+    stack = [(0, len(points) - 1)]
+    while stack:
+        first, last = stack.pop()
+        if last - first < 2:
+            continue
+        start, end = projected[first], projected[last]
+        inner = projected[first + 1 : last] - start
+        segment = end - start
+        length = segment @ segment
+        # distance to the segment, clamped to its ends
+        t = np.clip(inner @ segment / length, 0, 1) if length else 0
+        offsets = np.hypot(*(inner - np.outer(t, segment)).T)
+        farthest = int(np.argmax(offsets))
+        if offsets[farthest] > tolerance:
+            farthest += first + 1
+            keep[farthest] = True
+            stack.append((first, farthest))
+            stack.append((farthest, last))
+    return [point for point, kept in zip(points, keep) if kept]
+
+
+def simplify_polyline(polyline: str, tolerance: float) -> str:
+    return encode(simplify(decode(polyline), tolerance))
@@ -0,0 +1,106 @@
+"""
+pagination.py
+keyset pagination on (date_created, id) shared by the list controllers
+"""
+
+import base64
+import datetime as dt
+from typing import Any, NamedTuple, Sequence, Tuple
+from uuid import UUID
+
+from sqlalchemy import Select, tuple_
+
+from app import cache
+
+DEFAULT_LIMIT = 100
+MAX_LIMIT = 1000
+
+NEXT_CURSOR_HEADER = "X-Next-Cursor"
+
+
+class Page(NamedTuple):
+    body: bytes
+    etag: str
+    next_cursor: str | None
+
+
+def encode_cursor(row) -> str:
+    raw = f"{row.date_created.isoformat()}|{row.id}"
+    return base64.urlsafe_b64encode(raw.encode()).decode()
+
+
+def decode_cursor(cursor: str) -> Tuple[dt.datetime, UUID]:
+    try:
+        raw = base64.urlsafe_b64decode(cursor.encode()).decode()
+        date_created, row_id = raw.split("|")
+        return dt.datetime.fromisoformat(date_created), UUID(row_id)
+    except Exception as exc:
+        raise ValueError(f"Invalid cursor {cursor!r}") from exc
+
+
+def paginate(
+    statement: Select, model, limit: int, cursor: str | None
+) -> Select:
+    """Order by the keyset and fetch one extra row to detect a next page."""
+    if cursor is not None:
+        date_created, row_id = decode_cursor(cursor)
+        statement = statement.filter(
+            tuple_(model.date_created, model.id) > tuple_(date_created, row_id)
+        )
+    return statement.order_by(model.date_created, model.id).limit(limit + 1)
+
+
+def split_page(
+    rows: Sequence[Any], limit: int
+) -> Tuple[Sequence[Any], str | None]:
+    if len(rows) > limit:
+        return rows[:limit], encode_cursor(rows[limit - 1])
+    return rows, None
+
+
+def page_key(limit: int, cursor: str | None, **filters) -> str:
+    """Hash field of one page inside the list's cache key."""
+    parts = [str(limit), cursor or ""]
+    parts.extend(
+        f"{name}={value}"
+        for name, value in sorted(filters.items())
+        if value is not None
+    )
+    return ":".join(parts)
+
+
+def filter_by(statement: Select, **filters) -> Select:
+    return statement.filter_by(
+        **{name: value for name, value in filters.items() if value is not None}
+    )
+
+
+def parse_page(cached_page: bytes) -> Page:
+    next_cursor, _, entry = cached_page.partition(b"\n")
+    body, etag = cache.unpack(entry)
+    return Page(body, etag, next_cursor.decode() or None)
+
+
+async def set_cached_page(
+    redis,
+    key: str,
+    field: str,
+    body: bytes,
+    next_cursor: str | None,
+    ex: int = 300,
+) -> bytes:
+    """
+    Store a page as one field of the list's hash, so deleting the list key
+    drops every cached page at once. The entry is the next cursor, the ETag
+    and the response body separated by newlines, which none of them but the
+    body contains. Every page expires ``ex`` seconds after the first one.
+    """
+    cached_page = (next_cursor or "").encode() + b"\n"
+    cached_page += cache.pack(cache.content_etag(body), body)
+    pipe = redis.pipeline(transaction=False)
+    pipe.hset(key, field, cached_page)
+    # only a new hash gets a ttl: renewing it on every page write would keep
+    # the first pages of a busy list alive indefinitely (NX needs redis 7)
+    pipe.execute_command("EXPIRE", key, ex, "NX")
+    await pipe.execute()
+    return cached_page
@@ -0,0 +1,272 @@
+"""
+positions.py
+last known position of every vehicle, kept in redis GEO sets by the
+telemetry flusher, for nearest-vehicle and bounding-box searches
+"""
+
+import math
+from typing import TYPE_CHECKING, Dict, Iterable, List, Sequence, Tuple
+from uuid import UUID
+
+from sqlalchemy import select
+
+from app import models, schemas
+
+if TYPE_CHECKING:
+    from aioredis import Redis
+    from sqlalchemy.ext.asyncio import AsyncSession
+
+# every vehicle, and the vehicles of each fleet, so owner filters are a
+# search of a smaller set rather than a filter over the results
+POSITIONS = "vehicle_positions"
+# fleet a vehicle was indexed under, to move or drop it later
+OWNERS = "vehicle_position_owners"
+# timestamp of each indexed position, so late points cannot replace it
+TIMES = "vehicle_position_times"
+
+# vehicles moved by one script call, which blocks redis while it runs
+INDEX_BATCH = 1000
+
+# KEYS: POSITIONS, OWNERS, TIMES, then the fleet key of each vehicle;
+# ARGV: vehicle id, owner id, timestamp, lon and lat of each vehicle.
+# A position older than the indexed one is skipped, as when a device
+# reconnects with buffered points or a batch is flushed late.
+_MOVE_IF_NEWER = """
+local moved = 0
+for i = 0, #ARGV / 5 - 1 do
+    local vehicle, owner, ts, lon, lat = unpack(ARGV, i * 5 + 1, i * 5 + 5)
+    local indexed = redis.call("hget", KEYS[3], vehicle)
+    if not indexed or tonumber(indexed) < tonumber(ts) then
+        redis.call("geoadd", KEYS[1], lon, lat, vehicle)
+        redis.call("geoadd", KEYS[4 + i], lon, lat, vehicle)
+        redis.call("hset", KEYS[2], vehicle, owner)
+        redis.call("hset", KEYS[3], vehicle, ts)
+        moved = moved + 1
+    end
+end
+return moved
+"""
+
+# redis GEO cannot index the poles
+MAX_LATITUDE = 85.05112878
+
+EARTH_RADIUS_KM = 6372.7976
+
+
+def fleet_key(owner_id) -> str:
+    return f"vehicle_positions_in_fleet_{owner_id}"
+
+
+def _latest(
+    records: Iterable[Tuple],
+) -> Dict[UUID, Tuple[float, float, float]]:
+    """(timestamp, lon, lat) of the newest point of each vehicle."""
+    latest: Dict[UUID, Tuple] = {}
+    for vehicle_id, ts, lat, lon, *_ in records:
+        if abs(lat) > MAX_LATITUDE:
+            continue
+        if vehicle_id not in latest or ts >= latest[vehicle_id][0]:
+            latest[vehicle_id] = (ts, lon, lat)
+    return {
+        vehicle_id: (ts.timestamp(), lon, lat)
+        for vehicle_id, (ts, lon, lat) in latest.items()
+    }
+
+
+async def index(
+    records: Sequence[Tuple], redis: "Redis", db: "AsyncSession"
+) -> int:
+    """
+    Move the vehicles of a telemetry batch to their latest position, unless
+    a newer one is indexed already. Returns how many vehicles moved.
+    """
+    latest = _latest(records)
+    if not latest:
+        return 0
+    # points of unknown vehicles are stored but never indexed
+    owners = (
+        await db.execute(
+            select(models.Vehicle.id, models.Vehicle.owner_id).filter(
+                models.Vehicle.id.in_(latest)
+            )
+        )
+    ).all()
+
+    moved = 0
+    for start in range(0, len(owners), INDEX_BATCH):
+        batch = owners[start : start + INDEX_BATCH]
+        places = []
+        for vehicle_id, owner_id in batch:
+            places.extend(
+                (str(vehicle_id), str(owner_id), *latest[vehicle_id])
+            )
+        moved += await redis.eval(
+            _MOVE_IF_NEWER,
+            3 + len(batch),
+            POSITIONS,
+            OWNERS,
+            TIMES,
+            *(fleet_key(owner_id) for _, owner_id in batch),
+            *places,
+        )
+    return moved
+
+
+async def reassign(
+    vehicles: Sequence[schemas.Vehicle], redis: "Redis"
+) -> None:
+    """Move indexed ``vehicles`` whose fleet changed to their new fleet."""
+    if not vehicles:
+        return
+    vehicle_ids = [str(vehicle.id) for vehicle in vehicles]
+    previous_owners = await redis.hmget(OWNERS, vehicle_ids)
+    moved = [
+        (vehicle_id, previous_owner.decode(), str(vehicle.owner_id))
+        for vehicle_id, previous_owner, vehicle in zip(
+            vehicle_ids, previous_owners, vehicles
+        )
+        if previous_owner is not None
+        and previous_owner.decode() != str(vehicle.owner_id)
+    ]
+    if not moved:
+        return
+    coordinates = await redis.geopos(POSITIONS, *(m[0] for m in moved))
+    pipe = redis.pipeline(transaction=False)
+    for (vehicle_id, previous_owner, owner_id), lon_lat in zip(
+        moved, coordinates
+    ):
+        pipe.zrem(fleet_key(previous_owner), vehicle_id)
+        if lon_lat is not None:
+            pipe.geoadd(fleet_key(owner_id), *lon_lat, vehicle_id)
+        pipe.hset(OWNERS, vehicle_id, owner_id)
+    await pipe.execute()
+
+
+async def forget(vehicle_ids: Sequence, redis: "Redis") -> None:
+    """Drop deleted vehicles from the index."""
+    vehicle_ids = [str(vehicle_id) for vehicle_id in vehicle_ids]
+    if not vehicle_ids:
+        return
+    owners = await redis.hmget(OWNERS, vehicle_ids)
+    pipe = redis.pipeline(transaction=False)
+    pipe.zrem(POSITIONS, *vehicle_ids)
+    for vehicle_id, owner_id in zip(vehicle_ids, owners):
+        if owner_id is not None:
+            pipe.zrem(fleet_key(owner_id.decode()), vehicle_id)
+    pipe.hdel(OWNERS, *vehicle_ids)
+    pipe.hdel(TIMES, *vehicle_ids)
+    await pipe.execute()
+
+
+async def forget_fleet(fleet_id: UUID, redis: "Redis") -> None:
+    """Drop the vehicles of a deleted fleet from the index."""
+    vehicle_ids = await redis.zrange(fleet_key(fleet_id), 0, -1)
+    pipe = redis.pipeline(transaction=False)
+    if vehicle_ids:
+        pipe.zrem(POSITIONS, *vehicle_ids)
+        pipe.hdel(OWNERS, *vehicle_ids)
+        pipe.hdel(TIMES, *vehicle_ids)
+    pipe.unlink(fleet_key(fleet_id))
+    await pipe.execute()
+
+
+def distance_km(lon1: float, lat1: float, lon2: float, lat2: float) -> float:
+    """Great-circle distance, by the haversine formula redis uses."""
+    lon1, lat1, lon2, lat2 = map(math.radians, (lon1, lat1, lon2, lat2))
+    a = (
+        math.sin((lat2 - lat1) / 2) ** 2
+        + math.cos(lat1) * math.cos(lat2) * math.sin((lon2 - lon1) / 2) ** 2
+    )
+    return 2 * EARTH_RADIUS_KM * math.asin(math.sqrt(a))
+
+
+async def _search(
+    redis: "Redis",
+    owner_id: UUID | None,
+    lon: float,
+    lat: float,
+    radius_km: float,
+    limit: int | None,
+) -> List[schemas.VehiclePosition]:
+    found = await redis.georadius(
+        POSITIONS if owner_id is None else fleet_key(owner_id),
+        lon,
+        lat,
+        radius_km,
+        unit="km",
+        withdist=True,
+        withcoord=True,
+        count=limit,
+        sort="ASC",
+    )
+    return [
+        schemas.VehiclePosition(
+            vehicle_id=vehicle_id.decode(),
+            lon=found_lon,
+            lat=found_lat,
+            distance_km=distance,
+        )
+        for vehicle_id, distance, (found_lon, found_lat) in found
+    ]
+
+
+async def nearby(
+    lon: float,
+    lat: float,
+    radius_km: float,
+    redis: "Redis",
+    owner_id: UUID | None = None,
+    limit: int = 50,
+) -> List[schemas.VehiclePosition]:
+    """Vehicles within ``radius_km`` of a point, nearest first."""
+    return await _search(redis, owner_id, lon, lat, radius_km, limit)
+
+
+def _inside(
+    position: schemas.VehiclePosition,
+    min_lon: float,
+    min_lat: float,
+    max_lon: float,
+    max_lat: float,
+) -> bool:
+    return (
+        min_lon <= position.lon <= max_lon
+        and min_lat <= position.lat <= max_lat
+    )
+
+
+async def within_bbox(
+    min_lon: float,
+    min_lat: float,
+    max_lon: float,
+    max_lat: float,
+    redis: "Redis",
+    owner_id: UUID | None = None,
+    limit: int = 50,
+) -> List[schemas.VehiclePosition]:
+    """Vehicles inside a lon/lat box, nearest its centre first."""
+    lon = (min_lon + max_lon) / 2
+    lat = (min_lat + max_lat) / 2
+    # the circle through the farthest corner holds the whole box; what
+    # it takes from outside the box is filtered out
+    radius_km = max(
+        distance_km(lon, lat, corner_lon, corner_lat)
+        for corner_lon in (min_lon, max_lon)
+        for corner_lat in (min_lat, max_lat)
+    )
+
+    positions = await _search(redis, owner_id, lon, lat, radius_km, limit)
+    inside = [
+        position
+        for position in positions
+        if _inside(position, min_lon, min_lat, max_lon, max_lat)
+    ]
+    if len(inside) < limit and len(positions) == limit:
+        # places outside the box took part of the first page; take them all
+        positions = await _search(redis, owner_id, lon, lat, radius_km, None)
+        inside = [
+            position
+            for position in positions
+            if _inside(position, min_lon, min_lat, max_lon, max_lat)
+        ][:limit]
+    return inside
@@ -1,14 +1,81 @@
-import json
-from typing import TYPE_CHECKING, List
+from typing import TYPE_CHECKING, Any, AsyncIterator, Dict, List, Set, Tuple
 from uuid import UUID
 
-from fastapi.encoders import jsonable_encoder
+import numpy as np
+import orjson
+import sqlalchemy as sql
+from sqlalchemy import literal, select, union_all
+from sqlalchemy.orm import undefer
 
-from app import models, schemas
+from app import cache, models, schemas
+from app.config import settings
+from app.ctrl import (
+    bulk,
+    export,
+    geometry,
+    pagination,
+    schedule,
+    versions,
+)
 
 if TYPE_CHECKING:
     from aioredis import Redis
-    from sqlalchemy.orm import Session
+    from sqlalchemy.ext.asyncio import AsyncSession
+
+ROUTE = cache.Codec(schemas.RouteWithGeometry)
+ROUTES = cache.Codec(List[schemas.Route])
+ROUTES_WITH_GEOMETRY = cache.Codec(List[schemas.RouteWithGeometry])
+
+SCHEDULE_FIELDS = {"starts_at", "ends_at"}
+
+
+def _duration(distance_m: np.ndarray) -> np.ndarray:
+    return distance_m / (settings.route_average_speed_kmh / 3.6)
+
+
+def _measured(rows: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """
+    Encode the geometry written by each of ``rows`` and set the distance
+    and duration of the stored polyline, measuring all of them at once.
+    """
+    written = [row for row in rows if "geometry" in row]
+    for row in written:
+        row["distance_m"] = row["duration_s"] = None
+    written = [row for row in written if row["geometry"] is not None]
+    for row in written:
+        row["geometry"] = geometry.encode(row["geometry"])
+    distances = geometry.lengths(
+        [geometry.to_array(row["geometry"]) for row in written]
+    )
+    for row, distance, duration in zip(
+        written, distances.tolist(), _duration(distances).tolist()
+    ):
+        row["distance_m"], row["duration_s"] = distance, duration
+    return rows
+
+
+def _select_routes(with_geometry: bool):
+    statement = select(models.Route)
+    if with_geometry:
+        statement = statement.options(undefer(models.Route.geometry))
+    return statement
+
+
+def simplified(cached, tolerance: float | None):
+    """
+    A cached route or page of routes with every geometry simplified to
+    ``tolerance`` metres, and the ETag of the new body.
+    """
+    if tolerance is None:
+        return cached
+    routes = orjson.loads(cached.body)
+    for route in routes if isinstance(routes, list) else [routes]:
+        if route.get("geometry"):
+            route["geometry"] = geometry.simplify_polyline(
+                route["geometry"], tolerance
+            )
+    body = orjson.dumps(routes)
+    return cached._replace(body=body, etag=cache.content_etag(body))
 
 
 async def create(
@@ -16,78 +83,434 @@ async def create(
     driver_id,
     vehicle_id,
     redis: "Redis",
-    db: "Session",
+    db: "AsyncSession",
 ) -> schemas.Route:
-    route = models.Route(**route.model_dump())
+    if route.starts_at is not None:
+        await schedule.check(
+            [
+                schemas.RouteAssignment(
+                    driver_id=driver_id,
+                    vehicle_id=vehicle_id,
+                    starts_at=route.starts_at,
+                    ends_at=route.ends_at,
+                )
+            ],
+            db,
+        )
+    route = models.Route(**_measured([route.model_dump()])[0])
     route.driver_id = driver_id
     route.vehicle_id = vehicle_id
     db.add(route)
-    db.commit()
-    db.refresh(route)
-    await redis.delete("routes")
+    await db.commit()
+    await db.refresh(route)
+    await cache.invalidate(
+        redis,
+        "routes",
+        f"route_{route.id}",
+        f"routes_of_driver_{driver_id}",
+        f"routes_of_vehicle_{vehicle_id}",
+    )
     return schemas.Route.model_validate(route)
 
 
+async def create_many(
+    routes_data: List[schemas.BulkRoute],
+    redis: "Redis",
+    db: "AsyncSession",
+) -> List[schemas.Route]:
+    # the whole batch is checked at once, against itself and stored routes
+    await schedule.check(
+        [
+            schemas.RouteAssignment(
+                driver_id=route.driver_id,
+                vehicle_id=route.vehicle_id,
+                starts_at=route.starts_at,
+                ends_at=route.ends_at,
+            )
+            for route in routes_data
+            if route.starts_at is not None
+        ],
+        db,
+    )
+    routes = await bulk.insert_many(
+        models.Route,
+        _measured([route.model_dump() for route in routes_data]),
+        db,
+    )
+    routes = [schemas.Route.model_validate(route) for route in routes]
+    await db.commit()
+    await cache.invalidate(
+        redis,
+        "routes",
+        *(f"route_{route.id}" for route in routes),
+        *{f"routes_of_driver_{route.driver_id}" for route in routes},
+        *{f"routes_of_vehicle_{route.vehicle_id}" for route in routes},
+    )
+    return routes
+
+
+async def get_missing_parents(
+    driver_ids: Set[UUID],
+    vehicle_ids: Set[UUID],
+    db: "AsyncSession",
+) -> Tuple[Set[UUID], Set[UUID]]:
+    """Return the driver and vehicle ids that do not exist, in one query."""
+    found = await db.execute(
+        union_all(
+            select(literal("driver"), models.Driver.id).filter(
+                models.Driver.id.in_(driver_ids)
+            ),
+            select(literal("vehicle"), models.Vehicle.id).filter(
+                models.Vehicle.id.in_(vehicle_ids)
+            ),
+        )
+    )
+    found_ids = {"driver": set(), "vehicle": set()}
+    for parent, parent_id in found.all():
+        found_ids[parent].add(parent_id)
+    return driver_ids - found_ids["driver"], vehicle_ids - found_ids["vehicle"]
+
+
 async def get_all(
     redis: "Redis",
-    db: "Session",
-) -> List[models.Route]:
-    if (cached_profile := await redis.get("routes")) is not None:
-        routes = json.loads(cached_profile)
-        return routes
-    else:
-        routes = db.query(models.Route).all()
-        await redis.set(
-            "routes",
-            json.dumps(jsonable_encoder(routes)),
-            ex=300,
+    db: "AsyncSession",
+    limit: int = pagination.DEFAULT_LIMIT,
+    cursor: str | None = None,
+    route_name: str | None = None,
+    with_geometry: bool = False,
+    min_distance_m: float | None = None,
+    max_distance_m: float | None = None,
+) -> pagination.Page:
+    filters = {"route_name": route_name}
+    field = pagination.page_key(
+        limit,
+        cursor,
+        geometry=with_geometry or None,
+        min_distance_m=min_distance_m,
+        max_distance_m=max_distance_m,
+        **filters,
+    )
+    codec = ROUTES_WITH_GEOMETRY if with_geometry else ROUTES
+
+    async def load() -> bytes:
+        statement = pagination.filter_by(
+            _select_routes(with_geometry), **filters
+        )
+        if min_distance_m is not None:
+            statement = statement.filter(
+                models.Route.distance_m >= min_distance_m
+            )
+        if max_distance_m is not None:
+            statement = statement.filter(
+                models.Route.distance_m <= max_distance_m
+            )
+        routes = (
+            await db.scalars(
+                pagination.paginate(statement, models.Route, limit, cursor)
+            )
+        ).all()
+        routes, next_cursor = pagination.split_page(routes, limit)
+        return await pagination.set_cached_page(
+            redis, "routes", field, codec.dump(routes), next_cursor
+        )
+
+    cached_page = await cache.read_through(
+        redis,
+        "routes",
+        fetch=lambda: redis.hget("routes", field),
+        load=load,
+        field=field,
+    )
+    return pagination.parse_page(cached_page)
+
+
+async def _get_all_of(
+    column,
+    key: str,
+    parent_id: UUID,
+    redis: "Redis",
+    db: "AsyncSession",
+    limit: int,
+    cursor: str | None,
+    with_geometry: bool,
+) -> pagination.Page:
+    """Page of the routes whose ``column`` is ``parent_id``."""
+    field = pagination.page_key(limit, cursor, geometry=with_geometry or None)
+    codec = ROUTES_WITH_GEOMETRY if with_geometry else ROUTES
+
+    async def load() -> bytes:
+        statement = _select_routes(with_geometry).filter(column == parent_id)
+        routes = (
+            await db.scalars(
+                pagination.paginate(statement, models.Route, limit, cursor)
+            )
+        ).all()
+        routes, next_cursor = pagination.split_page(routes, limit)
+        return await pagination.set_cached_page(
+            redis, key, field, codec.dump(routes), next_cursor
         )
-        return routes
+
+    cached_page = await cache.read_through(
+        redis,
+        key,
+        fetch=lambda: redis.hget(key, field),
+        load=load,
+        field=field,
+    )
+    return pagination.parse_page(cached_page)
+
+
+async def get_all_routes_of_driver(
+    driver_id: UUID,
+    redis: "Redis",
+    db: "AsyncSession",
+    limit: int = pagination.DEFAULT_LIMIT,
+    cursor: str | None = None,
+    with_geometry: bool = False,
+) -> pagination.Page:
+    return await _get_all_of(
+        models.Route.driver_id,
+        f"routes_of_driver_{driver_id}",
+        driver_id,
+        redis,
+        db,
+        limit,
+        cursor,
+        with_geometry,
+    )
+
+
+async def get_all_routes_of_vehicle(
+    vehicle_id: UUID,
+    redis: "Redis",
+    db: "AsyncSession",
+    limit: int = pagination.DEFAULT_LIMIT,
+    cursor: str | None = None,
+    with_geometry: bool = False,
+) -> pagination.Page:
+    return await _get_all_of(
+        models.Route.vehicle_id,
+        f"routes_of_vehicle_{vehicle_id}",
+        vehicle_id,
+        redis,
+        db,
+        limit,
+        cursor,
+        with_geometry,
+    )
+
+
+def export_all(
+    export_format: export.ExportFormat,
+    db: "AsyncSession",
+) -> AsyncIterator[bytes]:
+    statement = select(models.Route).order_by(
+        models.Route.date_created, models.Route.id
+    )
+    return export.stream(statement, schemas.Route, export_format, db)
 
 
 async def get(
     route_id: UUID,
     redis: "Redis",
-    db: "Session",
-) -> models.Route | None:
-    if (cached_profile := await redis.get(f"route_{route_id}")) is not None:
-        route = json.loads(cached_profile)
-    else:
-        route = (
-            db.query(models.Route).filter(models.Route.id == route_id).first()
+    db: "AsyncSession",
+) -> cache.Entry | None:
+    async def load() -> bytes:
+        route = await db.scalar(
+            _select_routes(with_geometry=True).filter(
+                models.Route.id == route_id
+            )
         )
-        await redis.set(
+        return await cache.store(
+            redis,
             f"route_{route_id}",
-            json.dumps(jsonable_encoder(route)),
-            ex=300,
+            None if route is None else ROUTE.dump_entry(route),
+        )
+
+    cached_profile = await cache.read_through(
+        redis,
+        f"route_{route_id}",
+        fetch=lambda: redis.get(f"route_{route_id}"),
+        load=load,
+    )
+    return cache.found(cached_profile)
+
+
+async def delete_where(condition, db: "AsyncSession") -> List[str]:
+    """
+    Delete the routes matching ``condition`` ahead of the parent whose
+    delete would cascade to them, and return the cache keys they were in.
+    """
+    deleted = (
+        await db.execute(
+            sql.delete(models.Route)
+            .filter(condition)
+            .returning(
+                models.Route.id,
+                models.Route.driver_id,
+                models.Route.vehicle_id,
+            )
         )
-    return route
+    ).all()
+    if not deleted:
+        return []
+    return [
+        "routes",
+        *(f"route_{route.id}" for route in deleted),
+        *{f"routes_of_driver_{route.driver_id}" for route in deleted},
+        *{f"routes_of_vehicle_{route.vehicle_id}" for route in deleted},
+    ]
 
 
 async def delete(
     route_id: UUID,
     redis: "Redis",
-    db: "Session",
-) -> None:
-    route = db.query(models.Route).filter(models.Route.id == route_id).first()
-    db.delete(route)
-    db.commit()
-    await redis.delete(f"route_{route_id}")
-    await redis.delete("routes")
+    db: "AsyncSession",
+) -> bool:
+    parents = (
+        await db.execute(
+            sql.delete(models.Route)
+            .filter(models.Route.id == route_id)
+            .returning(models.Route.driver_id, models.Route.vehicle_id)
+        )
+    ).first()
+    if parents is None:
+        return False
+    await db.commit()
+    await cache.invalidate(
+        redis,
+        "routes",
+        f"route_{route_id}",
+        f"routes_of_driver_{parents.driver_id}",
+        f"routes_of_vehicle_{parents.vehicle_id}",
+    )
+    return True
 
 
 async def update(
-    route_data,
     route_id: UUID,
+    changes: Dict[str, Any],
     redis: "Redis",
-    db: "Session",
-) -> schemas.Route:
-    route = db.query(models.Route).filter(models.Route.id == route_id).first()
-    if route is not None:
-        route.route_name = route_data.route_name
-        route.route_info = route_data.route_info
-    db.commit()
-    db.refresh(route)
-    await redis.delete(f"route_{route_id}")
-    await redis.delete("routes")
-    return schemas.Route.model_validate(route)
+    db: "AsyncSession",
+    if_match: List[int] | None = None,
+) -> Tuple[schemas.Route, int] | None:
+    if SCHEDULE_FIELDS & changes.keys():
+        # checked before the UPDATE, as create does, on the window the route
+        # would have; the row stays locked until the commit
+        statement = (
+            select(
+                models.Route.driver_id,
+                models.Route.vehicle_id,
+                models.Route.starts_at,
+                models.Route.ends_at,
+            )
+            .filter(models.Route.id == route_id)
+            .with_for_update()
+        )
+        if if_match is not None:
+            statement = statement.filter(models.Route.version.in_(if_match))
+        stored = (await db.execute(statement)).one_or_none()
+        if stored is None:
+            return None
+        window = {
+            field: changes.get(field, getattr(stored, field))
+            for field in SCHEDULE_FIELDS
+        }
+        if window["starts_at"] is not None:
+            try:
+                await schedule.check(
+                    [
+                        schemas.RouteAssignment(
+                            route_id=route_id,
+                            driver_id=stored.driver_id,
+                            vehicle_id=stored.vehicle_id,
+                            **window,
+                        )
+                    ],
+                    db,
+                )
+            except schedule.ScheduleConflict:
+                await db.rollback()
+                raise
+    route = await versions.update_row(
+        models.Route,
+        route_id,
+        _measured([changes])[0],
+        db,
+        if_match=if_match,
+    )
+    if route is None:
+        return None
+    version = route.version
+    route = schemas.Route.model_validate(route)
+    await db.commit()
+    await cache.invalidate(
+        redis,
+        "routes",
+        f"route_{route_id}",
+        f"routes_of_driver_{route.driver_id}",
+        f"routes_of_vehicle_{route.vehicle_id}",
+    )
+    return route, version
+
+
+async def measure_all(
+    redis: "Redis", db: "AsyncSession", batch_size: int = 1000
+) -> int:
+    """
+    Recompute the distance and duration of every route with a geometry,
+    ``batch_size`` routes at a time, e.g. after route_average_speed_kmh
+    changed. Returns how many routes were measured.
+    """
+    routes_table = models.Route.__table__
+    measure = (
+        sql.update(routes_table)
+        .where(routes_table.c.id == sql.bindparam("route_id"))
+        .values(
+            distance_m=sql.bindparam("distance"),
+            duration_s=sql.bindparam("duration"),
+            version=routes_table.c.version + 1,
+        )
+    )
+    measured = 0
+    last_id = None
+    while True:
+        statement = (
+            select(
+                models.Route.id,
+                models.Route.geometry,
+                models.Route.driver_id,
+                models.Route.vehicle_id,
+            )
+            .filter(models.Route.geometry.is_not(None))
+            .order_by(models.Route.id)
+            .limit(batch_size)
+        )
+        if last_id is not None:
+            statement = statement.filter(models.Route.id > last_id)
+        batch = (await db.execute(statement)).all()
+        if not batch:
+            return measured
+
+        distances = geometry.lengths(
+            [geometry.to_array(route.geometry) for route in batch]
+        )
+        await db.execute(
+            measure,
+            [
+                {"route_id": route.id, "distance": distance, "duration": eta}
+                for route, distance, eta in zip(
+                    batch, distances.tolist(), _duration(distances).tolist()
+                )
+            ],
+        )
+        await db.commit()
+        await cache.invalidate(
+            redis,
+            "routes",
+            *(f"route_{route.id}" for route in batch),
+            *{f"routes_of_driver_{route.driver_id}" for route in batch},
+            *{f"routes_of_vehicle_{route.vehicle_id}" for route in batch},
+        )
+        measured += len(batch)
+        last_id = batch[-1].id
@@ -0,0 +1,172 @@
+"""
+schedule.py
+find drivers and vehicles booked on overlapping routes, sweeping each one's
+time windows in start order instead of comparing every pair
+"""
+
+import heapq
+import itertools
+from collections import defaultdict
+from typing import TYPE_CHECKING, Dict, Iterator, List, Sequence, Tuple
+from uuid import UUID
+
+from sqlalchemy import ARRAY, BindParameter, any_, bindparam, select
+from sqlalchemy.dialects.postgresql import UUID as PG_UUID
+
+from app import models, schemas
+
+if TYPE_CHECKING:
+    from sqlalchemy.ext.asyncio import AsyncSession
+
+# assignments one validation request may hold
+MAX_ASSIGNMENTS = 100_000
+
+# SQLSTATE of an exclusion constraint violation
+EXCLUSION_VIOLATION = "23P01"
+
+
+class ScheduleConflict(Exception):
+    def __init__(self, conflicts: List[schemas.RouteConflict]):
+        super().__init__(f"{len(conflicts)} scheduling conflicts")
+        self.conflicts = conflicts
+
+
+def is_exclusion_violation(exc: Exception) -> bool:
+    """
+    Whether an IntegrityError comes from the exclusion constraints, which
+    catch what the checks below miss when two writes race.
+    """
+    return getattr(exc.orig, "pgcode", None) == EXCLUSION_VIOLATION
+
+
+# a time window, as timestamps that compare much faster than aware
+# datetimes, and who booked it: an index into the checked assignments, or
+# the id of a stored route
+Booking = Tuple[float, float, int, int | UUID]
+
+
+def _overlaps(bookings: List[Booking]) -> Iterator[Tuple]:
+    """
+    Pairs of overlapping [start, end) windows of one driver or vehicle.
+    Sorted by start, a window overlaps exactly the earlier ones that have
+    not ended yet, which a heap ordered by end time keeps at hand.
+    """
+    # the order number breaks ties, so owners are never compared
+    bookings.sort()
+    running: list = []
+    for start, end, order, owner in bookings:
+        while running and running[0][0] <= start:
+            heapq.heappop(running)
+        for _, _, other in running:
+            yield other, owner
+        heapq.heappush(running, (end, order, owner))
+
+
+def _uuid_array(name: str, values) -> BindParameter:
+    # one array parameter, however many ids the batch names
+    return bindparam(name, list(values), type_=ARRAY(PG_UUID(as_uuid=True)))
+
+
+async def _stored_bookings(
+    assignments: Sequence[schemas.RouteAssignment], db: "AsyncSession"
+):
+    """Stored routes that may clash with ``assignments``."""
+    statement = (
+        select(
+            models.Route.id,
+            models.Route.driver_id,
+            models.Route.vehicle_id,
+            models.Route.starts_at,
+            models.Route.ends_at,
+        )
+        .filter(
+            (
+                models.Route.driver_id
+                == any_(
+                    _uuid_array(
+                        "driver_ids", {a.driver_id for a in assignments}
+                    )
+                )
+            )
+            | (
+                models.Route.vehicle_id
+                == any_(
+                    _uuid_array(
+                        "vehicle_ids", {a.vehicle_id for a in assignments}
+                    )
+                )
+            )
+        )
+        .filter(
+            models.Route.starts_at < max(a.ends_at for a in assignments),
+            models.Route.ends_at > min(a.starts_at for a in assignments),
+        )
+    )
+    rescheduled = {a.route_id for a in assignments} - {None}
+    if rescheduled:
+        statement = statement.filter(
+            models.Route.id != any_(_uuid_array("route_ids", rescheduled))
+        )
+    return (await db.execute(statement)).all()
+
+
+async def find_conflicts(
+    assignments: Sequence[schemas.RouteAssignment], db: "AsyncSession"
+) -> List[schemas.RouteConflict]:
+    """
+    Every pair of ``assignments``, or of an assignment and a stored route,
+    booking the same driver or vehicle at the same time.
+    """
+    if not assignments:
+        return []
+    bookings: Dict[Tuple[str, UUID], List[Booking]] = defaultdict(list)
+    order = itertools.count()
+
+    def book(driver_id, vehicle_id, starts_at, ends_at, owner) -> None:
+        window = (starts_at.timestamp(), ends_at.timestamp())
+        for resource in (("driver", driver_id), ("vehicle", vehicle_id)):
+            bookings[resource].append((*window, next(order), owner))
+
+    for index, assignment in enumerate(assignments):
+        book(
+            assignment.driver_id,
+            assignment.vehicle_id,
+            assignment.starts_at,
+            assignment.ends_at,
+            index,
+        )
+    for route in await _stored_bookings(assignments, db):
+        book(
+            route.driver_id,
+            route.vehicle_id,
+            route.starts_at,
+            route.ends_at,
+            route.id,
+        )
+
+    conflicts = []
+    for (resource, resource_id), resource_bookings in bookings.items():
+        for first, second in _overlaps(resource_bookings):
+            # stored routes that already overlapped are not news
+            if isinstance(first, UUID) and isinstance(second, UUID):
+                continue
+            if isinstance(first, UUID):
+                first, second = second, first
+            conflicts.append(
+                schemas.RouteConflict(
+                    resource=resource,
+                    resource_id=resource_id,
+                    assignment=first,
+                    conflicts_with=second,
+                )
+            )
+    return conflicts
+
+
+async def check(
+    assignments: Sequence[schemas.RouteAssignment], db: "AsyncSession"
+) -> None:
+    """Raise ScheduleConflict if ``assignments`` double-book anyone."""
+    conflicts = await find_conflicts(assignments, db)
+    if conflicts:
+        raise ScheduleConflict(conflicts)
@@ -0,0 +1,314 @@
+"""
+telemetry.py
+per-worker buffer of vehicle positions, flushed to the db with COPY
+"""
+
+import asyncio
+import csv
+import datetime as dt
+import io
+import logging
+import time
+from contextlib import suppress
+from typing import (
+    TYPE_CHECKING,
+    AsyncContextManager,
+    Callable,
+    List,
+    Sequence,
+    Tuple,
+)
+
+from sqlalchemy import Engine
+from sqlalchemy.ext.asyncio import AsyncEngine
+from starlette.concurrency import run_in_threadpool
+
+from app import schemas
+from app.config import settings
+from app.ctrl import positions
+from app.dependencies.redis import cache as get_redis
+
+if TYPE_CHECKING:
+    from sqlalchemy.ext.asyncio import AsyncSession
+
+logger = logging.getLogger(__name__)
+
+# points accepted by one request or websocket message
+MAX_BATCH = 10_000
+
+COLUMNS = ("vehicle_id", "ts", "lat", "lon", "speed", "heading")
+
+# how often the flusher creates the partitions of the coming days
+PARTITION_CHECK_INTERVAL = 3600
+
+Record = Tuple
+
+# sessions for the position index, opened like app.database.session
+SessionFactory = Callable[[], AsyncContextManager["AsyncSession"]]
+
+
+class BufferFull(Exception):
+    pass
+
+
+class TelemetryBuffer:
+    """
+    Bounded list of records waiting to be copied. Writers wait while it is
+    full, which is the backpressure felt by clients once the db falls
+    behind; the flusher takes everything buffered at once.
+    """
+
+    def __init__(self, max_points: int):
+        self.max_points = max_points
+        self.records: List[Record] = []
+        self._changed = asyncio.Condition()
+
+    async def put(
+        self, records: Sequence[Record], timeout: float | None
+    ) -> None:
+        """Buffer ``records``, waiting up to ``timeout`` for room."""
+        if len(records) > self.max_points:
+            raise BufferFull
+        async with self._changed:
+            try:
+                await asyncio.wait_for(
+                    self._changed.wait_for(
+                        lambda: len(self.records) + len(records)
+                        <= self.max_points
+                    ),
+                    timeout,
+                )
+            except asyncio.TimeoutError:
+                raise BufferFull from None
+            self.records.extend(records)
+            self._changed.notify_all()
+
+    async def take(self, min_points: int, interval: float) -> List[Record]:
+        """Wait for ``min_points`` or ``interval`` seconds, then empty."""
+        async with self._changed:
+            try:
+                await asyncio.wait_for(
+                    self._changed.wait_for(
+                        lambda: len(self.records) >= min_points
+                    ),
+                    interval,
+                )
+            except asyncio.TimeoutError:
+                pass
+            records, self.records = self.records, []
+            self._changed.notify_all()
+            return records
+
+    def requeue(self, records: List[Record]) -> None:
+        """Put back records a failed flush took, ahead of newer ones."""
+        self.records[:0] = records
+
+
+# per-worker buffer, created with the flusher by the app lifespan
+buffer: TelemetryBuffer | None = None
+
+
+async def add(
+    points: Sequence[schemas.TelemetryPoint], timeout: float | None
+) -> int:
+    """Buffer ``points`` for the next flush; raises BufferFull."""
+    if buffer is None:
+        raise BufferFull
+    await buffer.put(_to_records(points), timeout)
+    return len(points)
+
+
+def _to_records(points: Sequence[schemas.TelemetryPoint]) -> List[Record]:
+    return [
+        (
+            point.vehicle_id,
+            point.ts,
+            point.lat,
+            point.lon,
+            point.speed,
+            point.heading,
+        )
+        for point in points
+    ]
+
+
+def _partition_ddl(day: dt.date) -> str:
+    next_day = day + dt.timedelta(days=1)
+    return (
+        f"CREATE TABLE IF NOT EXISTS telemetry_{day:%Y%m%d} "
+        f"PARTITION OF telemetry FOR VALUES "
+        f"FROM ('{day.isoformat()}') TO ('{next_day.isoformat()}')"
+    )
+
+
+def _copy_sync(records: List[Record], engine: Engine) -> None:
+    rows = io.StringIO()
+    csv.writer(rows).writerows(
+        (vehicle_id, ts.isoformat(), *values)
+        for vehicle_id, ts, *values in records
+    )
+    rows.seek(0)
+    connection = engine.raw_connection()
+    try:
+        with connection.cursor() as cursor:
+            cursor.copy_expert(
+                f"COPY telemetry ({', '.join(COLUMNS)}) "
+                f"FROM STDIN WITH (FORMAT csv)",
+                rows,
+            )
+        connection.commit()
+    finally:
+        connection.close()
+
+
+async def copy(records: List[Record], engine: AsyncEngine | Engine) -> None:
+    """
+    Write ``records`` with a single COPY: with asyncpg through an
+    AsyncEngine, or with psycopg2 in the threadpool through an Engine.
+    """
+    if not isinstance(engine, AsyncEngine):
+        await run_in_threadpool(_copy_sync, records, engine)
+        return
+    async with engine.connect() as connection:
+        raw_connection = await connection.get_raw_connection()
+        await raw_connection.driver_connection.copy_records_to_table(
+            "telemetry", records=records, columns=COLUMNS
+        )
+
+
+def _create_partition_sync(statement: str, engine: Engine) -> None:
+    with engine.begin() as connection:
+        connection.exec_driver_sql(statement)
+
+
+async def create_partition(day: dt.date, engine: AsyncEngine | Engine) -> None:
+    """Create the partition holding the points of ``day``, if missing."""
+    statement = _partition_ddl(day)
+    if not isinstance(engine, AsyncEngine):
+        await run_in_threadpool(_create_partition_sync, statement, engine)
+        return
+    async with engine.begin() as connection:
+        await connection.exec_driver_sql(statement)
+
+
+async def create_partitions(engine: AsyncEngine | Engine) -> None:
+    """Create the daily partitions of today and the next days."""
+    today = dt.datetime.now(dt.timezone.utc).date()
+    for days in range(settings.telemetry_partition_days_ahead + 1):
+        day = today + dt.timedelta(days=days)
+        try:
+            await create_partition(day, engine)
+        except Exception:
+            # fails once the default partition holds rows of that day;
+            # they keep landing there, still indexed
+            logger.exception("creating telemetry partition %s failed", day)
+
+
+async def index_positions(
+    records: List[Record], session: SessionFactory
+) -> None:
+    """Move the vehicles in ``records`` to their latest position."""
+    try:
+        async with session() as db:
+            await positions.index(records, redis=await get_redis(), db=db)
+    except Exception:
+        # the points are stored; the index catches up with the next ones
+        logger.exception("indexing vehicle positions failed")
+
+
+def start_flusher(
+    engine: AsyncEngine | Engine, session: SessionFactory
+) -> "asyncio.Task[None]":
+    """Create the buffer, and the task copying it through ``engine``."""
+    global buffer
+    buffer = TelemetryBuffer(settings.telemetry_buffer_max_points)
+    return asyncio.create_task(_run_flusher(buffer, engine, session))
+
+
+async def stop_flusher(flusher: "asyncio.Task[None]") -> None:
+    """Cancel ``flusher`` and wait for it to copy what is still buffered."""
+    flusher.cancel()
+    with suppress(asyncio.CancelledError):
+        await flusher
+
+
+async def _run_flusher(
+    buffer: TelemetryBuffer,
+    engine: AsyncEngine | Engine,
+    session: SessionFactory,
+) -> None:
+    """Copy the buffer to the db until cancelled, then flush what is left."""
+    next_partition_check = time.monotonic()
+    # the batch taken from the buffer and not yet indexed, and its copy,
+    # which a cancel has to finish rather than drop
+    records: List[Record] = []
+    copying: "asyncio.Future[None] | None" = None
+    try:
+        while True:
+            if time.monotonic() >= next_partition_check:
+                await create_partitions(engine)
+                next_partition_check = (
+                    time.monotonic() + PARTITION_CHECK_INTERVAL
+                )
+
+            records = await buffer.take(
+                settings.telemetry_flush_points,
+                settings.telemetry_flush_interval,
+            )
+            if not records:
+                continue
+            # shielded: a cancelled copy may still commit in its thread, so
+            # a cancel waits for its outcome instead of guessing
+            copying = asyncio.ensure_future(copy(records, engine))
+            try:
+                await asyncio.shield(copying)
+            except Exception:
+                logger.exception("telemetry flush failed, retrying")
+                buffer.requeue(records)
+                records = []
+                await asyncio.sleep(1)
+                continue
+            await index_positions(records, session)
+            records = []
+    except asyncio.CancelledError:
+        # shielded too, so cancelling the shutdown does not drop points
+        await asyncio.shield(
+            _flush_on_stop(buffer, records, copying, engine, session)
+        )
+        raise
+
+
+async def _flush_on_stop(
+    buffer: TelemetryBuffer,
+    records: List[Record],
+    copying: "asyncio.Future[None] | None",
+    engine: AsyncEngine | Engine,
+    session: SessionFactory,
+) -> None:
+    """
+    Finish the batch in flight and copy what is still buffered. Points
+    that cannot be written are logged rather than raised, so the rest of
+    the shutdown still runs.
+    """
+    copied: List[Record] = []
+    if records:
+        try:
+            await copying
+        except Exception:
+            buffer.requeue(records)
+        else:
+            copied = records
+    if buffer.records:
+        remaining, buffer.records = buffer.records, []
+        try:
+            await copy(remaining, engine)
+        except Exception:
+            logger.exception(
+                "telemetry flush on shutdown failed, %d points lost",
+                len(remaining),
+            )
+        else:
+            copied += remaining
+    if copied:
+        # or the last positions before a restart never reach the index
+        await index_positions(copied, session)
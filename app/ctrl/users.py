@@ -0,0 +1,113 @@
+from typing import TYPE_CHECKING
+
+import sqlalchemy as sql
+from sqlalchemy import select
+
+from app import cache, models, schemas
+
+if TYPE_CHECKING:
+    from aioredis import Redis
+    from sqlalchemy.ext.asyncio import AsyncSession
+
+# the password hash stays out of the caches, and is read only on login
+USER = cache.Codec(schemas.User)
+
+
+async def create(
+    user: schemas.CreateUser,
+    hashed_password: str,
+    redis: "Redis",
+    db: "AsyncSession",
+) -> schemas.User:
+    user = models.User(
+        **user.model_dump(exclude={"password"}),
+        hashed_password=hashed_password,
+    )
+    db.add(user)
+    await db.commit()
+    await db.refresh(user)
+    # drops a cached "no such user" left by an earlier lookup
+    await cache.invalidate(redis, f"user_{user.username}")
+    return schemas.User.model_validate(user)
+
+
+async def get(
+    username: str,
+    redis: "Redis",
+    db: "AsyncSession",
+) -> schemas.User | None:
+    async def load() -> bytes:
+        user = await db.scalar(
+            select(models.User).filter(models.User.username == username)
+        )
+        return await cache.store(
+            redis,
+            f"user_{username}",
+            None if user is None else USER.dump(user),
+        )
+
+    cached_user = await cache.read_through(
+        redis,
+        f"user_{username}",
+        fetch=lambda: redis.get(f"user_{username}"),
+        load=load,
+    )
+    if cached_user == cache.NOT_FOUND:
+        return None
+    return schemas.User.model_validate_json(cached_user)
+
+
+async def get_in_db(
+    username: str,
+    db: "AsyncSession",
+) -> schemas.UserInDB | None:
+    """The user with their password hash, read from the database."""
+    user = await db.scalar(
+        select(models.User).filter(models.User.username == username)
+    )
+    return None if user is None else schemas.UserInDB.model_validate(user)
+
+
+async def any_of_fleet(fleet_id, db: "AsyncSession") -> bool:
+    return await db.scalar(
+        select(sql.exists().where(models.User.fleet_id == fleet_id))
+    )
+
+
+async def delete(
+    username: str,
+    redis: "Redis",
+    db: "AsyncSession",
+) -> bool:
+    deleted = await db.scalar(
+        sql.delete(models.User)
+        .filter(models.User.username == username)
+        .returning(models.User.id)
+    )
+    if deleted is None:
+        await db.rollback()
+        return False
+    await db.commit()
+    await cache.invalidate(redis, f"user_{username}")
+    return True
+
+
+async def update(
+    username: str,
+    user_data: schemas.UpdateUser,
+    redis: "Redis",
+    db: "AsyncSession",
+) -> schemas.User | None:
+    user = await db.scalar(
+        sql.update(models.User)
+        .filter(models.User.username == username)
+        .values(**user_data.model_dump())
+        .returning(models.User)
+        .execution_options(populate_existing=True)
+    )
+    if user is None:
+        return None
+    user = schemas.User.model_validate(user)
+    await db.commit()
+    await cache.invalidate(redis, f"user_{username}")
+    return user
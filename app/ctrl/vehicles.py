@@ -1,131 +1,262 @@
-import json
-from typing import TYPE_CHECKING, List
+from typing import TYPE_CHECKING, Any, AsyncIterator, Dict, List, Tuple
 from uuid import UUID
 
-from fastapi.encoders import jsonable_encoder
+import sqlalchemy as sql
+from sqlalchemy import select
 
-from app import models, schemas
+from app import cache, models, schemas
+from app.ctrl import bulk, export, pagination, positions, routes, versions
 
 if TYPE_CHECKING:
     from aioredis import Redis
-    from sqlalchemy.orm import Session
+    from sqlalchemy.ext.asyncio import AsyncSession
+
+VEHICLE = cache.Codec(schemas.Vehicle)
+VEHICLES = cache.Codec(List[schemas.Vehicle])
 
 
 async def create(
     vehicle: schemas.CreateVehicle,
     owner_id,
     redis: "Redis",
-    db: "Session",
+    db: "AsyncSession",
 ) -> schemas.Vehicle:
     vehicle = models.Vehicle(**vehicle.model_dump())
     vehicle.owner_id = owner_id
     db.add(vehicle)
-    db.commit()
-    db.refresh(vehicle)
-    await redis.delete("vehicles")
-    await redis.delete(f"vehicles_in_fleet_{owner_id}")
+    await db.commit()
+    await db.refresh(vehicle)
+    await cache.invalidate(
+        redis,
+        "vehicles",
+        f"vehicle_{vehicle.id}",
+        f"vehicles_in_fleet_{owner_id}",
+    )
     return schemas.Vehicle.model_validate(vehicle)
 
 
+async def create_many(
+    vehicles_data: List[schemas.BulkVehicle],
+    redis: "Redis",
+    db: "AsyncSession",
+    upsert: bool = False,
+) -> List[schemas.Vehicle]:
+    rows = [vehicle.model_dump() for vehicle in vehicles_data]
+    owner_ids = {row["owner_id"] for row in rows}
+    if upsert:
+        # an upsert may move a vehicle, so its previous fleet list goes too
+        previous_owners = await db.scalars(
+            select(models.Vehicle.owner_id)
+            .filter(
+                models.Vehicle.vehicle_plate_number.in_(
+                    [row["vehicle_plate_number"] for row in rows]
+                )
+            )
+            .distinct()
+        )
+        owner_ids.update(previous_owners.all())
+    vehicles = await bulk.insert_many(
+        models.Vehicle,
+        rows,
+        db,
+        upsert_on="vehicle_plate_number" if upsert else None,
+    )
+    vehicles = [
+        schemas.Vehicle.model_validate(vehicle) for vehicle in vehicles
+    ]
+    await db.commit()
+    await cache.invalidate(
+        redis,
+        "vehicles",
+        *(f"vehicles_in_fleet_{owner_id}" for owner_id in owner_ids),
+        *(f"vehicle_{vehicle.id}" for vehicle in vehicles),
+    )
+    if upsert:
+        await positions.reassign(vehicles, redis)
+    return vehicles
+
+
 async def get_all(
     redis: "Redis",
-    db: "Session",
-) -> List[models.Vehicle]:
-    if (cached_profile := await redis.get("vehicles")) is not None:
-        vehicles = json.loads(cached_profile)
-        return vehicles
-    else:
-        vehicles = db.query(models.Vehicle).all()
-        await redis.set(
-            "vehicles", json.dumps(jsonable_encoder(vehicles)), ex=300
+    db: "AsyncSession",
+    limit: int = pagination.DEFAULT_LIMIT,
+    cursor: str | None = None,
+    vehicle_plate_number: str | None = None,
+) -> pagination.Page:
+    filters = {"vehicle_plate_number": vehicle_plate_number}
+    field = pagination.page_key(limit, cursor, **filters)
+
+    async def load() -> bytes:
+        statement = pagination.filter_by(select(models.Vehicle), **filters)
+        vehicles = (
+            await db.scalars(
+                pagination.paginate(statement, models.Vehicle, limit, cursor)
+            )
+        ).all()
+        vehicles, next_cursor = pagination.split_page(vehicles, limit)
+        return await pagination.set_cached_page(
+            redis, "vehicles", field, VEHICLES.dump(vehicles), next_cursor
         )
-        return vehicles
+
+    cached_page = await cache.read_through(
+        redis,
+        "vehicles",
+        fetch=lambda: redis.hget("vehicles", field),
+        load=load,
+        field=field,
+    )
+    return pagination.parse_page(cached_page)
 
 
 async def get_all_vehicles_in_fleet(
     fleet_id: UUID,
     redis: "Redis",
-    db: "Session",
-) -> List[models.Vehicle]:
-    if (
-        cached_profile := await redis.get(f"vehicles_in_fleet_{fleet_id}")
-    ) is not None:
-        vehicles = json.loads(cached_profile)
-        return vehicles
-    else:
-        vehicles = (
-            db.query(models.Vehicle)
-            .filter(models.Vehicle.owner_id == fleet_id)
-            .all()
+    db: "AsyncSession",
+    limit: int = pagination.DEFAULT_LIMIT,
+    cursor: str | None = None,
+) -> pagination.Page:
+    field = pagination.page_key(limit, cursor)
+
+    async def load() -> bytes:
+        statement = select(models.Vehicle).filter(
+            models.Vehicle.owner_id == fleet_id
         )
-        await redis.set(
+        vehicles = (
+            await db.scalars(
+                pagination.paginate(statement, models.Vehicle, limit, cursor)
+            )
+        ).all()
+        vehicles, next_cursor = pagination.split_page(vehicles, limit)
+        return await pagination.set_cached_page(
+            redis,
             f"vehicles_in_fleet_{fleet_id}",
-            json.dumps(jsonable_encoder(vehicles)),
-            ex=300,
+            field,
+            VEHICLES.dump(vehicles),
+            next_cursor,
         )
-        return vehicles
+
+    cached_page = await cache.read_through(
+        redis,
+        f"vehicles_in_fleet_{fleet_id}",
+        fetch=lambda: redis.hget(f"vehicles_in_fleet_{fleet_id}", field),
+        load=load,
+        field=field,
+    )
+    return pagination.parse_page(cached_page)
+
+
+def export_all(
+    export_format: export.ExportFormat,
+    db: "AsyncSession",
+) -> AsyncIterator[bytes]:
+    statement = select(models.Vehicle).order_by(
+        models.Vehicle.date_created, models.Vehicle.id
+    )
+    return export.stream(statement, schemas.Vehicle, export_format, db)
 
 
 async def get(
     vehicle_id: UUID,
     redis: "Redis",
-    db: "Session",
-) -> models.Vehicle | None:
-    if (
-        cached_profile := await redis.get(f"vehicle_{vehicle_id}")
-    ) is not None:
-        vehicle = json.loads(cached_profile)
-    else:
-        vehicle = (
-            db.query(models.Vehicle)
-            .filter(models.Vehicle.id == vehicle_id)
-            .first()
+    db: "AsyncSession",
+) -> cache.Entry | None:
+    async def load() -> bytes:
+        vehicle = await db.scalar(
+            select(models.Vehicle).filter(models.Vehicle.id == vehicle_id)
         )
-        await redis.set(
+        return await cache.store(
+            redis,
             f"vehicle_{vehicle_id}",
-            json.dumps(jsonable_encoder(vehicle)),
-            ex=300,
+            None if vehicle is None else VEHICLE.dump_entry(vehicle),
         )
-    return vehicle
+
+    cached_profile = await cache.read_through(
+        redis,
+        f"vehicle_{vehicle_id}",
+        fetch=lambda: redis.get(f"vehicle_{vehicle_id}"),
+        load=load,
+    )
+    return cache.found(cached_profile)
+
+
+async def delete_of_fleet(fleet_id: UUID, db: "AsyncSession") -> List[str]:
+    """
+    Delete the vehicles of a fleet, and their routes, ahead of the fleet,
+    and return the cache keys they were in.
+    """
+    stale = await routes.delete_where(
+        models.Route.vehicle_id.in_(
+            select(models.Vehicle.id).filter(
+                models.Vehicle.owner_id == fleet_id
+            )
+        ),
+        db,
+    )
+    deleted = (
+        await db.scalars(
+            sql.delete(models.Vehicle)
+            .filter(models.Vehicle.owner_id == fleet_id)
+            .returning(models.Vehicle.id)
+        )
+    ).all()
+    if not deleted:
+        return stale
+    return [
+        "vehicles",
+        f"vehicles_in_fleet_{fleet_id}",
+        *(f"vehicle_{vehicle_id}" for vehicle_id in deleted),
+        *stale,
+    ]
 
 
 async def delete(
     vehicle_id: UUID,
     redis: "Redis",
-    db: "Session",
-) -> None:
-    vehicle = (
-        db.query(models.Vehicle)
+    db: "AsyncSession",
+) -> bool:
+    # deleted here rather than by the cascade, which would hide their keys
+    stale = await routes.delete_where(
+        models.Route.vehicle_id == vehicle_id, db
+    )
+    fleet_id = await db.scalar(
+        sql.delete(models.Vehicle)
         .filter(models.Vehicle.id == vehicle_id)
-        .first()
+        .returning(models.Vehicle.owner_id)
+    )
+    if fleet_id is None:
+        await db.rollback()
+        return False
+    await db.commit()
+    await cache.invalidate(
+        redis,
+        "vehicles",
+        f"vehicle_{vehicle_id}",
+        f"vehicles_in_fleet_{fleet_id}",
+        *stale,
     )
-    if vehicle is not None:
-        fleet_id = vehicle.owner_id
-        await redis.delete(f"vehicles_in_fleet_{fleet_id}")
-    db.delete(vehicle)
-    db.commit()
-    await redis.delete(f"vehicle_{vehicle_id}")
-    await redis.delete("vehicles")
+    await positions.forget([vehicle_id], redis)
+    return True
 
 
 async def update(
-    vehicle_data,
     vehicle_id: UUID,
+    changes: Dict[str, Any],
     redis: "Redis",
-    db: "Session",
-) -> schemas.Vehicle:
-    vehicle = (
-        db.query(models.Vehicle)
-        .filter(models.Vehicle.id == vehicle_id)
-        .first()
+    db: "AsyncSession",
+    if_match: List[int] | None = None,
+) -> Tuple[schemas.Vehicle, int] | None:
+    vehicle = await versions.update_row(
+        models.Vehicle, vehicle_id, changes, db, if_match=if_match
     )
-    if vehicle is not None:
-        vehicle.vehicle_brand = vehicle_data.vehicle_brand
-        vehicle.vehicle_plate_number = vehicle_data.vehicle_plate_number
-        fleet_id = vehicle.owner_id
-        await redis.delete(f"vehicles_in_fleet_{fleet_id}")
-    db.commit()
-    db.refresh(vehicle)
-    await redis.delete(f"vehicle_{vehicle_id}")
-    await redis.delete("vehicles")
-    return schemas.Vehicle.model_validate(vehicle)
+    if vehicle is None:
+        return None
+    version = vehicle.version
+    vehicle = schemas.Vehicle.model_validate(vehicle)
+    await db.commit()
+    await cache.invalidate(
+        redis,
+        "vehicles",
+        f"vehicle_{vehicle_id}",
+        f"vehicles_in_fleet_{vehicle.owner_id}",
+    )
+    return vehicle, version
@@ -0,0 +1,51 @@
+"""
+versions.py
+row versions, served as ETags, and the conditional update built on them
+"""
+
+from typing import Any, Dict, List
+
+import sqlalchemy as sql
+
+ETAG_HEADER = "ETag"
+
+
+def etag(version: int) -> str:
+    return f'"{version}"'
+
+
+def parse_if_match(if_match: str | None) -> List[int] | None:
+    """
+    Versions an ``If-Match`` header accepts, or None when it accepts any.
+    A tag that is not one of ours is dropped, so it never matches.
+    """
+    if if_match is None or if_match.strip() == "*":
+        return None
+    versions = []
+    for tag in if_match.split(","):
+        tag = tag.strip()
+        if len(tag) > 2 and tag[0] == tag[-1] == '"' and tag[1:-1].isdigit():
+            versions.append(int(tag[1:-1]))
+    return versions
+
+
+async def update_row(
+    model,
+    row_id,
+    changes: Dict[str, Any],
+    db,
+    if_match: List[int] | None = None,
+):
+    """
+    Apply ``changes`` and bump the version in one UPDATE ... RETURNING,
+    only if the row is at one of the ``if_match`` versions. Returns the
+    updated ORM object, or None when no row matched.
+    """
+    statement = sql.update(model).filter(model.id == row_id)
+    if if_match is not None:
+        statement = statement.filter(model.version.in_(if_match))
+    return await db.scalar(
+        statement.values(**changes, version=model.version + 1)
+        .returning(model)
+        .execution_options(populate_existing=True)
+    )
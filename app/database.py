@@ -1,46 +1,130 @@
-"""
-database.py
-connect to postgres database
-"""
-
-from sqlalchemy import create_engine
-from sqlalchemy.orm import declarative_base, sessionmaker
-
-from app.config import settings
-
-username = settings.database_username
-password = settings.database_password
-host = settings.database_hostname
-port = settings.database_port
-db_name = settings.database_name
-
-DATABASE_URL = f"postgresql://{username}:{password}@{host}:{port}/{db_name}"
-
-engine = create_engine(DATABASE_URL)
-
-SessionLocal = sessionmaker(autoflush=False, autocommit=False, bind=engine)
-
-Base = declarative_base()
-
-
-def get_db():
-    db = SessionLocal()
-    try:
-        yield db
-    finally:
-        db.close()
-
-
-def add_tables():
-    return Base.metadata.create_all(bind=engine)
-
-
-fake_users_db = {
-    "bao": {
-        "username": "bao",
-        "full_name": "bao hua",
-        "email": "bao@example.com",
-        "hashed_password": "$2b$12$VjHOYBKb77976bZoTOIABekHde3FJAHZyJwte2z6.zfqkvOBu1.4u",
-        "disabled": False,
-    }
-}
+"""
+database.py
+connect to postgres database
+"""
+
+from contextlib import asynccontextmanager
+
+from sqlalchemy import create_engine
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+from sqlalchemy.orm import declarative_base, sessionmaker
+from starlette.concurrency import run_in_threadpool
+
+from app.config import settings
+
+username = settings.database_username
+password = settings.database_password
+host = settings.database_hostname
+port = settings.database_port
+db_name = settings.database_name
+
+DATABASE_URL = f"postgresql://{username}:{password}@{host}:{port}/{db_name}"
+ASYNC_DATABASE_URL = (
+    f"postgresql+asyncpg://{username}:{password}@{host}:{port}/{db_name}"
+)
+
+engine = create_engine(DATABASE_URL)
+
+SessionLocal = sessionmaker(autoflush=False, autocommit=False, bind=engine)
+
+async_engine = create_async_engine(
+    ASYNC_DATABASE_URL,
+    pool_size=settings.database_pool_size,
+    max_overflow=settings.database_max_overflow,
+)
+
+AsyncSessionLocal = async_sessionmaker(
+    async_engine, autoflush=False, expire_on_commit=False
+)
+
+Base = declarative_base()
+
+
+class SyncSession:
+    """
+    Expose a blocking ``Session`` through the subset of the ``AsyncSession``
+    API used by ``app.ctrl``, running every round-trip in the threadpool so
+    the sync driver never blocks the event loop.
+    """
+
+    def __init__(self, session):
+        self.sync_session = session
+
+    def add(self, instance) -> None:
+        self.sync_session.add(instance)
+
+    def add_all(self, instances) -> None:
+        self.sync_session.add_all(instances)
+
+    async def execute(self, statement, params=None):
+        return await run_in_threadpool(
+            self.sync_session.execute, statement, params
+        )
+
+    async def scalar(self, statement, params=None):
+        return await run_in_threadpool(
+            self.sync_session.scalar, statement, params
+        )
+
+    async def scalars(self, statement, params=None):
+        return await run_in_threadpool(
+            self.sync_session.scalars, statement, params
+        )
+
+    async def stream_scalars(self, statement, params=None):
+        result = await run_in_threadpool(
+            self.sync_session.scalars, statement, params
+        )
+        return _ThreadpoolStream(result)
+
+    async def delete(self, instance) -> None:
+        await run_in_threadpool(self.sync_session.delete, instance)
+
+    async def refresh(self, instance) -> None:
+        await run_in_threadpool(self.sync_session.refresh, instance)
+
+    async def flush(self) -> None:
+        await run_in_threadpool(self.sync_session.flush)
+
+    async def commit(self) -> None:
+        await run_in_threadpool(self.sync_session.commit)
+
+    async def rollback(self) -> None:
+        await run_in_threadpool(self.sync_session.rollback)
+
+    async def close(self) -> None:
+        await run_in_threadpool(self.sync_session.close)
+
+
+class _ThreadpoolStream:
+    """Async ``partitions()`` over a buffered-by-cursor sync result."""
+
+    def __init__(self, result):
+        self.result = result
+
+    async def partitions(self, size=None):
+        partitions = self.result.partitions(size)
+        while (
+            partition := await run_in_threadpool(next, partitions, None)
+        ) is not None:
+            yield partition
+
+
+async def get_db():
+    if settings.database_async:
+        async with AsyncSessionLocal() as db:
+            yield db
+    else:
+        db = SyncSession(SessionLocal())
+        try:
+            yield db
+        finally:
+            await db.close()
+
+
+# a session for work done outside of a request, like background tasks
+session = asynccontextmanager(get_db)
+
+
+def add_tables():
+    return Base.metadata.create_all(bind=engine)
@@ -1,10 +1,36 @@
-from aioredis import Redis, from_url
+from aioredis import BlockingConnectionPool, Redis
 
 from app.config import settings
 
+# process-wide client, opened and closed by the app lifespan
+redis: Redis | None = None
 
-def cache():
-    return Redis(host=settings.redis_server, port=settings.redis_port)
 
+async def open_pool() -> Redis:
+    global redis
+    if redis is None:
+        pool = BlockingConnectionPool(
+            host=settings.redis_server,
+            port=settings.redis_port,
+            max_connections=settings.redis_max_connections,
+            timeout=settings.redis_pool_timeout,
+            socket_timeout=settings.redis_socket_timeout,
+            socket_connect_timeout=settings.redis_socket_connect_timeout,
+            socket_keepalive=True,
+            health_check_interval=settings.redis_health_check_interval,
+        )
+        redis = Redis(connection_pool=pool)
+        await redis.ping()
+    return redis
 
-redis = from_url("redis://redis-cache:6379")
+
+async def close_pool() -> None:
+    global redis
+    if redis is not None:
+        await redis.close()
+        await redis.connection_pool.disconnect()
+        redis = None
+
+
+async def cache() -> Redis:
+    return redis if redis is not None else await open_pool()
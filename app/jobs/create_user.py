@@ -0,0 +1,75 @@
+"""
+create_user.py
+create a user from the command line, e.g. the first staff account of a new
+deployment: /api/users needs a staff token, so no one could create it there
+
+run from the repo root, with app.env in place:
+    python -m app.jobs.create_user <username> [--fleet <fleet id>]
+the password is prompted for
+"""
+
+import argparse
+import asyncio
+import getpass
+from uuid import UUID
+
+from app import schemas
+from app.ctrl import users
+from app.database import add_tables, async_engine, session
+from app.dependencies.redis import close_pool, open_pool
+from app.security.utils import hash_password
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Create a user")
+    parser.add_argument("username")
+    parser.add_argument("--full-name")
+    parser.add_argument("--email")
+    parser.add_argument(
+        "--fleet",
+        type=UUID,
+        help="fleet the user acts for; staff, who manage users, have none",
+    )
+    return parser.parse_args()
+
+
+def read_password() -> str:
+    password = getpass.getpass()
+    if password != getpass.getpass("Repeat password: "):
+        raise SystemExit("passwords do not match")
+    if not password:
+        raise SystemExit("the password cannot be empty")
+    return password
+
+
+async def main(user: schemas.CreateUser) -> None:
+    # the app creates its tables on startup, which may not have happened yet
+    add_tables()
+    redis = await open_pool()
+    try:
+        async with session() as db:
+            created = await users.create(
+                user=user,
+                hashed_password=hash_password(user.password),
+                redis=redis,
+                db=db,
+            )
+        print(f"created user {created.username}")
+    finally:
+        await close_pool()
+        await async_engine.dispose()
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    asyncio.run(
+        main(
+            schemas.CreateUser(
+                username=args.username,
+                full_name=args.full_name,
+                email=args.email,
+                fleet_id=args.fleet,
+                password=read_password(),
+            )
+        )
+    )
@@ -0,0 +1,28 @@
+"""
+measure_routes.py
+recompute the distance and ETA of every stored route
+
+run from the repo root, with app.env in place:
+    python -m app.jobs.measure_routes
+"""
+
+import asyncio
+
+from app.ctrl import routes
+from app.database import async_engine, session
+from app.dependencies.redis import close_pool, open_pool
+
+
+async def main() -> None:
+    redis = await open_pool()
+    try:
+        async with session() as db:
+            measured = await routes.measure_all(redis=redis, db=db)
+        print(f"measured {measured} routes")
+    finally:
+        await close_pool()
+        await async_engine.dispose()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -1,13 +1,54 @@
+import asyncio
+from contextlib import asynccontextmanager
+
 from fastapi import Depends, FastAPI
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.middleware.gzip import GZipMiddleware
+from fastapi.responses import ORJSONResponse
 
-from app.database import add_tables
-from app.routers import drivers, fleets, routes, user, vehicles
+from app import cache
+from app.config import settings
+from app.ctrl import telemetry as telemetry_ctrl
+from app.ctrl.pagination import NEXT_CURSOR_HEADER
+from app.ctrl.versions import ETAG_HEADER
+from app.database import add_tables, async_engine, engine, session
+from app.dependencies.redis import close_pool, open_pool
+from app.routers import (
+    drivers,
+    fleets,
+    routes,
+    stats,
+    telemetry,
+    user,
+    users,
+    vehicles,
+)
 from app.security.oauth2 import verify_access_token
 
 add_tables()
 
-app = FastAPI()
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    redis = await open_pool()
+    listener = asyncio.create_task(cache.listen_for_invalidations(redis))
+    flusher = telemetry_ctrl.start_flusher(
+        app.state.telemetry_engine, app.state.telemetry_session
+    )
+    yield
+    await telemetry_ctrl.stop_flusher(flusher)
+    listener.cancel()
+    await close_pool()
+    await async_engine.dispose()
+
+
+app = FastAPI(lifespan=lifespan, default_response_class=ORJSONResponse)
+# where the telemetry flusher writes, outside of any request; the tests
+# point it at their own db
+app.state.telemetry_engine = (
+    async_engine if settings.database_async else engine
+)
+app.state.telemetry_session = session
 
 origins = ["*"]
 
@@ -17,14 +58,23 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=[NEXT_CURSOR_HEADER, ETAG_HEADER],
+)
+app.add_middleware(
+    GZipMiddleware,
+    minimum_size=settings.gzip_minimum_size,
+    compresslevel=settings.gzip_compresslevel,
 )
 
 
 app.include_router(user.router)
 app.include_router(fleets.router)
+app.include_router(telemetry.router)
 app.include_router(vehicles.router)
 app.include_router(drivers.router)
 app.include_router(routes.router)
+app.include_router(stats.router)
+app.include_router(users.router)
 
 
 # test route
@@ -5,18 +5,37 @@ models.py
 
 # from uuid import UUID
 
+import logging
 from uuid import uuid4
 
-from sqlalchemy import Column, ForeignKey, String
+from sqlalchemy import (
+    DDL,
+    Boolean,
+    CheckConstraint,
+    Column,
+    Float,
+    ForeignKey,
+    Index,
+    Integer,
+    String,
+    Table,
+    event,
+)
 from sqlalchemy.dialects.postgresql import UUID
+from sqlalchemy.orm import deferred
 from sqlalchemy.sql.expression import text
 from sqlalchemy.sql.sqltypes import TIMESTAMP
 
 from app.database import Base
 
+logger = logging.getLogger(__name__)
+
 
 class Fleet(Base):
     __tablename__ = "fleets"
+    __table_args__ = (
+        Index("ix_fleets_date_created_id", "date_created", "id"),
+    )
     id = Column(
         UUID(as_uuid=True), primary_key=True, nullable=False, default=uuid4
     )
@@ -26,10 +45,24 @@ class Fleet(Base):
     date_created = Column(
         TIMESTAMP(timezone=True), nullable=False, server_default=text("now()")
     )
+    # bumped by every update, and served as the row's ETag
+    version = Column(Integer, nullable=False, server_default=text("1"))
 
 
 class Vehicle(Base):
     __tablename__ = "vehicles"
+    __table_args__ = (
+        # keyset pages of the whole table
+        Index("ix_vehicles_date_created_id", "date_created", "id"),
+        # keyset pages of one fleet; also serves the owner_id lookups of
+        # the cascade delete from fleets
+        Index(
+            "ix_vehicles_owner_id_date_created_id",
+            "owner_id",
+            "date_created",
+            "id",
+        ),
+    )
     id = Column(
         UUID(as_uuid=True), primary_key=True, nullable=False, default=uuid4
     )
@@ -40,6 +73,8 @@ class Vehicle(Base):
     date_created = Column(
         TIMESTAMP(timezone=True), nullable=False, server_default=text("now()")
     )
+    # bumped by every update, and served as the row's ETag
+    version = Column(Integer, nullable=False, server_default=text("1"))
     owner_id = Column(
         UUID, ForeignKey("fleets.id", ondelete="CASCADE"), nullable=False
     )
@@ -47,6 +82,9 @@ class Vehicle(Base):
 
 class Driver(Base):
     __tablename__ = "drivers"
+    __table_args__ = (
+        Index("ix_drivers_date_created_id", "date_created", "id"),
+    )
     id = Column(
         UUID(as_uuid=True), primary_key=True, nullable=False, default=uuid4
     )
@@ -55,15 +93,47 @@ class Driver(Base):
     date_created = Column(
         TIMESTAMP(timezone=True), nullable=False, server_default=text("now()")
     )
+    # bumped by every update, and served as the row's ETag
+    version = Column(Integer, nullable=False, server_default=text("1"))
 
 
 class Route(Base):
     __tablename__ = "routes"
+    __table_args__ = (
+        Index("ix_routes_date_created_id", "date_created", "id"),
+        Index(
+            "ix_routes_driver_id_date_created_id",
+            "driver_id",
+            "date_created",
+            "id",
+        ),
+        Index(
+            "ix_routes_vehicle_id_date_created_id",
+            "vehicle_id",
+            "date_created",
+            "id",
+        ),
+        CheckConstraint(
+            "(starts_at IS NULL) = (ends_at IS NULL)"
+            " AND (starts_at IS NULL OR ends_at > starts_at)",
+            name="ck_routes_schedule",
+        ),
+    )
     id = Column(
         UUID(as_uuid=True), primary_key=True, nullable=False, default=uuid4
     )
     route_name = Column(String, index=True, nullable=False)
     route_info = Column(String, nullable=True)
+    # encoded polyline of (lat, lon) points; loaded only when asked for, so
+    # route lists stay small
+    geometry = deferred(Column(String, nullable=True))
+    # measured from the geometry whenever it is written
+    distance_m = Column(Float, nullable=True)
+    duration_s = Column(Float, nullable=True)
+    # scheduled [starts_at, ends_at) window; the exclusion constraints
+    # below stop two windows of a driver or a vehicle from overlapping
+    starts_at = Column(TIMESTAMP(timezone=True), nullable=True)
+    ends_at = Column(TIMESTAMP(timezone=True), nullable=True)
     driver_id = Column(
         UUID, ForeignKey("drivers.id", ondelete="CASCADE"), nullable=False
     )
@@ -73,3 +143,103 @@ class Route(Base):
     date_created = Column(
         TIMESTAMP(timezone=True), nullable=False, server_default=text("now()")
     )
+    # bumped by every update, and served as the row's ETag
+    version = Column(Integer, nullable=False, server_default=text("1"))
+
+
+class User(Base):
+    __tablename__ = "users"
+    id = Column(
+        UUID(as_uuid=True), primary_key=True, nullable=False, default=uuid4
+    )
+    username = Column(String, index=True, nullable=False, unique=True)
+    full_name = Column(String, nullable=True)
+    email = Column(String, nullable=True)
+    hashed_password = Column(String, nullable=False)
+    disabled = Column(Boolean, nullable=False, server_default=text("false"))
+    # the fleet the user works for, carried in their tokens; None for staff.
+    # It marks fleet users, who cannot manage accounts, and is not a data
+    # scope. A fleet cannot be deleted while it has users.
+    fleet_id = Column(
+        UUID(as_uuid=True),
+        ForeignKey("fleets.id", ondelete="RESTRICT"),
+        nullable=True,
+        index=True,
+    )
+    date_created = Column(
+        TIMESTAMP(timezone=True), nullable=False, server_default=text("now()")
+    )
+
+
+# GPS pings, written only in bulk with COPY and never mapped to objects.
+# Partitioned by day on ts; rows no daily partition covers yet land in the
+# default one. There is no foreign key to vehicles, which would cost a
+# lookup per row at ingestion rates.
+telemetry = Table(
+    "telemetry",
+    Base.metadata,
+    Column("vehicle_id", UUID(as_uuid=True), nullable=False),
+    Column("ts", TIMESTAMP(timezone=True), nullable=False),
+    Column("lat", Float, nullable=False),
+    Column("lon", Float, nullable=False),
+    # km/h
+    Column("speed", Float, nullable=False),
+    # degrees clockwise from north
+    Column("heading", Float, nullable=False),
+    Index("ix_telemetry_vehicle_id_ts", "vehicle_id", "ts"),
+    postgresql_partition_by="RANGE (ts)",
+)
+
+event.listen(
+    telemetry,
+    "after_create",
+    DDL("CREATE TABLE telemetry_default PARTITION OF telemetry DEFAULT"),
+)
+
+
+def _btree_gist_available(ddl, target, bind, **kw) -> bool:
+    available = bind.scalar(
+        text(
+            "SELECT EXISTS (SELECT 1 FROM pg_available_extensions"
+            " WHERE name = 'btree_gist')"
+        )
+    )
+    if not available:
+        logger.warning(
+            "btree_gist is not available: routes are created without the"
+            " exclusion constraints, only the app checks double-booking"
+        )
+    return available
+
+
+def _btree_gist_installed(ddl, target, bind, **kw) -> bool:
+    return bind.scalar(
+        text(
+            "SELECT EXISTS (SELECT 1 FROM pg_extension"
+            " WHERE extname = 'btree_gist')"
+        )
+    )
+
+
+# gist indexes of (id, window) that refuse overlapping windows of one driver
+# or vehicle, even from writes racing the app's own checks; btree_gist lets
+# a gist index compare the uuids. The alembic migration adds the same ones.
+event.listen(
+    Route.__table__,
+    "before_create",
+    DDL("CREATE EXTENSION IF NOT EXISTS btree_gist").execute_if(
+        dialect="postgresql", callable_=_btree_gist_available
+    ),
+)
+for column in ("driver_id", "vehicle_id"):
+    event.listen(
+        Route.__table__,
+        "after_create",
+        DDL(
+            f"ALTER TABLE routes ADD CONSTRAINT"
+            f" ex_routes_{column.removesuffix('_id')}_schedule"
+            f" EXCLUDE USING gist ({column} WITH =,"
+            " tstzrange(starts_at, ends_at) WITH &&)"
+            " WHERE (starts_at IS NOT NULL)"
+        ).execute_if(dialect="postgresql", callable_=_btree_gist_installed),
+    )
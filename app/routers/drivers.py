@@ -1,12 +1,23 @@
-from typing import Annotated, List
+from typing import Annotated, Any, Dict, List
 from uuid import UUID
 
 from aioredis import Redis
-from fastapi import APIRouter, Depends, HTTPException, Path, Response, status
-from sqlalchemy.orm import Session
+from fastapi import (
+    APIRouter,
+    Body,
+    Depends,
+    Header,
+    HTTPException,
+    Path,
+    Query,
+    Response,
+    status,
+)
+from sqlalchemy.ext.asyncio import AsyncSession
 
 from app import database, schemas
-from app.ctrl import drivers
+from app.cache import cached_response
+from app.ctrl import bulk, drivers, pagination, versions
 from app.dependencies.redis import cache
 from app.security.oauth2 import verify_access_token
 
@@ -24,7 +35,7 @@ router = APIRouter(
 async def create_driver(
     driver: schemas.CreateDriver,
     redis: Redis = Depends(cache),
-    db: Session = Depends(database.get_db),
+    db: AsyncSession = Depends(database.get_db),
 ):
     try:
         return await drivers.create(driver=driver, redis=redis, db=db)
@@ -35,25 +46,81 @@ async def create_driver(
         ) from exc
 
 
+@router.post(
+    "/bulk",
+    status_code=status.HTTP_201_CREATED,
+    response_model=List[schemas.Driver],
+)
+async def create_drivers(
+    drivers_data: Annotated[
+        List[schemas.CreateDriver],
+        Body(min_length=1, max_length=bulk.MAX_ITEMS),
+    ],
+    upsert: bool = False,
+    redis: Redis = Depends(cache),
+    db: AsyncSession = Depends(database.get_db),
+):
+    if upsert and (
+        repeated := bulk.duplicates(
+            driver.phone_number for driver in drivers_data
+        )
+    ):
+        raise HTTPException(
+            status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+            detail=f"Phone numbers {sorted(repeated)} repeated in one upsert",
+        )
+
+    try:
+        return await drivers.create_many(
+            drivers_data=drivers_data, upsert=upsert, redis=redis, db=db
+        )
+    except Exception as exc:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Error create drivers",
+        ) from exc
+
+
 @router.get("/", response_model=List[schemas.Driver])
 async def get_drivers(
+    limit: Annotated[
+        int, Query(ge=1, le=pagination.MAX_LIMIT)
+    ] = pagination.DEFAULT_LIMIT,
+    cursor: str | None = None,
+    driver_name: str | None = None,
+    phone_number: str | None = None,
+    if_none_match: Annotated[str | None, Header()] = None,
     redis: Redis = Depends(cache),
-    db: Session = Depends(database.get_db),
+    db: AsyncSession = Depends(database.get_db),
 ):
     try:
-        return await drivers.get_all(redis=redis, db=db)
+        page = await drivers.get_all(
+            redis=redis,
+            db=db,
+            limit=limit,
+            cursor=cursor,
+            driver_name=driver_name,
+            phone_number=phone_number,
+        )
     except Exception as exc:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail="Error get all drivers",
         ) from exc
 
+    headers = {}
+    if page.next_cursor is not None:
+        headers[pagination.NEXT_CURSOR_HEADER] = page.next_cursor
+
+    return cached_response(page, if_none_match, headers=headers)
+
 
 @router.get("/{driver_id}", response_model=schemas.Driver)
 async def get_driver(
     driver_id: Annotated[UUID, Path(title="The ID of the driver to get")],
+    if_none_match: Annotated[str | None, Header()] = None,
     redis: Redis = Depends(cache),
-    db: Session = Depends(database.get_db),
+    db: AsyncSession = Depends(database.get_db),
 ):
     try:
         driver = await drivers.get(driver_id=driver_id, redis=redis, db=db)
@@ -69,67 +136,113 @@ async def get_driver(
             detail="Driver does not exist",
         )
 
-    return driver
+    return cached_response(driver, if_none_match)
 
 
 @router.delete("/{driver_id}", status_code=status.HTTP_204_NO_CONTENT)
 async def delete_driver(
     driver_id: Annotated[UUID, Path(title="The ID of the driver to delete")],
     redis: Redis = Depends(cache),
-    db: Session = Depends(database.get_db),
+    db: AsyncSession = Depends(database.get_db),
 ):
     try:
-        driver = await drivers.get(driver_id=driver_id, redis=redis, db=db)
+        deleted = await drivers.delete(driver_id=driver_id, redis=redis, db=db)
     except Exception as exc:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
-            detail="Error get driver",
+            detail="Error delete driver",
         ) from exc
 
-    if driver is None:
+    if not deleted:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail=f"Driver {driver_id} does not exist",
         )
 
+    return Response(status_code=status.HTTP_204_NO_CONTENT)
+
+
+async def _update_driver(
+    driver_id: UUID,
+    changes: Dict[str, Any],
+    if_match: str | None,
+    response: Response,
+    redis: Redis,
+    db: AsyncSession,
+) -> schemas.Driver:
+    if_match_versions = versions.parse_if_match(if_match)
     try:
-        await drivers.delete(driver_id=driver_id, redis=redis, db=db)
+        updated = await drivers.update(
+            driver_id=driver_id,
+            changes=changes,
+            redis=redis,
+            db=db,
+            if_match=if_match_versions,
+        )
     except Exception as exc:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
-            detail="Error delete driver",
+            detail="Error update driver",
         ) from exc
 
-    return Response(status_code=status.HTTP_204_NO_CONTENT)
+    if updated is None:
+        # nothing matched: the driver is gone, or If-Match is out of date
+        if if_match_versions is not None:
+            try:
+                driver = await drivers.get(
+                    driver_id=driver_id, redis=redis, db=db
+                )
+            except Exception as exc:
+                raise HTTPException(
+                    status_code=status.HTTP_400_BAD_REQUEST,
+                    detail="Error get driver",
+                ) from exc
+
+            if driver is not None:
+                raise HTTPException(
+                    status_code=status.HTTP_412_PRECONDITION_FAILED,
+                    detail="Driver has been modified",
+                )
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail=f"Driver {driver_id} does not exist",
+        )
+
+    driver, version = updated
+    response.headers[versions.ETAG_HEADER] = versions.etag(version)
+    return driver
 
 
 @router.put("/{driver_id}", response_model=schemas.Driver)
 async def update_driver(
     driver_id: Annotated[UUID, Path(title="The ID of the driver to update")],
     driver_data: schemas.CreateDriver,
+    response: Response,
+    if_match: Annotated[str | None, Header()] = None,
     redis: Redis = Depends(cache),
-    db: Session = Depends(database.get_db),
+    db: AsyncSession = Depends(database.get_db),
 ):
-    try:
-        driver = await drivers.get(driver_id=driver_id, redis=redis, db=db)
-    except Exception as exc:
-        raise HTTPException(
-            status_code=status.HTTP_400_BAD_REQUEST,
-            detail="Error get driver",
-        ) from exc
+    return await _update_driver(
+        driver_id, driver_data.model_dump(), if_match, response, redis, db
+    )
 
-    if driver is None:
-        raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND,
-            detail=f"Driver {driver_id} does not exist",
-        )
 
-    try:
-        return await drivers.update(
-            driver_data=driver_data, driver_id=driver_id, redis=redis, db=db
-        )
-    except Exception as exc:
+@router.patch("/{driver_id}", response_model=schemas.Driver)
+async def patch_driver(
+    driver_id: Annotated[UUID, Path(title="The ID of the driver to update")],
+    driver_data: schemas.UpdateDriver,
+    response: Response,
+    if_match: Annotated[str | None, Header()] = None,
+    redis: Redis = Depends(cache),
+    db: AsyncSession = Depends(database.get_db),
+):
+    changes = driver_data.model_dump(exclude_unset=True)
+    if not changes:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
-            detail="Error update driver",
-        ) from exc
+            detail="Nothing to update",
+        )
+
+    return await _update_driver(
+        driver_id, changes, if_match, response, redis, db
+    )
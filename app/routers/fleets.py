@@ -1,12 +1,23 @@
-from typing import Annotated, List
+from typing import Annotated, Any, Dict, List
 from uuid import UUID
 
 from aioredis import Redis
-from fastapi import APIRouter, Depends, HTTPException, Path, Response, status
-from sqlalchemy.orm import Session
+from fastapi import (
+    APIRouter,
+    Body,
+    Depends,
+    Header,
+    HTTPException,
+    Path,
+    Query,
+    Response,
+    status,
+)
+from sqlalchemy.ext.asyncio import AsyncSession
 
 from app import database, schemas
-from app.ctrl import fleets
+from app.cache import cached_response
+from app.ctrl import bulk, fleets, pagination, versions
 from app.dependencies.redis import cache
 from app.security.oauth2 import verify_access_token
 
@@ -24,7 +35,7 @@ router = APIRouter(
 async def create_fleet(
     fleet: schemas.CreateFleet,
     redis: Redis = Depends(cache),
-    db: Session = Depends(database.get_db),
+    db: AsyncSession = Depends(database.get_db),
 ):
     try:
         return await fleets.create(fleet=fleet, redis=redis, db=db)
@@ -35,25 +46,81 @@ async def create_fleet(
         ) from exc
 
 
+@router.post(
+    "/bulk",
+    status_code=status.HTTP_201_CREATED,
+    response_model=List[schemas.Fleet],
+)
+async def create_fleets(
+    fleets_data: Annotated[
+        List[schemas.CreateFleet],
+        Body(min_length=1, max_length=bulk.MAX_ITEMS),
+    ],
+    upsert: bool = False,
+    redis: Redis = Depends(cache),
+    db: AsyncSession = Depends(database.get_db),
+):
+    if upsert and (
+        repeated := bulk.duplicates(
+            fleet.phone_number for fleet in fleets_data
+        )
+    ):
+        raise HTTPException(
+            status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+            detail=f"Phone numbers {sorted(repeated)} repeated in one upsert",
+        )
+
+    try:
+        return await fleets.create_many(
+            fleets_data=fleets_data, upsert=upsert, redis=redis, db=db
+        )
+    except Exception as exc:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Error create fleets",
+        ) from exc
+
+
 @router.get("/", response_model=List[schemas.Fleet])
 async def get_fleets(
+    limit: Annotated[
+        int, Query(ge=1, le=pagination.MAX_LIMIT)
+    ] = pagination.DEFAULT_LIMIT,
+    cursor: str | None = None,
+    fleet_name: str | None = None,
+    phone_number: str | None = None,
+    if_none_match: Annotated[str | None, Header()] = None,
     redis: Redis = Depends(cache),
-    db: Session = Depends(database.get_db),
+    db: AsyncSession = Depends(database.get_db),
 ):
     try:
-        return await fleets.get_all(redis=redis, db=db)
+        page = await fleets.get_all(
+            redis=redis,
+            db=db,
+            limit=limit,
+            cursor=cursor,
+            fleet_name=fleet_name,
+            phone_number=phone_number,
+        )
     except Exception as exc:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail="Error get all fleets",
         ) from exc
 
+    headers = {}
+    if page.next_cursor is not None:
+        headers[pagination.NEXT_CURSOR_HEADER] = page.next_cursor
+
+    return cached_response(page, if_none_match, headers=headers)
+
 
 @router.get("/{fleet_id}", response_model=schemas.Fleet)
 async def get_fleet(
     fleet_id: Annotated[UUID, Path(title="The ID of the fleet to get")],
+    if_none_match: Annotated[str | None, Header()] = None,
     redis: Redis = Depends(cache),
-    db: Session = Depends(database.get_db),
+    db: AsyncSession = Depends(database.get_db),
 ):
     try:
         fleet = await fleets.get(fleet_id=fleet_id, redis=redis, db=db)
@@ -69,66 +136,116 @@ async def get_fleet(
             detail="Fleet does not exist",
         )
 
-    return fleet
+    return cached_response(fleet, if_none_match)
 
 
 @router.delete("/{fleet_id}", status_code=status.HTTP_204_NO_CONTENT)
 async def delete_fleet(
     fleet_id: Annotated[UUID, Path(title="The ID of the fleet to delete")],
     redis: Redis = Depends(cache),
-    db: Session = Depends(database.get_db),
+    db: AsyncSession = Depends(database.get_db),
 ):
     try:
-        fleet = await fleets.get(fleet_id=fleet_id, redis=redis, db=db)
+        deleted = await fleets.delete(fleet_id=fleet_id, redis=redis, db=db)
+    except fleets.FleetHasUsers as exc:
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail=str(exc),
+        ) from exc
     except Exception as exc:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
-            detail="Error get fleet",
+            detail="Error delete fleet",
         ) from exc
 
-    if fleet is None:
+    if not deleted:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail=f"Fleet {fleet_id} does not exist",
         )
 
+    return Response(status_code=status.HTTP_204_NO_CONTENT)
+
+
+async def _update_fleet(
+    fleet_id: UUID,
+    changes: Dict[str, Any],
+    if_match: str | None,
+    response: Response,
+    redis: Redis,
+    db: AsyncSession,
+) -> schemas.Fleet:
+    if_match_versions = versions.parse_if_match(if_match)
     try:
-        await fleets.delete(fleet_id=fleet_id, redis=redis, db=db)
+        updated = await fleets.update(
+            fleet_id=fleet_id,
+            changes=changes,
+            redis=redis,
+            db=db,
+            if_match=if_match_versions,
+        )
     except Exception as exc:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
-            detail="Error delete fleet",
+            detail="Error update fleet",
         ) from exc
 
-    return Response(status_code=status.HTTP_204_NO_CONTENT)
+    if updated is None:
+        # nothing matched: the fleet is gone, or If-Match is out of date
+        if if_match_versions is not None:
+            try:
+                fleet = await fleets.get(fleet_id=fleet_id, redis=redis, db=db)
+            except Exception as exc:
+                raise HTTPException(
+                    status_code=status.HTTP_400_BAD_REQUEST,
+                    detail="Error get fleet",
+                ) from exc
+
+            if fleet is not None:
+                raise HTTPException(
+                    status_code=status.HTTP_412_PRECONDITION_FAILED,
+                    detail="Fleet has been modified",
+                )
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail=f"Fleet with id {fleet_id} does not exist",
+        )
+
+    fleet, version = updated
+    response.headers[versions.ETAG_HEADER] = versions.etag(version)
+    return fleet
 
 
 @router.put("/{fleet_id}", response_model=schemas.Fleet)
 async def update_fleet(
     fleet_id: Annotated[UUID, Path(title="The ID of the fleet to update")],
     fleet_data: schemas.CreateFleet,
+    response: Response,
+    if_match: Annotated[str | None, Header()] = None,
     redis: Redis = Depends(cache),
-    db: Session = Depends(database.get_db),
+    db: AsyncSession = Depends(database.get_db),
 ):
-    try:
-        fleet = await fleets.get(fleet_id=fleet_id, redis=redis, db=db)
-    except Exception as exc:
-        raise HTTPException(
-            status_code=status.HTTP_400_BAD_REQUEST, detail="Error get fleet"
-        ) from exc
+    return await _update_fleet(
+        fleet_id, fleet_data.model_dump(), if_match, response, redis, db
+    )
 
-    if fleet is None:
-        raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND,
-            detail=f"Fleet with id {fleet_id} does not exist",
-        )
 
-    try:
-        return await fleets.update(
-            fleet_data=fleet_data, fleet_id=fleet_id, redis=redis, db=db
-        )
-    except Exception as exc:
+@router.patch("/{fleet_id}", response_model=schemas.Fleet)
+async def patch_fleet(
+    fleet_id: Annotated[UUID, Path(title="The ID of the fleet to update")],
+    fleet_data: schemas.UpdateFleet,
+    response: Response,
+    if_match: Annotated[str | None, Header()] = None,
+    redis: Redis = Depends(cache),
+    db: AsyncSession = Depends(database.get_db),
+):
+    changes = fleet_data.model_dump(exclude_unset=True)
+    if not changes:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
-            detail="Error update fleet",
-        ) from exc
+            detail="Nothing to update",
+        )
+
+    return await _update_fleet(
+        fleet_id, changes, if_match, response, redis, db
+    )
@@ -1,12 +1,34 @@
-from typing import Annotated, List
+from typing import Annotated, Any, Dict, List
 from uuid import UUID
 
 from aioredis import Redis
-from fastapi import APIRouter, Depends, HTTPException, Path, Response, status
-from sqlalchemy.orm import Session
+from fastapi import (
+    APIRouter,
+    Body,
+    Depends,
+    Header,
+    HTTPException,
+    Path,
+    Query,
+    Response,
+    status,
+)
+from fastapi.responses import StreamingResponse
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
 
 from app import database, schemas
-from app.ctrl import drivers, routes, vehicles
+from app.cache import cached_response
+from app.ctrl import (
+    bulk,
+    drivers,
+    export,
+    pagination,
+    routes,
+    schedule,
+    vehicles,
+    versions,
+)
 from app.dependencies.redis import cache
 from app.security.oauth2 import verify_access_token
 
@@ -16,6 +38,59 @@ router = APIRouter(
     dependencies=[Depends(verify_access_token)],
 )
 
+WithGeometry = Annotated[
+    bool,
+    Query(
+        alias="geometry",
+        description="Include the encoded polyline of every route",
+    ),
+]
+Tolerance = Annotated[
+    float | None,
+    Query(
+        gt=0,
+        description="Simplify geometries, dropping points this many metres "
+        "or less off the simplified line",
+    ),
+]
+
+
+async def _check_parents(driver_ids, vehicle_ids, db: AsyncSession) -> None:
+    """Raise a 404 naming the drivers or vehicles that do not exist."""
+    try:
+        missing_drivers, missing_vehicles = await routes.get_missing_parents(
+            driver_ids=driver_ids, vehicle_ids=vehicle_ids, db=db
+        )
+    except Exception as exc:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Error get drivers and vehicles",
+        ) from exc
+
+    if missing_drivers:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail=f"Drivers {sorted(map(str, missing_drivers))} do not exist",
+        )
+    if missing_vehicles:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail=(
+                f"Vehicles {sorted(map(str, missing_vehicles))} do not exist"
+            ),
+        )
+
+
+def _schedule_conflict(exc: Exception) -> HTTPException:
+    """409 listing what double-booked whom, when the checks know."""
+    detail = "Driver or vehicle is already booked at that time"
+    if isinstance(exc, schedule.ScheduleConflict):
+        detail = [
+            conflict.model_dump(by_alias=True, mode="json")
+            for conflict in exc.conflicts
+        ]
+    return HTTPException(status_code=status.HTTP_409_CONFLICT, detail=detail)
+
 
 # routes methods
 @router.post(
@@ -28,70 +103,258 @@ async def create_route(
     driver_id: UUID,
     vehicle_id: UUID,
     redis: Redis = Depends(cache),
-    db: Session = Depends(database.get_db),
+    db: AsyncSession = Depends(database.get_db),
 ):
+    # the foreign keys check the parents as part of the insert; only when
+    # it is rejected are they looked up, to tell which one is missing
     try:
-        driver = await drivers.get(driver_id=driver_id, redis=redis, db=db)
+        return await routes.create(
+            route=route,
+            redis=redis,
+            db=db,
+            driver_id=driver_id,
+            vehicle_id=vehicle_id,
+        )
+    except schedule.ScheduleConflict as exc:
+        raise _schedule_conflict(exc) from exc
+    except IntegrityError as exc:
+        await db.rollback()
+        if schedule.is_exclusion_violation(exc):
+            raise _schedule_conflict(exc) from exc
+        await _check_parents({driver_id}, {vehicle_id}, db)
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Error create route",
+        ) from exc
     except Exception as exc:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
-            detail="Error get driver",
+            detail="Error create route",
         ) from exc
 
-    if driver is None:
+
+@router.post(
+    "/bulk",
+    status_code=status.HTTP_201_CREATED,
+    response_model=List[schemas.Route],
+)
+async def create_routes(
+    routes_data: Annotated[
+        List[schemas.BulkRoute], Body(min_length=1, max_length=bulk.MAX_ITEMS)
+    ],
+    redis: Redis = Depends(cache),
+    db: AsyncSession = Depends(database.get_db),
+):
+    try:
+        return await routes.create_many(
+            routes_data=routes_data, redis=redis, db=db
+        )
+    except schedule.ScheduleConflict as exc:
+        raise _schedule_conflict(exc) from exc
+    except IntegrityError as exc:
+        await db.rollback()
+        if schedule.is_exclusion_violation(exc):
+            raise _schedule_conflict(exc) from exc
+        await _check_parents(
+            {route.driver_id for route in routes_data},
+            {route.vehicle_id for route in routes_data},
+            db,
+        )
         raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND,
-            detail=f"Driver {driver_id} does not exist",
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Error create routes",
+        ) from exc
+    except Exception as exc:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Error create routes",
+        ) from exc
+
+
+@router.post("/conflicts", response_model=List[schemas.RouteConflict])
+async def find_route_conflicts(
+    assignments: Annotated[
+        List[schemas.RouteAssignment],
+        Body(min_length=1, max_length=schedule.MAX_ASSIGNMENTS),
+    ],
+    db: AsyncSession = Depends(database.get_db),
+):
+    # validates a planned schedule without writing it: clashes within the
+    # list, and with stored routes other than the ones being rescheduled
+    try:
+        return await schedule.find_conflicts(assignments=assignments, db=db)
+    except Exception as exc:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Error find route conflicts",
+        ) from exc
+
+
+@router.get("/", response_model=List[schemas.Route])
+async def get_routes(
+    limit: Annotated[
+        int, Query(ge=1, le=pagination.MAX_LIMIT)
+    ] = pagination.DEFAULT_LIMIT,
+    cursor: str | None = None,
+    route_name: str | None = None,
+    min_distance_m: Annotated[float | None, Query(ge=0)] = None,
+    max_distance_m: Annotated[float | None, Query(ge=0)] = None,
+    with_geometry: WithGeometry = False,
+    tolerance: Tolerance = None,
+    if_none_match: Annotated[str | None, Header()] = None,
+    redis: Redis = Depends(cache),
+    db: AsyncSession = Depends(database.get_db),
+):
+    try:
+        page = await routes.get_all(
+            redis=redis,
+            db=db,
+            limit=limit,
+            cursor=cursor,
+            route_name=route_name,
+            with_geometry=with_geometry,
+            min_distance_m=min_distance_m,
+            max_distance_m=max_distance_m,
         )
+        page = routes.simplified(page, tolerance)
+    except Exception as exc:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Error get all routes",
+        ) from exc
 
+    headers = {}
+    if page.next_cursor is not None:
+        headers[pagination.NEXT_CURSOR_HEADER] = page.next_cursor
+
+    return cached_response(page, if_none_match, headers=headers)
+
+
+@router.get("/driver/{driver_id}", response_model=List[schemas.Route])
+async def get_routes_of_driver(
+    driver_id: Annotated[UUID, Path(title="The ID of the driver")],
+    limit: Annotated[
+        int, Query(ge=1, le=pagination.MAX_LIMIT)
+    ] = pagination.DEFAULT_LIMIT,
+    cursor: str | None = None,
+    with_geometry: WithGeometry = False,
+    tolerance: Tolerance = None,
+    if_none_match: Annotated[str | None, Header()] = None,
+    redis: Redis = Depends(cache),
+    db: AsyncSession = Depends(database.get_db),
+):
     try:
-        vehicle = await vehicles.get(vehicle_id=vehicle_id, redis=redis, db=db)
+        driver = await drivers.get(driver_id=driver_id, redis=redis, db=db)
     except Exception as exc:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
-            detail="Error get vehicle",
+            detail=f"Error get driver {driver_id}",
         ) from exc
 
-    if vehicle is None:
+    if driver is None:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
-            detail=f"Vehicle {vehicle_id} does not exist",
+            detail="Driver does not exist",
         )
 
     try:
-        return await routes.create(
-            route=route,
+        page = await routes.get_all_routes_of_driver(
+            driver_id=driver_id,
             redis=redis,
             db=db,
-            driver_id=driver.id,
-            vehicle_id=vehicle.id,
+            limit=limit,
+            cursor=cursor,
+            with_geometry=with_geometry,
         )
+        page = routes.simplified(page, tolerance)
     except Exception as exc:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
-            detail="Error create route",
+            detail=f"Error get all routes of driver {driver_id}",
         ) from exc
 
+    headers = {}
+    if page.next_cursor is not None:
+        headers[pagination.NEXT_CURSOR_HEADER] = page.next_cursor
 
-@router.get("/", response_model=List[schemas.Route])
-async def get_routes(
+    return cached_response(page, if_none_match, headers=headers)
+
+
+@router.get("/vehicle/{vehicle_id}", response_model=List[schemas.Route])
+async def get_routes_of_vehicle(
+    vehicle_id: Annotated[UUID, Path(title="The ID of the vehicle")],
+    limit: Annotated[
+        int, Query(ge=1, le=pagination.MAX_LIMIT)
+    ] = pagination.DEFAULT_LIMIT,
+    cursor: str | None = None,
+    with_geometry: WithGeometry = False,
+    tolerance: Tolerance = None,
+    if_none_match: Annotated[str | None, Header()] = None,
     redis: Redis = Depends(cache),
-    db: Session = Depends(database.get_db),
+    db: AsyncSession = Depends(database.get_db),
 ):
     try:
-        return await routes.get_all(redis=redis, db=db)
+        vehicle = await vehicles.get(vehicle_id=vehicle_id, redis=redis, db=db)
     except Exception as exc:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
-            detail="Error get all routes",
+            detail=f"Error get vehicle {vehicle_id}",
+        ) from exc
+
+    if vehicle is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Vehicle does not exist",
+        )
+
+    try:
+        page = await routes.get_all_routes_of_vehicle(
+            vehicle_id=vehicle_id,
+            redis=redis,
+            db=db,
+            limit=limit,
+            cursor=cursor,
+            with_geometry=with_geometry,
+        )
+        page = routes.simplified(page, tolerance)
+    except Exception as exc:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Error get all routes of vehicle {vehicle_id}",
         ) from exc
 
+    headers = {}
+    if page.next_cursor is not None:
+        headers[pagination.NEXT_CURSOR_HEADER] = page.next_cursor
+
+    return cached_response(page, if_none_match, headers=headers)
+
+
+@router.get("/export", response_class=StreamingResponse)
+async def export_routes(
+    export_format: Annotated[
+        export.ExportFormat, Query(alias="format")
+    ] = export.ExportFormat.ndjson,
+    db: AsyncSession = Depends(database.get_db),
+):
+    return StreamingResponse(
+        routes.export_all(export_format=export_format, db=db),
+        media_type=export.MEDIA_TYPES[export_format],
+        headers={
+            "Content-Disposition": (
+                f"attachment; filename=routes.{export_format.value}"
+            )
+        },
+    )
+
 
-@router.get("/{route_id}", response_model=schemas.Route)
+@router.get("/{route_id}", response_model=schemas.RouteWithGeometry)
 async def get_route(
     route_id: Annotated[UUID, Path(title="The ID of the route to get")],
+    tolerance: Tolerance = None,
+    if_none_match: Annotated[str | None, Header()] = None,
     redis: Redis = Depends(cache),
-    db: Session = Depends(database.get_db),
+    db: AsyncSession = Depends(database.get_db),
 ):
     try:
         route = await routes.get(route_id=route_id, redis=redis, db=db)
@@ -107,67 +370,128 @@ async def get_route(
             detail="Route does not exist",
         )
 
-    return route
+    try:
+        route = routes.simplified(route, tolerance)
+    except Exception as exc:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Error simplify route geometry",
+        ) from exc
+
+    return cached_response(route, if_none_match)
 
 
 @router.delete("/{route_id}", status_code=status.HTTP_204_NO_CONTENT)
 async def delete_route(
     route_id: Annotated[UUID, Path(title="The ID of the route to delete")],
     redis: Redis = Depends(cache),
-    db: Session = Depends(database.get_db),
+    db: AsyncSession = Depends(database.get_db),
 ):
     try:
-        route = await routes.get(route_id=route_id, redis=redis, db=db)
+        deleted = await routes.delete(route_id=route_id, redis=redis, db=db)
     except Exception as exc:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
-            detail="Error get route",
+            detail="Error delete route",
         ) from exc
 
-    if route is None:
+    if not deleted:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail=f"Route {route_id} does not exist",
         )
 
+    return Response(status_code=status.HTTP_204_NO_CONTENT)
+
+
+async def _update_route(
+    route_id: UUID,
+    changes: Dict[str, Any],
+    if_match: str | None,
+    response: Response,
+    redis: Redis,
+    db: AsyncSession,
+) -> schemas.Route:
+    if_match_versions = versions.parse_if_match(if_match)
     try:
-        await routes.delete(route_id=route_id, redis=redis, db=db)
+        updated = await routes.update(
+            route_id=route_id,
+            changes=changes,
+            redis=redis,
+            db=db,
+            if_match=if_match_versions,
+        )
+    except schedule.ScheduleConflict as exc:
+        raise _schedule_conflict(exc) from exc
+    except IntegrityError as exc:
+        if schedule.is_exclusion_violation(exc):
+            raise _schedule_conflict(exc) from exc
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Error update route",
+        ) from exc
     except Exception as exc:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
-            detail="Error delete route",
+            detail="Error update route",
         ) from exc
 
-    return Response(status_code=status.HTTP_204_NO_CONTENT)
+    if updated is None:
+        # nothing matched: the route is gone, or If-Match is out of date
+        if if_match_versions is not None:
+            try:
+                route = await routes.get(route_id=route_id, redis=redis, db=db)
+            except Exception as exc:
+                raise HTTPException(
+                    status_code=status.HTTP_400_BAD_REQUEST,
+                    detail="Error get route",
+                ) from exc
+
+            if route is not None:
+                raise HTTPException(
+                    status_code=status.HTTP_412_PRECONDITION_FAILED,
+                    detail="Route has been modified",
+                )
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Route does not exist",
+        )
+
+    route, version = updated
+    response.headers[versions.ETAG_HEADER] = versions.etag(version)
+    return route
 
 
 @router.put("/{route_id}", response_model=schemas.Route)
 async def update_route(
     route_id: Annotated[UUID, Path(title="The ID of the route to update")],
     route_data: schemas.CreateRoute,
+    response: Response,
+    if_match: Annotated[str | None, Header()] = None,
     redis: Redis = Depends(cache),
-    db: Session = Depends(database.get_db),
+    db: AsyncSession = Depends(database.get_db),
 ):
-    try:
-        route = await routes.get(route_id=route_id, redis=redis, db=db)
-    except Exception as exc:
-        raise HTTPException(
-            status_code=status.HTTP_400_BAD_REQUEST,
-            detail="Error get route",
-        ) from exc
+    return await _update_route(
+        route_id, route_data.model_dump(), if_match, response, redis, db
+    )
 
-    if route is None:
-        raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND,
-            detail="Route does not exist",
-        )
 
-    try:
-        return await routes.update(
-            route_id=route_id, route_data=route_data, redis=redis, db=db
-        )
-    except Exception as exc:
+@router.patch("/{route_id}", response_model=schemas.Route)
+async def patch_route(
+    route_id: Annotated[UUID, Path(title="The ID of the route to update")],
+    route_data: schemas.UpdateRoute,
+    response: Response,
+    if_match: Annotated[str | None, Header()] = None,
+    redis: Redis = Depends(cache),
+    db: AsyncSession = Depends(database.get_db),
+):
+    changes = route_data.model_dump(exclude_unset=True)
+    if not changes:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
-            detail="Error update route",
-        ) from exc
+            detail="Nothing to update",
+        )
+
+    return await _update_route(
+        route_id, changes, if_match, response, redis, db
+    )
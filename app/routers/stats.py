@@ -0,0 +1,18 @@
+from typing import Dict
+
+from fastapi import APIRouter, Depends
+
+from app import cache
+from app.security.oauth2 import verify_access_token
+
+router = APIRouter(
+    prefix="/api/stats",
+    tags=["Stats"],
+    dependencies=[Depends(verify_access_token)],
+)
+
+
+# counters are per worker process
+@router.get("/cache", response_model=Dict[str, int])
+async def get_cache_stats():
+    return cache.stats
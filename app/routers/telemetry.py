@@ -0,0 +1,109 @@
+from typing import Annotated, List
+
+from aioredis import Redis
+from fastapi import (
+    APIRouter,
+    Body,
+    Depends,
+    HTTPException,
+    Query,
+    WebSocket,
+    WebSocketDisconnect,
+    status,
+)
+from fastapi.security import HTTPAuthorizationCredentials
+from pydantic import TypeAdapter, ValidationError
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app import database, schemas
+from app.config import settings
+from app.ctrl import telemetry
+from app.dependencies.redis import cache
+from app.security.oauth2 import verify_access_token
+
+router = APIRouter(prefix="/api/vehicles/telemetry", tags=["Telemetry"])
+
+_points = TypeAdapter(List[schemas.TelemetryPoint])
+
+
+# registered at the prefix itself: the path also partly matches the vehicles
+# router's /{vehicle_id}, which rules out the trailing-slash redirect a "/"
+# route would need
+@router.post(
+    "",
+    status_code=status.HTTP_202_ACCEPTED,
+    dependencies=[Depends(verify_access_token)],
+)
+async def ingest_telemetry(
+    points: Annotated[
+        List[schemas.TelemetryPoint],
+        Body(min_length=1, max_length=telemetry.MAX_BATCH),
+    ],
+):
+    # accepted points are written by the next flush, within about
+    # telemetry_flush_interval seconds
+    try:
+        accepted = await telemetry.add(
+            points, timeout=settings.telemetry_put_timeout
+        )
+    except telemetry.BufferFull as exc:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Telemetry buffer is full",
+            headers={"Retry-After": "1"},
+        ) from exc
+    return {"accepted": accepted}
+
+
+@router.websocket("/ws")
+async def stream_telemetry(
+    websocket: WebSocket,
+    token: str = Query(),
+    redis: Redis = Depends(cache),
+    db: AsyncSession = Depends(database.get_db),
+):
+    # browsers cannot set headers on a websocket, so the token is a param
+    try:
+        await verify_access_token(
+            HTTPAuthorizationCredentials(scheme="Bearer", credentials=token),
+            redis=redis,
+            db=db,
+        )
+    except HTTPException:
+        await websocket.close(code=status.WS_1008_POLICY_VIOLATION)
+        return
+    finally:
+        # give back the connection the user lookup may hold, rather than
+        # keep it for the life of the socket
+        await db.close()
+
+    await websocket.accept()
+    try:
+        while True:
+            message = await websocket.receive_text()
+            try:
+                points = _points.validate_json(message)
+            except ValidationError as exc:
+                await websocket.send_json(
+                    {
+                        "detail": exc.errors(
+                            include_url=False, include_context=False
+                        )
+                    }
+                )
+                continue
+            if not 1 <= len(points) <= telemetry.MAX_BATCH:
+                await websocket.send_json(
+                    {"detail": f"Send 1 to {telemetry.MAX_BATCH} points"}
+                )
+                continue
+            # waiting for room instead of failing slows the sender down to
+            # what the db absorbs
+            try:
+                accepted = await telemetry.add(points, timeout=None)
+            except telemetry.BufferFull:
+                await websocket.close(code=status.WS_1013_TRY_AGAIN_LATER)
+                return
+            await websocket.send_json({"accepted": accepted})
+    except WebSocketDisconnect:
+        pass
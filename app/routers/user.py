@@ -1,28 +1,78 @@
 from typing import Annotated
 
+from aioredis import Redis
 from fastapi import APIRouter, Depends, HTTPException, Path, Response, status
-from fastapi.security import OAuth2PasswordRequestForm
+from fastapi.security import (
+    HTTPAuthorizationCredentials,
+    OAuth2PasswordRequestForm,
+)
+from sqlalchemy.ext.asyncio import AsyncSession
 
-from app.database import fake_users_db
+from app import database
+from app.dependencies.redis import cache
 from app.schemas import Token
-from app.security.oauth2 import create_access_token
-from app.security.utils import authenticate_user
+from app.security.oauth2 import (
+    create_access_token,
+    reusable_oauth2,
+    revoke_access_token,
+)
+from app.security.utils import (
+    authenticate_user,
+    count_failed_login,
+    login_retry_after,
+    reset_failed_logins,
+)
 
 router = APIRouter(prefix="/token", tags=["USER LOGIN"])
 
 
 @router.post("/", response_model=Token)
-async def login(form_data: Annotated[OAuth2PasswordRequestForm, Depends()]):
-    user = authenticate_user(
-        user_db=fake_users_db,
+async def login(
+    form_data: Annotated[OAuth2PasswordRequestForm, Depends()],
+    redis: Redis = Depends(cache),
+    db: AsyncSession = Depends(database.get_db),
+):
+    retry_after = await login_retry_after(redis, form_data.username)
+    if retry_after:
+        raise HTTPException(
+            status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+            detail="Too many login attempts",
+            headers={"Retry-After": str(retry_after)},
+        )
+
+    user = await authenticate_user(
+        db=db,
         username=form_data.username,
         password=form_data.password,
     )
     if not user:
+        # only failures count, so logging in often never locks a user out
+        await count_failed_login(redis, form_data.username)
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Incorrect username or password",
             headers={"WWW-Authenticate": "Bearer"},
         )
-    access_token = create_access_token(data={"sub": user.username})
+    await reset_failed_logins(redis, form_data.username)
+    # the user's fleet rides in the token, so telling fleet users from staff
+    # needs no user lookup
+    access_token = create_access_token(
+        data={
+            "sub": user.username,
+            "fleet": None if user.fleet_id is None else str(user.fleet_id),
+        }
+    )
     return {"access_token": access_token, "token_type": "bearer"}
+
+
+@router.post("/revoke", status_code=status.HTTP_204_NO_CONTENT)
+async def revoke_token(
+    http_authorization_credentials: HTTPAuthorizationCredentials = Depends(
+        reusable_oauth2
+    ),
+    redis: Redis = Depends(cache),
+):
+    await revoke_access_token(
+        http_authorization_credentials.credentials, redis
+    )
+    return Response(status_code=status.HTTP_204_NO_CONTENT)
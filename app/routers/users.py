@@ -0,0 +1,98 @@
+from typing import Annotated
+
+from aioredis import Redis
+from fastapi import APIRouter, Depends, HTTPException, Path, Response, status
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app import database, schemas
+from app.ctrl import users
+from app.dependencies.redis import cache
+from app.security.oauth2 import verify_access_token
+from app.security.utils import hash_password, run_in_hash_pool
+
+
+def require_staff(
+    token_data: schemas.TokenData = Depends(verify_access_token),
+) -> None:
+    # users bound to a fleet cannot manage accounts
+    if token_data.fleet_id is not None:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Not allowed to manage users",
+        )
+
+
+router = APIRouter(
+    prefix="/api/users",
+    tags=["Users"],
+    dependencies=[Depends(require_staff)],
+)
+
+
+@router.post(
+    "/", status_code=status.HTTP_201_CREATED, response_model=schemas.User
+)
+async def create_user(
+    user: schemas.CreateUser,
+    redis: Redis = Depends(cache),
+    db: AsyncSession = Depends(database.get_db),
+):
+    hashed_password = await run_in_hash_pool(hash_password, user.password)
+    try:
+        return await users.create(
+            user=user, hashed_password=hashed_password, redis=redis, db=db
+        )
+    except Exception as exc:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Error create user",
+        ) from exc
+
+
+@router.patch("/{username}", response_model=schemas.User)
+async def update_user(
+    username: Annotated[str, Path(title="The name of the user to update")],
+    user_data: schemas.UpdateUser,
+    redis: Redis = Depends(cache),
+    db: AsyncSession = Depends(database.get_db),
+):
+    try:
+        user = await users.update(
+            username=username, user_data=user_data, redis=redis, db=db
+        )
+    except Exception as exc:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Error update user",
+        ) from exc
+
+    if user is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail=f"User {username} does not exist",
+        )
+
+    return user
+
+
+@router.delete("/{username}", status_code=status.HTTP_204_NO_CONTENT)
+async def delete_user(
+    username: Annotated[str, Path(title="The name of the user to delete")],
+    redis: Redis = Depends(cache),
+    db: AsyncSession = Depends(database.get_db),
+):
+    try:
+        deleted = await users.delete(username=username, redis=redis, db=db)
+    except Exception as exc:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Error delete user",
+        ) from exc
+
+    if not deleted:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail=f"User {username} does not exist",
+        )
+
+    return Response(status_code=status.HTTP_204_NO_CONTENT)
@@ -1,12 +1,33 @@
-from typing import Annotated, List
+from typing import Annotated, Any, Dict, List
 from uuid import UUID
 
 from aioredis import Redis
-from fastapi import APIRouter, Depends, HTTPException, Path, Response, status
-from sqlalchemy.orm import Session
+from fastapi import (
+    APIRouter,
+    Body,
+    Depends,
+    Header,
+    HTTPException,
+    Path,
+    Query,
+    Response,
+    status,
+)
+from fastapi.responses import StreamingResponse
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
 
 from app import database, schemas
-from app.ctrl import fleets, vehicles
+from app.cache import cached_response
+from app.ctrl import (
+    bulk,
+    export,
+    fleets,
+    pagination,
+    positions,
+    vehicles,
+    versions,
+)
 from app.dependencies.redis import cache
 from app.security.oauth2 import verify_access_token
 
@@ -17,6 +38,23 @@ router = APIRouter(
 )
 
 
+async def _check_fleets(fleet_ids, db: AsyncSession) -> None:
+    """Raise a 404 naming the fleets that do not exist."""
+    try:
+        missing_fleets = await fleets.get_missing(fleet_ids, db=db)
+    except Exception as exc:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Error get fleets",
+        ) from exc
+
+    if missing_fleets:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail=f"Fleets {sorted(map(str, missing_fleets))} do not exist",
+        )
+
+
 # vehicles methods
 @router.post(
     "/", status_code=status.HTTP_201_CREATED, response_model=schemas.Vehicle
@@ -25,52 +63,114 @@ async def create_vehicle(
     vehicle: schemas.CreateVehicle,
     fleet_id: UUID,
     redis: Redis = Depends(cache),
-    db: Session = Depends(database.get_db),
+    db: AsyncSession = Depends(database.get_db),
 ):
+    # the foreign key checks the fleet as part of the insert; it is only
+    # looked up when the insert is rejected, to tell why
     try:
-        fleet = await fleets.get(fleet_id=fleet_id, redis=redis, db=db)
+        return await vehicles.create(
+            vehicle=vehicle, owner_id=fleet_id, redis=redis, db=db
+        )
+    except IntegrityError as exc:
+        await db.rollback()
+        await _check_fleets({fleet_id}, db)
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Error create vehicle",
+        ) from exc
     except Exception as exc:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
-            detail="Error get fleet",
+            detail="Error create vehicle",
         ) from exc
 
-    if fleet is None:
+
+@router.post(
+    "/bulk",
+    status_code=status.HTTP_201_CREATED,
+    response_model=List[schemas.Vehicle],
+)
+async def create_vehicles(
+    vehicles_data: Annotated[
+        List[schemas.BulkVehicle],
+        Body(min_length=1, max_length=bulk.MAX_ITEMS),
+    ],
+    upsert: bool = False,
+    redis: Redis = Depends(cache),
+    db: AsyncSession = Depends(database.get_db),
+):
+    if upsert and (
+        repeated := bulk.duplicates(
+            vehicle.vehicle_plate_number for vehicle in vehicles_data
+        )
+    ):
         raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND,
-            detail=f"Fleet with id: {fleet_id} does not exist",
+            status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+            detail=f"Plate numbers {sorted(repeated)} repeated in one upsert",
         )
 
     try:
-        return await vehicles.create(
-            vehicle=vehicle, owner_id=fleet_id, redis=redis, db=db
+        return await vehicles.create_many(
+            vehicles_data=vehicles_data, upsert=upsert, redis=redis, db=db
+        )
+    except IntegrityError as exc:
+        await db.rollback()
+        await _check_fleets(
+            {vehicle.owner_id for vehicle in vehicles_data}, db
         )
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Error create vehicles",
+        ) from exc
     except Exception as exc:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
-            detail="Error create vehicle",
+            detail="Error create vehicles",
         ) from exc
 
 
 @router.get("/", response_model=List[schemas.Vehicle])
 async def get_vehicles(
+    limit: Annotated[
+        int, Query(ge=1, le=pagination.MAX_LIMIT)
+    ] = pagination.DEFAULT_LIMIT,
+    cursor: str | None = None,
+    vehicle_plate_number: str | None = None,
+    if_none_match: Annotated[str | None, Header()] = None,
     redis: Redis = Depends(cache),
-    db: Session = Depends(database.get_db),
+    db: AsyncSession = Depends(database.get_db),
 ):
     try:
-        return await vehicles.get_all(redis=redis, db=db)
+        page = await vehicles.get_all(
+            redis=redis,
+            db=db,
+            limit=limit,
+            cursor=cursor,
+            vehicle_plate_number=vehicle_plate_number,
+        )
     except Exception as exc:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail="Error get all vehicles",
         ) from exc
 
+    headers = {}
+    if page.next_cursor is not None:
+        headers[pagination.NEXT_CURSOR_HEADER] = page.next_cursor
+
+    return cached_response(page, if_none_match, headers=headers)
+
 
 @router.get("/fleet/{fleet_id}", response_model=List[schemas.Vehicle])
 async def get_vehicles_in_fleet(
     fleet_id: Annotated[UUID, Path(title="The fleet ID own the vehicle")],
+    limit: Annotated[
+        int, Query(ge=1, le=pagination.MAX_LIMIT)
+    ] = pagination.DEFAULT_LIMIT,
+    cursor: str | None = None,
+    if_none_match: Annotated[str | None, Header()] = None,
     redis: Redis = Depends(cache),
-    db: Session = Depends(database.get_db),
+    db: AsyncSession = Depends(database.get_db),
 ):
     try:
         fleet = await fleets.get(fleet_id=fleet_id, redis=redis, db=db)
@@ -87,8 +187,8 @@ async def get_vehicles_in_fleet(
         )
 
     try:
-        return await vehicles.get_all_vehicles_in_fleet(
-            fleet_id=fleet_id, redis=redis, db=db
+        page = await vehicles.get_all_vehicles_in_fleet(
+            fleet_id=fleet_id, redis=redis, db=db, limit=limit, cursor=cursor
         )
     except Exception as exc:
         raise HTTPException(
@@ -96,12 +196,101 @@ async def get_vehicles_in_fleet(
             detail=f"Error get all vehicles in fleet {fleet_id}",
         ) from exc
 
+    headers = {}
+    if page.next_cursor is not None:
+        headers[pagination.NEXT_CURSOR_HEADER] = page.next_cursor
+
+    return cached_response(page, if_none_match, headers=headers)
+
+
+@router.get("/nearby", response_model=List[schemas.VehiclePosition])
+async def get_vehicles_nearby(
+    lon: Annotated[float, Query(ge=-180, le=180)],
+    lat: Annotated[
+        float, Query(ge=-positions.MAX_LATITUDE, le=positions.MAX_LATITUDE)
+    ],
+    radius_km: Annotated[float, Query(gt=0, le=500)] = 5,
+    owner_id: UUID | None = None,
+    limit: Annotated[int, Query(ge=1, le=pagination.MAX_LIMIT)] = 50,
+    redis: Redis = Depends(cache),
+):
+    try:
+        return await positions.nearby(
+            lon=lon,
+            lat=lat,
+            radius_km=radius_km,
+            redis=redis,
+            owner_id=owner_id,
+            limit=limit,
+        )
+    except Exception as exc:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Error get nearby vehicles",
+        ) from exc
+
+
+@router.get("/within-bbox", response_model=List[schemas.VehiclePosition])
+async def get_vehicles_within_bbox(
+    min_lon: Annotated[float, Query(ge=-180, le=180)],
+    min_lat: Annotated[
+        float, Query(ge=-positions.MAX_LATITUDE, le=positions.MAX_LATITUDE)
+    ],
+    max_lon: Annotated[float, Query(ge=-180, le=180)],
+    max_lat: Annotated[
+        float, Query(ge=-positions.MAX_LATITUDE, le=positions.MAX_LATITUDE)
+    ],
+    owner_id: UUID | None = None,
+    limit: Annotated[int, Query(ge=1, le=pagination.MAX_LIMIT)] = 50,
+    redis: Redis = Depends(cache),
+):
+    if min_lon >= max_lon or min_lat >= max_lat:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="min_lon and min_lat must be below max_lon and max_lat",
+        )
+
+    try:
+        return await positions.within_bbox(
+            min_lon=min_lon,
+            min_lat=min_lat,
+            max_lon=max_lon,
+            max_lat=max_lat,
+            redis=redis,
+            owner_id=owner_id,
+            limit=limit,
+        )
+    except Exception as exc:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Error get vehicles within bbox",
+        ) from exc
+
+
+@router.get("/export", response_class=StreamingResponse)
+async def export_vehicles(
+    export_format: Annotated[
+        export.ExportFormat, Query(alias="format")
+    ] = export.ExportFormat.ndjson,
+    db: AsyncSession = Depends(database.get_db),
+):
+    return StreamingResponse(
+        vehicles.export_all(export_format=export_format, db=db),
+        media_type=export.MEDIA_TYPES[export_format],
+        headers={
+            "Content-Disposition": (
+                f"attachment; filename=vehicles.{export_format.value}"
+            )
+        },
+    )
+
 
 @router.get("/{vehicle_id}", response_model=schemas.Vehicle)
 async def get_vehicle(
     vehicle_id: Annotated[UUID, Path(title="The ID of the vehicle to get")],
+    if_none_match: Annotated[str | None, Header()] = None,
     redis: Redis = Depends(cache),
-    db: Session = Depends(database.get_db),
+    db: AsyncSession = Depends(database.get_db),
 ):
     try:
         vehicle = await vehicles.get(vehicle_id=vehicle_id, redis=redis, db=db)
@@ -117,70 +306,115 @@ async def get_vehicle(
             detail="Vehicle does not exist",
         )
 
-    return vehicle
+    return cached_response(vehicle, if_none_match)
 
 
 @router.delete("/{vehicle_id}", status_code=status.HTTP_204_NO_CONTENT)
 async def delete_vehicle(
     vehicle_id: Annotated[UUID, Path(title="The ID of the vehicle to delete")],
     redis: Redis = Depends(cache),
-    db: Session = Depends(database.get_db),
+    db: AsyncSession = Depends(database.get_db),
 ):
     try:
-        vehicle = await vehicles.get(vehicle_id=vehicle_id, redis=redis, db=db)
+        deleted = await vehicles.delete(
+            vehicle_id=vehicle_id, redis=redis, db=db
+        )
     except Exception as exc:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
-            detail="Error get vehicle",
+            detail="Error delete vehicle",
         ) from exc
 
-    if vehicle is None:
+    if not deleted:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail=f"Vehicle {vehicle_id} does not exist",
         )
 
+    return Response(status_code=status.HTTP_204_NO_CONTENT)
+
+
+async def _update_vehicle(
+    vehicle_id: UUID,
+    changes: Dict[str, Any],
+    if_match: str | None,
+    response: Response,
+    redis: Redis,
+    db: AsyncSession,
+) -> schemas.Vehicle:
+    if_match_versions = versions.parse_if_match(if_match)
     try:
-        await vehicles.delete(vehicle_id=vehicle_id, redis=redis, db=db)
+        updated = await vehicles.update(
+            vehicle_id=vehicle_id,
+            changes=changes,
+            redis=redis,
+            db=db,
+            if_match=if_match_versions,
+        )
     except Exception as exc:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
-            detail="Error delete vehicle",
+            detail="Error update vehicle",
         ) from exc
 
-    return Response(status_code=status.HTTP_204_NO_CONTENT)
+    if updated is None:
+        # nothing matched: the vehicle is gone, or If-Match is out of date
+        if if_match_versions is not None:
+            try:
+                vehicle = await vehicles.get(
+                    vehicle_id=vehicle_id, redis=redis, db=db
+                )
+            except Exception as exc:
+                raise HTTPException(
+                    status_code=status.HTTP_400_BAD_REQUEST,
+                    detail="Error get vehicle",
+                ) from exc
+
+            if vehicle is not None:
+                raise HTTPException(
+                    status_code=status.HTTP_412_PRECONDITION_FAILED,
+                    detail="Vehicle has been modified",
+                )
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Vehicle does not exist",
+        )
+
+    vehicle, version = updated
+    response.headers[versions.ETAG_HEADER] = versions.etag(version)
+    return vehicle
 
 
 @router.put("/{vehicle_id}", response_model=schemas.Vehicle)
 async def update_vehicle(
     vehicle_id: Annotated[UUID, Path(title="The ID of the vehicle to update")],
     vehicle_data: schemas.CreateVehicle,
+    response: Response,
+    if_match: Annotated[str | None, Header()] = None,
     redis: Redis = Depends(cache),
-    db: Session = Depends(database.get_db),
+    db: AsyncSession = Depends(database.get_db),
 ):
-    try:
-        vehicle = await vehicles.get(vehicle_id=vehicle_id, redis=redis, db=db)
-    except Exception as exc:
-        raise HTTPException(
-            status_code=status.HTTP_400_BAD_REQUEST,
-            detail="Error get vehicle",
-        ) from exc
+    return await _update_vehicle(
+        vehicle_id, vehicle_data.model_dump(), if_match, response, redis, db
+    )
 
-    if vehicle is None:
-        raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND,
-            detail="Vehicle does not exist",
-        )
 
-    try:
-        return await vehicles.update(
-            vehicle_data=vehicle_data,
-            vehicle_id=vehicle_id,
-            redis=redis,
-            db=db,
-        )
-    except Exception as exc:
+@router.patch("/{vehicle_id}", response_model=schemas.Vehicle)
+async def patch_vehicle(
+    vehicle_id: Annotated[UUID, Path(title="The ID of the vehicle to update")],
+    vehicle_data: schemas.UpdateVehicle,
+    response: Response,
+    if_match: Annotated[str | None, Header()] = None,
+    redis: Redis = Depends(cache),
+    db: AsyncSession = Depends(database.get_db),
+):
+    changes = vehicle_data.model_dump(exclude_unset=True)
+    if not changes:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
-            detail="Error update vehicle",
-        ) from exc
+            detail="Nothing to update",
+        )
+
+    return await _update_vehicle(
+        vehicle_id, changes, if_match, response, redis, db
+    )
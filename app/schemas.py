@@ -1,8 +1,17 @@
 import datetime as dt
-from typing import Optional
+from typing import Annotated, List, Literal, Optional, Tuple
 from uuid import UUID
 
-from pydantic import BaseModel, ConfigDict, Field
+from pydantic import (
+    AwareDatetime,
+    BaseModel,
+    ConfigDict,
+    Field,
+    field_validator,
+    model_validator,
+)
+
+from app.config import settings
 
 
 class BaseFleet(BaseModel):
@@ -24,6 +33,15 @@ class CreateFleet(BaseFleet):
     pass
 
 
+class UpdateFleet(BaseModel):
+    model_config = ConfigDict(populate_by_name=True)
+    # omitted fields keep their value; an explicit null is not a str, so it
+    # is refused with a 422 instead of being written as NULL
+    fleet_name: str = Field(default=None, alias="name")
+    fleet_info: str = Field(default=None, alias="info")
+    phone_number: str = Field(default=None, alias="phone")
+
+
 class BaseVehicle(BaseModel):
     model_config = ConfigDict(populate_by_name=True)
     vehicle_brand: str = Field(alias="brand")
@@ -43,6 +61,16 @@ class CreateVehicle(BaseVehicle):
     pass
 
 
+class UpdateVehicle(BaseModel):
+    model_config = ConfigDict(populate_by_name=True)
+    vehicle_brand: str = Field(default=None, alias="brand")
+    vehicle_plate_number: str = Field(default=None, alias="plate")
+
+
+class BulkVehicle(CreateVehicle):
+    owner_id: UUID = Field(alias="owner_uuid")
+
+
 class BaseDriver(BaseModel):
     model_config = ConfigDict(populate_by_name=True)
     driver_name: str = Field(alias="name")
@@ -61,10 +89,33 @@ class CreateDriver(BaseDriver):
     pass
 
 
+class UpdateDriver(BaseModel):
+    model_config = ConfigDict(populate_by_name=True)
+    driver_name: str = Field(default=None, alias="name")
+    phone_number: str = Field(default=None, alias="phone")
+
+
+def _check_window(
+    starts_at: dt.datetime | None, ends_at: dt.datetime | None
+) -> None:
+    if starts_at is not None and ends_at is not None and ends_at <= starts_at:
+        raise ValueError("ends_at must be after starts_at")
+
+
 class BaseRoute(BaseModel):
     model_config = ConfigDict(populate_by_name=True)
     route_name: str = Field(alias="name")
     route_info: str = Field(alias="info")
+    # scheduled window, [starts_at, ends_at); unscheduled when both unset
+    starts_at: AwareDatetime | None = None
+    ends_at: AwareDatetime | None = None
+
+    @model_validator(mode="after")
+    def check_window(self):
+        if (self.starts_at is None) != (self.ends_at is None):
+            raise ValueError("set both starts_at and ends_at, or neither")
+        _check_window(self.starts_at, self.ends_at)
+        return self
 
 
 class Route(BaseRoute):
@@ -72,13 +123,103 @@ class Route(BaseRoute):
     date_created: dt.datetime = Field(alias="date")
     driver_id: UUID = Field(alias="driver_uuid")
     vehicle_id: UUID = Field(alias="vehicle_uuid")
+    # length of the geometry, and the time to drive it
+    distance_m: float | None = None
+    duration_s: float | None = None
 
     class Config:
         from_attributes = True
 
 
+class RouteWithGeometry(Route):
+    # encoded polyline of the route's (lat, lon) points
+    geometry: str | None = None
+
+
+Latitude = Annotated[float, Field(ge=-90, le=90)]
+Longitude = Annotated[float, Field(ge=-180, le=180)]
+Coordinates = List[Tuple[Latitude, Longitude]]
+
+
 class CreateRoute(BaseRoute):
-    pass
+    # stored as an encoded polyline
+    geometry: Coordinates | None = None
+
+
+class UpdateRoute(BaseModel):
+    model_config = ConfigDict(populate_by_name=True)
+    route_name: str = Field(default=None, alias="name")
+    route_info: str = Field(default=None, alias="info")
+    # null clears the geometry, and with it the distance and duration
+    geometry: Coordinates | None = None
+    starts_at: AwareDatetime | None = None
+    ends_at: AwareDatetime | None = None
+
+    @model_validator(mode="after")
+    def check_window(self):
+        _check_window(self.starts_at, self.ends_at)
+        return self
+
+
+class BulkRoute(CreateRoute):
+    driver_id: UUID = Field(alias="driver_uuid")
+    vehicle_id: UUID = Field(alias="vehicle_uuid")
+
+
+class RouteAssignment(BaseModel):
+    model_config = ConfigDict(populate_by_name=True)
+    # set when an existing route is being rescheduled
+    route_id: UUID | None = Field(default=None, alias="uuid")
+    driver_id: UUID = Field(alias="driver_uuid")
+    vehicle_id: UUID = Field(alias="vehicle_uuid")
+    starts_at: AwareDatetime
+    ends_at: AwareDatetime
+
+    @model_validator(mode="after")
+    def check_window(self):
+        _check_window(self.starts_at, self.ends_at)
+        return self
+
+
+class RouteConflict(BaseModel):
+    model_config = ConfigDict(populate_by_name=True)
+    resource: Literal["driver", "vehicle"]
+    resource_id: UUID = Field(alias="resource_uuid")
+    # index of a clashing assignment in the checked list
+    assignment: int
+    # index of the other one, or uuid of the stored route it clashes with
+    conflicts_with: int | UUID
+
+
+class TelemetryPoint(BaseModel):
+    model_config = ConfigDict(populate_by_name=True)
+    vehicle_id: UUID = Field(alias="vehicle_uuid")
+    ts: AwareDatetime
+    lat: float = Field(ge=-90, le=90)
+    lon: float = Field(ge=-180, le=180)
+    speed: float = Field(ge=0)
+    heading: float = Field(ge=0, lt=360)
+
+    @field_validator("ts")
+    @classmethod
+    def check_ts(cls, ts: dt.datetime) -> dt.datetime:
+        # a point dated past the partitions created ahead would land in the
+        # default partition, and then block creating the one of its day
+        now = dt.datetime.now(dt.timezone.utc)
+        if ts > now + dt.timedelta(seconds=settings.telemetry_max_clock_skew):
+            raise ValueError("ts is in the future")
+        if ts < now - dt.timedelta(days=settings.telemetry_max_age_days):
+            raise ValueError("ts is too old")
+        return ts
+
+
+class VehiclePosition(BaseModel):
+    model_config = ConfigDict(populate_by_name=True)
+    vehicle_id: UUID = Field(alias="vehicle_uuid")
+    lon: float
+    lat: float
+    # from the searched point, or from the centre of the searched box
+    distance_km: float
 
 
 class Token(BaseModel):
@@ -88,13 +229,26 @@ class Token(BaseModel):
 
 class TokenData(BaseModel):
     username: str | None = None
+    # the fleet of a fleet user, None for staff; it only keeps fleet users
+    # out of account management, and does not limit the fleet data they reach
+    fleet_id: UUID | None = None
 
 
 class User(BaseModel):
+    model_config = ConfigDict(from_attributes=True)
     username: str
     email: str | None = None
     full_name: str | None = None
     disabled: bool | None = None
+    fleet_id: UUID | None = None
+
+
+class CreateUser(User):
+    password: str
+
+
+class UpdateUser(BaseModel):
+    disabled: bool
 
 
 class UserInDB(User):
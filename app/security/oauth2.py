@@ -1,11 +1,18 @@
+import hashlib
+import time
 from datetime import datetime, timedelta
 
+from aioredis import Redis
 from fastapi import Depends, HTTPException, status
-from fastapi.security import HTTPBearer
+from fastapi.security import HTTPAuthorizationCredentials, HTTPBearer
 from jose import JWTError, jwt
 from pydantic import ValidationError
+from sqlalchemy.ext.asyncio import AsyncSession
 
+from app import cache, database, schemas
 from app.config import settings
+from app.ctrl import users
+from app.dependencies.redis import cache as get_redis
 
 reusable_oauth2 = HTTPBearer(scheme_name="Authorization")
 
@@ -26,27 +33,86 @@ def create_access_token(data: dict):
     return encoded_jwt
 
 
-def verify_access_token(
-    http_authorization_credentials=Depends(reusable_oauth2),
-) -> str:
+def _credentials_exception() -> HTTPException:
+    return HTTPException(
+        status_code=status.HTTP_401_UNAUTHORIZED,
+        detail="Could not validate credentials",
+        headers={"WWW-Authenticate": "Bearer"},
+    )
+
+
+def _token_key(token: str) -> str:
+    # the local cache and the denylist never hold the token itself
+    return f"token_{hashlib.sha256(token.encode()).hexdigest()}"
+
+
+def _decode(token: str) -> dict:
     try:
-        payload = jwt.decode(
-            http_authorization_credentials.credentials,
-            SECRET_KEY,
-            algorithms=[ALGORITHM],
-        )
-        username = payload.get("sub")
-        if username is None:
-            raise HTTPException(
-                status_code=status.HTTP_401_UNAUTHORIZED,
-                detail="Could not validate credentials",
-                headers={"WWW-Authenticate": "Bearer"},
-            )
+        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
     except (JWTError, ValidationError) as exc:
-        raise HTTPException(
-            status_code=status.HTTP_401_UNAUTHORIZED,
-            detail="Could not validate credentials",
-            headers={"WWW-Authenticate": "Bearer"},
-        ) from exc
+        raise _credentials_exception() from exc
+    if payload.get("sub") is None:
+        raise _credentials_exception()
+    return payload
+
+
+async def verify_access_token(
+    http_authorization_credentials: HTTPAuthorizationCredentials = Depends(
+        reusable_oauth2
+    ),
+    redis: Redis = Depends(get_redis),
+    db: AsyncSession = Depends(database.get_db),
+) -> schemas.TokenData:
+    """
+    Return the claims of a valid, unrevoked token of an enabled user.
+    Verified tokens are kept in the local cache until they expire, so a
+    client presenting the same token again costs a hash and a dict lookup
+    instead of a signature check and a Redis round-trip;
+    revoke_access_token evicts them everywhere.
+    """
+    key = _token_key(http_authorization_credentials.credentials)
+    if (claims := cache.local.get(key)) is None:
+        claims = await _verify(
+            http_authorization_credentials.credentials, key, redis
+        )
+    token_data = schemas.TokenData.model_validate_json(claims)
+    # the user is usually in the local cache too, which every worker drops
+    # once the user is disabled or deleted
+    user = await users.get(token_data.username, redis=redis, db=db)
+    if user is None or user.disabled:
+        raise _credentials_exception()
+    return token_data
+
+
+async def _verify(token: str, key: str, redis: Redis) -> bytes:
+    """Check a token not seen before, and cache its claims."""
+    generation = cache.local.generation
+    payload = _decode(token)
+    if await redis.exists(f"revoked_{key}"):
+        raise _credentials_exception()
+    claims = (
+        schemas.TokenData(
+            username=payload["sub"], fleet_id=payload.get("fleet")
+        )
+        .model_dump_json()
+        .encode()
+    )
+    cache.local.set(
+        key,
+        claims,
+        generation,
+        ttl=payload["exp"] - time.time() if "exp" in payload else None,
+    )
+    return claims
+
 
-    return username
+async def revoke_access_token(token: str, redis: Redis) -> None:
+    """Deny ``token`` until it expires, in every worker."""
+    key = _token_key(token)
+    exp = _decode(token).get("exp")
+    await redis.set(
+        f"revoked_{key}",
+        1,
+        ex=None if exp is None else max(int(exp - time.time()), 1),
+    )
+    await cache.invalidate(redis, key)
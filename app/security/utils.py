@@ -1,9 +1,18 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+
 from passlib.context import CryptContext
 
-from app.schemas import UserInDB
+from app.config import settings
+from app.ctrl import users
 
 pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 
+# bcrypt releases the GIL, so threads verify passwords in parallel
+_hash_executor = ThreadPoolExecutor(
+    max_workers=settings.login_hash_workers, thread_name_prefix="bcrypt"
+)
+
 
 def hash_password(password: str) -> str:
     return pwd_context.hash(password)
@@ -13,16 +22,47 @@ def verify(plain_password, hashed_password) -> bool:
     return pwd_context.verify(plain_password, hashed_password)
 
 
-def get_user(db, username: str):
-    if username in db:
-        user_dict = db[username]
-        return UserInDB(**user_dict)
+async def run_in_hash_pool(func, *args):
+    return await asyncio.get_running_loop().run_in_executor(
+        _hash_executor, func, *args
+    )
 
 
-def authenticate_user(user_db, username: str, password: str):
-    user = get_user(user_db, username)
-    if not user:
+async def authenticate_user(db, username: str, password: str):
+    user = await users.get_in_db(username, db=db)
+    if not user or user.disabled:
         return False
-    if not verify(password, user.hashed_password):
+    if not await run_in_hash_pool(verify, password, user.hashed_password):
         return False
     return user
+
+
+def _failed_logins_key(username: str) -> str:
+    return f"failed_logins_{username}"
+
+
+async def login_retry_after(redis, username: str) -> int:
+    """
+    Returns 0 while ``username`` has fewer than login_rate_limit failed
+    logins in the current fixed window, else the seconds until it ends.
+    """
+    pipe = redis.pipeline(transaction=True)
+    pipe.get(_failed_logins_key(username))
+    pipe.ttl(_failed_logins_key(username))
+    failures, ttl = await pipe.execute()
+    if failures is None or int(failures) < settings.login_rate_limit:
+        return 0
+    return max(ttl, 1)
+
+
+async def count_failed_login(redis, username: str) -> None:
+    """Count a failed login, opening a window if none is running."""
+    key = _failed_logins_key(username)
+    pipe = redis.pipeline(transaction=True)
+    pipe.set(key, 0, ex=settings.login_rate_window, nx=True)
+    pipe.incr(key)
+    await pipe.execute()
+
+
+async def reset_failed_logins(redis, username: str) -> None:
+    await redis.delete(_failed_logins_key(username))
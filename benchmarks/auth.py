@@ -0,0 +1,34 @@
+"""
+auth.py
+per-request cost of checking a bearer token, with and without the cache of
+verified tokens
+
+run from the repo root, with app.env in place:
+    python -m benchmarks.auth
+"""
+
+import timeit
+
+from app import cache
+from app.security.oauth2 import _decode, _token_key, create_access_token
+
+ROUNDS = 20_000
+
+
+def main() -> None:
+    token = create_access_token({"sub": "bao"})
+    cache.local.set(_token_key(token), b"bao", cache.local.generation)
+
+    for name, check in [
+        ("signature check (uncached)", lambda: _decode(token)["sub"]),
+        (
+            "verified token cache hit",
+            lambda: cache.local.get(_token_key(token)).decode(),
+        ),
+    ]:
+        seconds = timeit.timeit(check, number=ROUNDS)
+        print(f"{name:<28}{seconds / ROUNDS * 1e6:>8.1f} us")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,102 @@
+"""
+list_endpoints.py
+serialization time and bytes on the wire of a vehicles / routes list page,
+for each way the API has rendered one
+
+run from the repo root, with app.env in place:
+    python -m benchmarks.list_endpoints
+"""
+
+import datetime as dt
+import gzip
+import timeit
+from types import SimpleNamespace
+from typing import List
+from uuid import uuid4
+
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse, ORJSONResponse
+from pydantic import TypeAdapter
+
+from app import schemas
+from app.cache import Codec
+from app.config import settings
+
+PAGE_SIZES = [100, 1000]
+ROUNDS = 20
+
+
+def vehicles(count: int) -> List[SimpleNamespace]:
+    return [
+        SimpleNamespace(
+            id=uuid4(),
+            vehicle_brand="Toyota Hiace",
+            vehicle_plate_number=f"51B-{index:05}",
+            date_created=dt.datetime.now(dt.timezone.utc),
+            owner_id=uuid4(),
+        )
+        for index in range(count)
+    ]
+
+
+def routes(count: int) -> List[SimpleNamespace]:
+    return [
+        SimpleNamespace(
+            id=uuid4(),
+            route_name=f"Route {index}",
+            route_info="District 1 -> Tan Son Nhat, via Nam Ky Khoi Nghia",
+            date_created=dt.datetime.now(dt.timezone.utc),
+            driver_id=uuid4(),
+            vehicle_id=uuid4(),
+        )
+        for index in range(count)
+    ]
+
+
+def renderers(schema):
+    adapter = TypeAdapter(List[schema])
+    codec = Codec(List[schema])
+
+    def response_model(rows):
+        # what FastAPI does for a response_model before rendering
+        return jsonable_encoder(
+            adapter.dump_python(
+                adapter.validate_python(rows, from_attributes=True),
+                mode="json",
+                by_alias=True,
+            )
+        )
+
+    return {
+        "JSONResponse": lambda rows: JSONResponse(response_model(rows)).body,
+        "ORJSONResponse": lambda rows: ORJSONResponse(
+            response_model(rows)
+        ).body,
+        "Codec (cache miss)": codec.dump,
+    }
+
+
+def main() -> None:
+    print(f"{'page':<18}{'renderer':<20}{'ms':>8}{'bytes':>10}{'gzip':>9}")
+    for name, schema, make_rows in [
+        ("vehicles", schemas.Vehicle, vehicles),
+        ("routes", schemas.Route, routes),
+    ]:
+        for size in PAGE_SIZES:
+            rows = make_rows(size)
+            for renderer, render in renderers(schema).items():
+                seconds = timeit.timeit(lambda: render(rows), number=ROUNDS)
+                body = render(rows)
+                compressed = gzip.compress(
+                    body, compresslevel=settings.gzip_compresslevel
+                )
+                print(
+                    f"{f'{name} x{size}':<18}{renderer:<20}"
+                    f"{seconds / ROUNDS * 1000:>8.2f}"
+                    f"{len(body):>10}{len(compressed):>9}"
+                )
+    print("a cache hit sends the stored bytes as they are: 0 ms to render")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,58 @@
+"""
+telemetry.py
+points per second written to the telemetry table by one COPY flush,
+against inserting the same batch with executemany
+
+run from the repo root, with app.env in place and the tables created:
+    python -m benchmarks.telemetry
+"""
+
+import asyncio
+import datetime as dt
+import time
+from uuid import uuid4
+
+from app.ctrl import telemetry
+from app.database import async_engine
+from app.models import telemetry as telemetry_table
+
+BATCH_SIZES = [1_000, 20_000]
+
+
+def records(count: int) -> list:
+    now = dt.datetime.now(dt.timezone.utc)
+    vehicle_ids = [uuid4() for _ in range(100)]
+    return [
+        (
+            vehicle_ids[index % 100],
+            now + dt.timedelta(milliseconds=index),
+            10.77,
+            106.7,
+            42.0,
+            90.0,
+        )
+        for index in range(count)
+    ]
+
+
+async def insert(batch: list) -> None:
+    async with async_engine.begin() as connection:
+        await connection.execute(
+            telemetry_table.insert(),
+            [dict(zip(telemetry.COLUMNS, record)) for record in batch],
+        )
+
+
+async def main() -> None:
+    for size in BATCH_SIZES:
+        batch = records(size)
+        for name, write in [("COPY", telemetry.copy), ("INSERT", insert)]:
+            start = time.perf_counter()
+            await write(batch)
+            seconds = time.perf_counter() - start
+            print(f"{name:<8}{size:>8} points{size / seconds:>12,.0f} /s")
+    await async_engine.dispose()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -1,12 +1,17 @@
+from contextlib import asynccontextmanager
+
 import pytest
 from fastapi.testclient import TestClient
 from sqlalchemy import create_engine
 from sqlalchemy.orm import sessionmaker
 
-from app import models
+from app import cache, models
 from app.config import settings
-from app.database import Base, get_db
+from app.database import Base, SyncSession, get_db
+from app.dependencies import redis
 from app.main import app
+from app.security.oauth2 import create_access_token
+from app.security.utils import hash_password
 
 username = settings.database_username
 password = settings.database_password
@@ -37,17 +42,36 @@ def session():
 
 
 @pytest.fixture
-def client(session):
+def client(session, test_user):
     # run code before run test
     def override_get_db():
         try:
-            yield session
+            yield SyncSession(session)
         finally:
             session.close()
 
     app.dependency_overrides[get_db] = override_get_db
 
-    yield TestClient(app)
+    # the telemetry flusher writes to the test db too, in its own sessions
+    @asynccontextmanager
+    async def telemetry_session():
+        db = SyncSession(TestingSessionLocal())
+        try:
+            yield db
+        finally:
+            await db.close()
+
+    app.state.telemetry_engine = engine
+    app.state.telemetry_session = telemetry_session
+
+    with TestClient(app) as client:
+        # the db is recreated per test, so start from an empty cache too
+        client.portal.call(redis.redis.flushdb)
+        cache.local.clear()
+        client.headers["Authorization"] = (
+            f"Bearer {create_access_token({'sub': 'bao'})}"
+        )
+        yield client
     # run code after test finishes
 
 
@@ -81,3 +105,20 @@ def test_fleets(session):
 
     fleets = session.query(models.Fleet).all()
     return fleets
+
+
+# hashed once, bcrypt is slow on purpose
+PASSWORD = "secret"
+HASHED_PASSWORD = hash_password(PASSWORD)
+
+
+@pytest.fixture
+def test_user(session):
+    user = models.User(
+        username="bao",
+        full_name="bao hua",
+        hashed_password=HASHED_PASSWORD,
+    )
+    session.add(user)
+    session.commit()
+    return user
@@ -0,0 +1,45 @@
+# test_cache.py
+
+import json
+import time
+
+from fastapi.testclient import TestClient
+
+from app import cache
+from app.config import settings
+from app.dependencies import redis
+from app.main import app
+
+
+def wait_for(condition, timeout: float = 5.0) -> bool:
+    deadline = time.monotonic() + timeout
+    while not condition():
+        if time.monotonic() > deadline:
+            return False
+        time.sleep(0.05)
+    return True
+
+
+def test_invalidation_listener_survives_quiet_channel(monkeypatch):
+    monkeypatch.setattr(settings, "redis_socket_timeout", 0.5)
+    with TestClient(app) as client:
+
+        def subscribed() -> bool:
+            ((_, listeners),) = client.portal.call(
+                redis.redis.pubsub_numsub, cache.INVALIDATION_CHANNEL
+            )
+            return listeners == 1
+
+        # the listener clears the local cache once it has subscribed
+        assert wait_for(subscribed)
+        time.sleep(0.2)
+        cache.local.set("key", b"value", cache.local.generation)
+        # well past the socket timeout, without a message
+        time.sleep(1.5)
+        assert cache.local.get("key") == b"value"
+        client.portal.call(
+            redis.redis.publish,
+            cache.INVALIDATION_CHANNEL,
+            json.dumps(["key"]),
+        )
+        assert wait_for(lambda: cache.local.get("key") is None)
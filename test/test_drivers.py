@@ -0,0 +1,46 @@
+# test_drivers.py
+
+from uuid import uuid4
+
+import pytest
+
+from app import models, schemas
+
+
+@pytest.fixture
+def test_driver(session):
+    driver = models.Driver(driver_name="Bao", phone_number="0901")
+    session.add(driver)
+    session.commit()
+    return schemas.Driver.model_validate(driver)
+
+
+def test_update_driver_refreshes_cache(client, test_driver):
+    assert client.get(f"/api/drivers/{test_driver.id}").json()["name"] == "Bao"
+    assert [d["name"] for d in client.get("/api/drivers/").json()] == ["Bao"]
+    ret = client.put(
+        f"/api/drivers/{test_driver.id}", json={"name": "Hua", "phone": "0902"}
+    )
+    assert ret.status_code == 200
+    assert ret.json()["phone"] == "0902"
+    assert client.get(f"/api/drivers/{test_driver.id}").json()["name"] == "Hua"
+    assert [d["name"] for d in client.get("/api/drivers/").json()] == ["Hua"]
+
+
+def test_delete_driver_refreshes_cache(client, test_driver):
+    client.get(f"/api/drivers/{test_driver.id}")
+    client.get("/api/drivers/")
+    ret = client.delete(f"/api/drivers/{test_driver.id}")
+    assert ret.status_code == 204
+    assert client.get(f"/api/drivers/{test_driver.id}").status_code == 404
+    assert client.get("/api/drivers/").json() == []
+    # nothing left to delete
+    ret = client.delete(f"/api/drivers/{test_driver.id}")
+    assert ret.status_code == 404
+
+
+def test_update_unknown_driver(client, test_driver):
+    ret = client.put(
+        f"/api/drivers/{uuid4()}", json={"name": "Hua", "phone": "0902"}
+    )
+    assert ret.status_code == 404
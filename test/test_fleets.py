@@ -5,6 +5,7 @@ from uuid import uuid4
 import pytest
 
 from app import schemas
+from app.dependencies import redis
 
 
 @pytest.mark.parametrize(
@@ -72,6 +73,39 @@ def test_get_fleets(client, test_fleets):
     assert ret.status_code == 200
 
 
+def test_get_fleets_paginated(client, test_fleets):
+    ret = client.get("/api/fleets/", params={"limit": 2})
+    assert ret.status_code == 200
+    first_page = [schemas.Fleet(**fleet).id for fleet in ret.json()]
+    assert len(first_page) == 2
+    cursor = ret.headers["X-Next-Cursor"]
+
+    ret = client.get("/api/fleets/", params={"limit": 2, "cursor": cursor})
+    assert ret.status_code == 200
+    second_page = [schemas.Fleet(**fleet).id for fleet in ret.json()]
+    assert "X-Next-Cursor" not in ret.headers
+    assert set(first_page + second_page) == {fleet.id for fleet in test_fleets}
+
+
+def test_get_fleets_pages_expire(client, test_fleets):
+    client.get("/api/fleets/", params={"limit": 2})
+    client.portal.call(redis.redis.expire, "fleets", 10)
+    # caching another page must not keep the first one alive longer
+    client.get("/api/fleets/", params={"limit": 1})
+    assert 0 < client.portal.call(redis.redis.ttl, "fleets") <= 10
+
+
+def test_get_fleets_filtered(client, test_fleets):
+    ret = client.get("/api/fleets/", params={"phone_number": "114"})
+    assert ret.status_code == 200
+    assert [fleet["name"] for fleet in ret.json()] == ["Team B"]
+
+
+def test_get_fleets_bad_cursor(client, test_fleets):
+    ret = client.get("/api/fleets/", params={"cursor": "not-a-cursor"})
+    assert ret.status_code == 400
+
+
 def test_get_fleet(client, test_fleets):
     ret = client.get(f"/api/fleets/{test_fleets[0].id}")
     assert ret.status_code == 200
@@ -140,3 +174,169 @@ def test_update_fleet_error(
     )
     assert ret.status_code == status_code
     assert ret.json().get("detail") == "Error update fleet"
+
+
+def test_patch_fleet(client, test_fleets):
+    fleet = schemas.Fleet.model_validate(test_fleets[1])
+    ret = client.patch(f"/api/fleets/{fleet.id}", json={"fleet_info": "SGN"})
+    assert ret.status_code == 200
+    assert ret.headers["etag"] == '"2"'
+    patched_fleet = schemas.Fleet(**ret.json())
+    assert patched_fleet.fleet_info == "SGN"
+    assert patched_fleet.fleet_name == fleet.fleet_name
+    assert patched_fleet.phone_number == fleet.phone_number
+
+
+def test_patch_fleet_null(client, test_fleets):
+    fleet_uuid = test_fleets[1].id
+    ret = client.patch(f"/api/fleets/{fleet_uuid}", json={"name": None})
+    assert ret.status_code == 422
+    ret = client.get(f"/api/fleets/{fleet_uuid}")
+    assert ret.headers["etag"] == '"1"'
+    assert schemas.Fleet(**ret.json()).fleet_name == "Team B"
+
+
+def test_patch_fleet_if_match(client, test_fleets):
+    fleet_uuid = test_fleets[1].id
+    ret = client.patch(
+        f"/api/fleets/{fleet_uuid}",
+        json={"fleet_info": "SGN"},
+        headers={"If-Match": '"1"'},
+    )
+    assert ret.status_code == 200
+    ret = client.patch(
+        f"/api/fleets/{fleet_uuid}",
+        json={"fleet_info": "HAN"},
+        headers={"If-Match": '"1"'},
+    )
+    assert ret.status_code == 412
+    ret = client.patch(
+        f"/api/fleets/{uuid4()}",
+        json={"fleet_info": "HAN"},
+        headers={"If-Match": '"1"'},
+    )
+    assert ret.status_code == 404
+
+
+def test_get_fleet_not_modified(client, test_fleets):
+    fleet_uuid = test_fleets[0].id
+    ret = client.get(f"/api/fleets/{fleet_uuid}")
+    assert ret.headers["etag"] == '"1"'
+    ret = client.get(
+        f"/api/fleets/{fleet_uuid}", headers={"If-None-Match": '"1"'}
+    )
+    assert ret.status_code == 304
+    assert ret.content == b""
+    client.patch(f"/api/fleets/{fleet_uuid}", json={"fleet_info": "SGN"})
+    ret = client.get(
+        f"/api/fleets/{fleet_uuid}", headers={"If-None-Match": '"1"'}
+    )
+    assert ret.status_code == 200
+    assert ret.headers["etag"] == '"2"'
+
+
+def test_get_fleets_not_modified(client, test_fleets):
+    etag = client.get("/api/fleets/").headers["etag"]
+    ret = client.get("/api/fleets/", headers={"If-None-Match": etag})
+    assert ret.status_code == 304
+    client.patch(f"/api/fleets/{test_fleets[0].id}", json={"fleet_info": "x"})
+    ret = client.get("/api/fleets/", headers={"If-None-Match": etag})
+    assert ret.status_code == 200
+    assert ret.headers["etag"] != etag
+
+
+def test_create_fleets_bulk(client, test_fleets):
+    ret = client.post(
+        "/api/fleets/bulk",
+        json=[
+            {"fleet_name": "Team X", "fleet_info": "NYC", "phone_number": "1"},
+            {"fleet_name": "Team Y", "fleet_info": "BKK", "phone_number": "2"},
+        ],
+    )
+    assert ret.status_code == 201
+    assert [schemas.Fleet(**fleet).fleet_name for fleet in ret.json()] == [
+        "Team X",
+        "Team Y",
+    ]
+    ret = client.get("/api/fleets/")
+    assert len(ret.json()) == len(test_fleets) + 2
+
+
+def test_create_fleets_bulk_in_order(client, test_fleets):
+    # more rows than one insertmanyvalues batch
+    names = [f"Team {index}" for index in range(1500)]
+    ret = client.post(
+        "/api/fleets/bulk",
+        json=[
+            {"fleet_name": name, "fleet_info": "NYC", "phone_number": name}
+            for name in names
+        ],
+    )
+    assert ret.status_code == 201
+    assert [fleet["name"] for fleet in ret.json()] == names
+
+
+def test_upsert_fleets_bulk(client, test_fleets):
+    fleet_uuid = test_fleets[0].id
+    ret = client.post(
+        "/api/fleets/bulk",
+        params={"upsert": True},
+        json=[
+            {
+                "fleet_name": "Team Z",
+                "fleet_info": "SGN",
+                "phone_number": "113",
+            }
+        ],
+    )
+    assert ret.status_code == 201
+    assert schemas.Fleet(**ret.json()[0]).id == fleet_uuid
+    ret = client.get(f"/api/fleets/{fleet_uuid}")
+    assert schemas.Fleet(**ret.json()).fleet_name == "Team Z"
+
+
+def test_upsert_fleets_bulk_repeated_key(client, test_fleets):
+    ret = client.post(
+        "/api/fleets/bulk",
+        params={"upsert": True},
+        json=[
+            {"fleet_name": "Team X", "fleet_info": "NYC", "phone_number": "1"},
+            {"fleet_name": "Team Y", "fleet_info": "BKK", "phone_number": "1"},
+        ],
+    )
+    # rather than return one fleet for the two sent
+    assert ret.status_code == 422
+    ret = client.get("/api/fleets/")
+    assert len(ret.json()) == len(test_fleets)
+
+
+def test_create_fleets_bulk_error(client, test_fleets):
+    ret = client.post(
+        "/api/fleets/bulk",
+        json=[
+            {
+                "fleet_name": "Team X",
+                "fleet_info": "NYC",
+                "phone_number": "113",
+            }
+        ],
+    )
+    assert ret.status_code == 400
+    assert ret.json().get("detail") == "Error create fleets"
+
+
+def test_get_unknown_fleet_cached(client, test_fleets):
+    random_uuid = uuid4()
+    ret = client.get(f"/api/fleets/{random_uuid}")
+    assert ret.status_code == 404
+
+    def negative_hits():
+        stats = client.get("/api/stats/cache").json()
+        return stats.get("negative_hits", 0) + stats.get(
+            "local_negative_hits", 0
+        )
+
+    before = negative_hits()
+    ret = client.get(f"/api/fleets/{random_uuid}")
+    assert ret.status_code == 404
+    assert negative_hits() == before + 1
@@ -0,0 +1,56 @@
+# test_geometry.py
+
+import math
+
+import numpy as np
+import pytest
+
+from app.ctrl import geometry
+
+# the example of the polyline format's documentation
+POINTS = [(38.5, -120.2), (40.7, -120.95), (43.252, -126.453)]
+POLYLINE = "_p~iF~ps|U_ulLnnqC_mqNvxq`@"
+
+
+def test_encode():
+    assert geometry.encode(POINTS) == POLYLINE
+
+
+def test_decode():
+    assert geometry.decode(POLYLINE) == POINTS
+
+
+def test_simplify_straight_line():
+    line = [(10 + index * 1e-4, 106.0) for index in range(100)]
+    assert geometry.simplify(line, tolerance=1) == [line[0], line[-1]]
+
+
+def test_simplify_keeps_corners():
+    # about 1.1 km north, then 1.1 km east
+    corner = [(10 + index * 1e-3, 106.0) for index in range(10)] + [
+        (10.01, 106.0 + index * 1e-3) for index in range(11)
+    ]
+    assert geometry.simplify(corner, tolerance=1) == [
+        corner[0],
+        corner[10],
+        corner[-1],
+    ]
+
+
+def test_simplify_tolerance():
+    wave = [
+        (10 + index * 1e-4, 106 + 1e-4 * math.sin(index / 5))
+        for index in range(500)
+    ]
+    # the wave is about 11 m high: a wider tolerance flattens it
+    assert len(geometry.simplify(wave, tolerance=1)) > 10
+    assert len(geometry.simplify(wave, tolerance=20)) == 2
+
+
+def test_lengths():
+    # a degree of latitude is about 111.2 km
+    meridian = np.array([(10 + index * 1e-2, 106.0) for index in range(101)])
+    routes = [meridian, meridian[:1], meridian[:51], np.empty((0, 2))]
+    assert geometry.lengths(routes) == pytest.approx(
+        [111_195, 0, 55_597, 0], abs=1
+    )
@@ -0,0 +1,55 @@
+# test_indexes.py
+
+from uuid import uuid4
+
+import pytest
+from sqlalchemy import delete, select, text
+
+from app import models
+from app.ctrl import pagination
+
+
+def explain(session, statement) -> str:
+    # the tables are nearly empty, so make any usable index win
+    session.execute(text("SET LOCAL enable_seqscan = off"))
+    compiled = statement.compile(dialect=session.bind.dialect)
+    plan = session.connection().exec_driver_sql(
+        f"EXPLAIN {compiled}", compiled.params
+    )
+    return "\n".join(row[0] for row in plan)
+
+
+@pytest.mark.parametrize(
+    "statement, index",
+    [
+        (
+            pagination.paginate(
+                select(models.Vehicle).filter(
+                    models.Vehicle.owner_id == uuid4()
+                ),
+                models.Vehicle,
+                100,
+                None,
+            ),
+            "ix_vehicles_owner_id_date_created_id",
+        ),
+        (
+            pagination.paginate(select(models.Route), models.Route, 100, None),
+            "ix_routes_date_created_id",
+        ),
+        (
+            delete(models.Vehicle).filter(models.Vehicle.owner_id == uuid4()),
+            "ix_vehicles_owner_id_date_created_id",
+        ),
+        (
+            delete(models.Route).filter(models.Route.driver_id == uuid4()),
+            "ix_routes_driver_id_date_created_id",
+        ),
+        (
+            delete(models.Route).filter(models.Route.vehicle_id == uuid4()),
+            "ix_routes_vehicle_id_date_created_id",
+        ),
+    ],
+)
+def test_query_uses_index(session, statement, index):
+    assert index in explain(session, statement)
@@ -0,0 +1,99 @@
+# test_positions.py
+
+import datetime as dt
+
+import pytest
+
+from app import models
+from app.ctrl import positions
+from app.database import SyncSession
+from app.dependencies import redis
+
+NOW = dt.datetime(2026, 1, 1, tzinfo=dt.timezone.utc)
+
+# (lat, lon)
+DISTRICT_1 = (10.77, 106.70)
+DISTRICT_3 = (10.78, 106.68)
+HANOI = (21.03, 105.85)
+
+
+@pytest.fixture
+def test_vehicles(session, test_fleets):
+    vehicles = [
+        models.Vehicle(
+            vehicle_brand="Ford",
+            vehicle_plate_number=f"29A-{index}",
+            owner_id=fleet.id,
+        )
+        for index, fleet in enumerate(test_fleets[:2])
+    ]
+    session.add_all(vehicles)
+    session.commit()
+    return [(vehicle.id, vehicle.owner_id) for vehicle in vehicles]
+
+
+def index(client, session, *points) -> int:
+    """Index (vehicle id, ts, (lat, lon)) points as the flusher would."""
+    records = [
+        (vehicle_id, ts, lat, lon, 30.0, 90.0)
+        for vehicle_id, ts, (lat, lon) in points
+    ]
+    return client.portal.call(
+        positions.index, records, redis.redis, SyncSession(session)
+    )
+
+
+def nearby(client, place, **params):
+    lat, lon = place
+    ret = client.get(
+        "/api/vehicles/nearby",
+        params={"lat": lat, "lon": lon, "radius_km": 5, **params},
+    )
+    assert ret.status_code == 200
+    return [position["vehicle_uuid"] for position in ret.json()]
+
+
+def test_nearby(client, session, test_vehicles):
+    (first, first_fleet), (second, _) = test_vehicles
+    index(client, session, (first, NOW, DISTRICT_1), (second, NOW, DISTRICT_3))
+    assert nearby(client, DISTRICT_1) == [str(first), str(second)]
+    assert nearby(client, DISTRICT_3) == [str(second), str(first)]
+    assert nearby(client, DISTRICT_3, owner_id=first_fleet) == [str(first)]
+    assert nearby(client, HANOI) == []
+
+
+def test_within_bbox(client, session, test_vehicles):
+    (first, _), (second, _) = test_vehicles
+    index(client, session, (first, NOW, DISTRICT_1), (second, NOW, HANOI))
+    ret = client.get(
+        "/api/vehicles/within-bbox",
+        params={
+            "min_lon": 106.6,
+            "min_lat": 10.7,
+            "max_lon": 106.8,
+            "max_lat": 10.8,
+        },
+    )
+    assert ret.status_code == 200
+    assert [position["vehicle_uuid"] for position in ret.json()] == [
+        str(first)
+    ]
+
+
+def test_late_point_does_not_move_vehicle(client, session, test_vehicles):
+    (first, _), _ = test_vehicles
+    assert index(client, session, (first, NOW, DISTRICT_1)) == 1
+    # flushed later, but recorded before the indexed position
+    earlier = NOW - dt.timedelta(minutes=1)
+    assert index(client, session, (first, earlier, HANOI)) == 0
+    assert nearby(client, DISTRICT_1) == [str(first)]
+    later = NOW + dt.timedelta(minutes=1)
+    assert index(client, session, (first, later, HANOI)) == 1
+    assert nearby(client, HANOI) == [str(first)]
+
+
+def test_deleted_vehicle_is_forgotten(client, session, test_vehicles):
+    (first, _), _ = test_vehicles
+    index(client, session, (first, NOW, DISTRICT_1))
+    assert client.delete(f"/api/vehicles/{first}").status_code == 204
+    assert nearby(client, DISTRICT_1) == []
@@ -0,0 +1,153 @@
+# test_routes.py
+
+import datetime as dt
+from uuid import uuid4
+
+import pytest
+from sqlalchemy import select
+
+from app import models
+
+
+@pytest.fixture
+def test_route(session, test_fleets):
+    vehicle = models.Vehicle(
+        vehicle_brand="Ford",
+        vehicle_plate_number="29A-12345",
+        owner_id=test_fleets[0].id,
+    )
+    driver = models.Driver(driver_name="Bao", phone_number="0901")
+    session.add_all([vehicle, driver])
+    session.flush()
+    route = models.Route(
+        route_name="Airport",
+        route_info="HCM",
+        driver_id=driver.id,
+        vehicle_id=vehicle.id,
+    )
+    session.add(route)
+    session.commit()
+    return route
+
+
+def route_lists(client, route):
+    """Fill the caches that hold ``route``, and return what they hold."""
+    return {
+        "routes": client.get("/api/routes/").json(),
+        "route": client.get(f"/api/routes/{route.id}").status_code,
+        "of_driver": client.get(
+            f"/api/routes/driver/{route.driver_id}"
+        ).json(),
+        "of_vehicle": client.get(
+            f"/api/routes/vehicle/{route.vehicle_id}"
+        ).json(),
+    }
+
+
+def test_delete_driver_drops_cached_routes(client, test_route):
+    cached = route_lists(client, test_route)
+    assert len(cached["of_vehicle"]) == 1
+    ret = client.delete(f"/api/drivers/{test_route.driver_id}")
+    assert ret.status_code == 204
+    assert client.get("/api/routes/").json() == []
+    assert client.get(f"/api/routes/{test_route.id}").status_code == 404
+    ret = client.get(f"/api/routes/vehicle/{test_route.vehicle_id}")
+    assert ret.json() == []
+
+
+def test_delete_vehicle_drops_cached_routes(client, test_route):
+    route_lists(client, test_route)
+    ret = client.delete(f"/api/vehicles/{test_route.vehicle_id}")
+    assert ret.status_code == 204
+    assert client.get("/api/routes/").json() == []
+    assert client.get(f"/api/routes/{test_route.id}").status_code == 404
+    ret = client.get(f"/api/routes/driver/{test_route.driver_id}")
+    assert ret.json() == []
+
+
+def test_delete_fleet_drops_cached_vehicles_and_routes(
+    client, test_fleets, test_route
+):
+    fleet_uuid = test_fleets[0].id
+    route_lists(client, test_route)
+    assert len(client.get("/api/vehicles/").json()) == 1
+    client.get(f"/api/vehicles/{test_route.vehicle_id}")
+    ret = client.delete(f"/api/fleets/{fleet_uuid}")
+    assert ret.status_code == 204
+    assert client.get("/api/vehicles/").json() == []
+    ret = client.get(f"/api/vehicles/{test_route.vehicle_id}")
+    assert ret.status_code == 404
+    assert client.get("/api/routes/").json() == []
+    assert client.get(f"/api/routes/{test_route.id}").status_code == 404
+    ret = client.get(f"/api/routes/driver/{test_route.driver_id}")
+    assert ret.json() == []
+
+
+def test_create_route_unknown_driver(client, test_route):
+    driver_uuid = uuid4()
+    ret = client.post(
+        "/api/routes/",
+        params={
+            "driver_id": str(driver_uuid),
+            "vehicle_id": str(test_route.vehicle_id),
+        },
+        json={"name": "Harbour", "info": "HCM"},
+    )
+    assert ret.status_code == 404
+    assert ret.json()["detail"] == f"Drivers ['{driver_uuid}'] do not exist"
+
+
+def test_create_routes_bulk_unknown_vehicle(client, test_route):
+    vehicle_uuid = uuid4()
+    ret = client.post(
+        "/api/routes/bulk",
+        json=[
+            {
+                "name": "Harbour",
+                "info": "HCM",
+                "driver_uuid": str(test_route.driver_id),
+                "vehicle_uuid": str(vehicle_uuid),
+            }
+        ],
+    )
+    assert ret.status_code == 404
+    assert ret.json()["detail"] == f"Vehicles ['{vehicle_uuid}'] do not exist"
+
+
+def test_reschedule_route_conflict(client, session, test_route):
+    starts_at = dt.datetime(2026, 1, 5, 8, tzinfo=dt.timezone.utc)
+    test_route.starts_at = starts_at
+    test_route.ends_at = starts_at + dt.timedelta(hours=1)
+    session.add(
+        models.Route(
+            route_name="Harbour",
+            route_info="HCM",
+            driver_id=test_route.driver_id,
+            vehicle_id=test_route.vehicle_id,
+            starts_at=starts_at + dt.timedelta(hours=2),
+            ends_at=starts_at + dt.timedelta(hours=3),
+        )
+    )
+    session.commit()
+    route_uuid, version = test_route.id, test_route.version
+
+    # only the end moves, into the other route, which the stored start and
+    # the new end together overlap
+    ends_at = starts_at + dt.timedelta(hours=2, minutes=30)
+    ret = client.patch(
+        f"/api/routes/{route_uuid}", json={"ends_at": ends_at.isoformat()}
+    )
+    assert ret.status_code == 409
+    stored = session.execute(
+        select(models.Route.ends_at, models.Route.version).filter(
+            models.Route.id == route_uuid
+        )
+    ).one()
+    assert stored == (starts_at + dt.timedelta(hours=1), version)
+
+    ends_at = starts_at + dt.timedelta(hours=2)
+    ret = client.patch(
+        f"/api/routes/{route_uuid}", json={"ends_at": ends_at.isoformat()}
+    )
+    assert ret.status_code == 200
+    assert dt.datetime.fromisoformat(ret.json()["ends_at"]) == ends_at
@@ -0,0 +1,59 @@
+# test_schedule.py
+
+import logging
+
+from sqlalchemy import text
+
+from app.ctrl import schedule
+from app.database import Base
+
+
+def test_overlaps():
+    bookings = [
+        (0.0, 10.0, 0, "a"),
+        (5.0, 15.0, 1, "b"),
+        (10.0, 20.0, 2, "c"),
+        (12.0, 13.0, 3, "d"),
+    ]
+    # windows are half-open: "a" ends as "c" starts
+    assert set(schedule._overlaps(bookings)) == {
+        ("a", "b"),
+        ("b", "c"),
+        ("b", "d"),
+        ("c", "d"),
+    }
+
+
+def test_no_overlaps():
+    bookings = [(float(hour), hour + 1.0, hour, hour) for hour in range(24)]
+    assert list(schedule._overlaps(bookings)) == []
+
+
+def test_exclusion_constraints_need_btree_gist(session, caplog):
+    Base.metadata.drop_all(bind=session.bind)
+    with caplog.at_level(logging.WARNING, logger="app.models"):
+        Base.metadata.create_all(bind=session.bind)
+    installed = session.scalar(
+        text(
+            "SELECT EXISTS (SELECT 1 FROM pg_extension"
+            " WHERE extname = 'btree_gist')"
+        )
+    )
+    constraints = set(
+        session.scalars(
+            text(
+                "SELECT conname FROM pg_constraint"
+                " WHERE conname LIKE 'ex_routes_%'"
+            )
+        )
+    )
+    if installed:
+        assert constraints == {
+            "ex_routes_driver_schedule",
+            "ex_routes_vehicle_schedule",
+        }
+    else:
+        # a database without the extension says so instead of silently
+        # going without the constraints
+        assert constraints == set()
+        assert "btree_gist is not available" in caplog.text
@@ -0,0 +1,180 @@
+# test_telemetry.py
+
+import asyncio
+import datetime as dt
+import time
+from uuid import uuid4
+
+import pytest
+from sqlalchemy import func, select, text
+from starlette.websockets import WebSocketDisconnect
+
+from app import models, schemas
+from app.config import settings
+from app.ctrl import telemetry
+from app.main import app
+from app.security.oauth2 import create_access_token
+
+
+def point(**changes) -> dict:
+    return {
+        "vehicle_uuid": str(uuid4()),
+        "ts": dt.datetime.now(dt.timezone.utc).isoformat(),
+        "lat": 10.77,
+        "lon": 106.7,
+        "speed": 30.0,
+        "heading": 90.0,
+        **changes,
+    }
+
+
+def test_ingest_telemetry(client):
+    ret = client.post("/api/vehicles/telemetry", json=[point(), point()])
+    assert ret.status_code == 202
+    assert ret.json() == {"accepted": 2}
+
+
+@pytest.mark.parametrize(
+    "ts",
+    [
+        dt.datetime.now(dt.timezone.utc) + dt.timedelta(days=3),
+        dt.datetime.now(dt.timezone.utc) - dt.timedelta(days=365),
+    ],
+)
+def test_ingest_telemetry_out_of_range_ts(client, ts):
+    ret = client.post(
+        "/api/vehicles/telemetry", json=[point(ts=ts.isoformat())]
+    )
+    assert ret.status_code == 422
+
+
+def test_stream_telemetry(client):
+    token = create_access_token({"sub": "bao"})
+    with client.websocket_connect(
+        f"/api/vehicles/telemetry/ws?token={token}"
+    ) as websocket:
+        websocket.send_json([point(), point(), point()])
+        assert websocket.receive_json() == {"accepted": 3}
+        websocket.send_json([point(speed=-1)])
+        assert "detail" in websocket.receive_json()
+
+
+def test_stream_telemetry_bad_token(client):
+    with pytest.raises(WebSocketDisconnect) as exc_info:
+        with client.websocket_connect(
+            "/api/vehicles/telemetry/ws?token=nope"
+        ) as websocket:
+            websocket.receive_json()
+    assert exc_info.value.code == 1008
+
+
+def wait_for(predicate, timeout: float = 5.0) -> None:
+    deadline = time.monotonic() + timeout
+    while not predicate():
+        assert time.monotonic() < deadline
+        time.sleep(0.05)
+
+
+def telemetry_rows(session) -> int:
+    return session.scalar(select(func.count()).select_from(models.telemetry))
+
+
+@pytest.fixture
+def quick_flush(monkeypatch):
+    # asked for ahead of the client, whose startup reads it
+    monkeypatch.setattr(settings, "telemetry_flush_interval", 0.05)
+
+
+@pytest.fixture
+def small_buffer(monkeypatch):
+    # never flushed while a test runs
+    monkeypatch.setattr(settings, "telemetry_buffer_max_points", 2)
+    monkeypatch.setattr(settings, "telemetry_flush_interval", 60.0)
+    monkeypatch.setattr(settings, "telemetry_put_timeout", 0.1)
+
+
+def test_flush_telemetry(quick_flush, client, session):
+    today = dt.datetime.now(dt.timezone.utc)
+    old = today - dt.timedelta(days=10)
+    ret = client.post(
+        "/api/vehicles/telemetry",
+        json=[point(), point(), point(ts=old.isoformat())],
+    )
+    assert ret.status_code == 202
+    wait_for(lambda: telemetry_rows(session) == 3)
+
+    partitions = session.scalars(
+        text(
+            "SELECT inhrelid::regclass::text FROM pg_inherits "
+            "WHERE inhparent = 'telemetry'::regclass"
+        )
+    ).all()
+    days = [
+        today.date() + dt.timedelta(days=days)
+        for days in range(settings.telemetry_partition_days_ahead + 1)
+    ]
+    assert sorted(partitions) == sorted(
+        ["telemetry_default", *(f"telemetry_{day:%Y%m%d}" for day in days)]
+    )
+    # points of days without a partition land in the default one
+    assert dict(
+        session.execute(
+            text(
+                "SELECT tableoid::regclass::text, count(*) FROM telemetry "
+                "GROUP BY 1"
+            )
+        ).all()
+    ) == {f"telemetry_{today:%Y%m%d}": 2, "telemetry_default": 1}
+
+
+def test_ingest_telemetry_buffer_full(small_buffer, client):
+    ret = client.post("/api/vehicles/telemetry", json=[point(), point()])
+    assert ret.status_code == 202
+    ret = client.post("/api/vehicles/telemetry", json=[point()])
+    assert ret.status_code == 503
+    assert ret.headers["Retry-After"] == "1"
+
+
+def test_stream_telemetry_waits_for_room(small_buffer, client):
+    ret = client.post("/api/vehicles/telemetry", json=[point(), point()])
+    assert ret.status_code == 202
+    token = create_access_token({"sub": "bao"})
+    with client.websocket_connect(
+        f"/api/vehicles/telemetry/ws?token={token}"
+    ) as websocket:
+        websocket.send_json([point()])
+        time.sleep(0.3)
+        assert len(telemetry.buffer.records) == 2
+        # a flush makes room, and the waiting message goes in
+        assert len(client.portal.call(telemetry.buffer.take, 0, 0)) == 2
+        assert websocket.receive_json() == {"accepted": 1}
+    assert len(telemetry.buffer.records) == 1
+
+
+@pytest.mark.parametrize("in_flight", [False, True])
+def test_stop_flusher_flushes(client, session, monkeypatch, in_flight):
+    copy = telemetry.copy
+
+    async def slow_copy(records, engine):
+        await asyncio.sleep(0.2)
+        await copy(records, engine)
+
+    monkeypatch.setattr(telemetry, "copy", slow_copy)
+    # flushes as soon as a point comes in, or only when stopped
+    monkeypatch.setattr(
+        settings, "telemetry_flush_points", 1 if in_flight else 100
+    )
+
+    async def add_and_stop():
+        flusher = telemetry.start_flusher(
+            app.state.telemetry_engine, app.state.telemetry_session
+        )
+        points = [schemas.TelemetryPoint.model_validate(point())] * 2
+        await telemetry.add(points, timeout=None)
+        await asyncio.sleep(0.05)
+        # taken by the flusher and being copied, or still buffered
+        assert len(telemetry.buffer.records) == (0 if in_flight else 2)
+        await telemetry.stop_flusher(flusher)
+
+    client.portal.call(add_and_stop)
+    assert telemetry_rows(session) == 2
@@ -0,0 +1,78 @@
+# test_user.py
+
+from datetime import datetime, timedelta
+
+from jose import jwt
+
+from app.config import settings
+from app.security.oauth2 import ALGORITHM, SECRET_KEY, create_access_token
+
+from .conftest import PASSWORD
+
+
+def bearer(token: str) -> dict:
+    return {"Authorization": f"Bearer {token}"}
+
+
+def test_access_token(client):
+    assert client.get("/").status_code == 200
+    # served from the token cache this time
+    assert client.get("/").status_code == 200
+
+
+def test_invalid_access_token(client):
+    token = create_access_token({"sub": "bao"})
+    ret = client.get("/", headers=bearer(token[:-2] + "xx"))
+    assert ret.status_code == 401
+    expired = jwt.encode(
+        {"sub": "bao", "exp": datetime.utcnow() - timedelta(minutes=1)},
+        SECRET_KEY,
+        algorithm=ALGORITHM,
+    )
+    assert client.get("/", headers=bearer(expired)).status_code == 401
+
+
+def test_revoke_access_token(client):
+    # unlike the client's token, though issued in the same second
+    token = create_access_token({"sub": "bao", "jti": "revoked"})
+    assert client.get("/", headers=bearer(token)).status_code == 200
+    ret = client.post("/token/revoke", headers=bearer(token))
+    assert ret.status_code == 204
+    # revoked although the token was cached by the first request
+    assert client.get("/", headers=bearer(token)).status_code == 401
+    # other tokens of the same user still work
+    assert client.get("/").status_code == 200
+
+
+def login(client, password: str):
+    return client.post(
+        "/token/", data={"username": "bao", "password": password}
+    )
+
+
+def test_login(client, test_user):
+    ret = login(client, PASSWORD)
+    assert ret.status_code == 200
+    token = ret.json()["access_token"]
+    assert client.get("/", headers=bearer(token)).status_code == 200
+    assert login(client, "wrong").status_code == 401
+
+
+def test_login_rate_limited(client, test_user):
+    for _ in range(settings.login_rate_limit):
+        assert login(client, "wrong").status_code == 401
+    ret = login(client, PASSWORD)
+    assert ret.status_code == 429
+    assert 0 < int(ret.headers["Retry-After"]) <= settings.login_rate_window
+
+
+def test_login_rate_limit_counts_failures_only(client, test_user):
+    for _ in range(settings.login_rate_limit + 1):
+        assert login(client, PASSWORD).status_code == 200
+    for _ in range(settings.login_rate_limit - 1):
+        assert login(client, "wrong").status_code == 401
+    # a successful login starts the count again
+    assert login(client, PASSWORD).status_code == 200
+    for _ in range(settings.login_rate_limit - 1):
+        assert login(client, "wrong").status_code == 401
+    assert login(client, PASSWORD).status_code == 200
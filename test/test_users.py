@@ -0,0 +1,105 @@
+# test_users.py
+
+from app import cache, schemas
+from app.dependencies import redis
+from app.security.oauth2 import create_access_token
+
+
+def test_create_user(client, test_fleets):
+    fleet_uuid = test_fleets[0].id
+    ret = client.post(
+        "/api/users/",
+        json={
+            "username": "lan",
+            "password": "secret",
+            "fleet_id": str(fleet_uuid),
+        },
+    )
+    assert ret.status_code == 201
+    user = schemas.User(**ret.json())
+    assert user.fleet_id == fleet_uuid
+    assert "password" not in ret.json()
+    assert "hashed_password" not in ret.json()
+    ret = client.post(
+        "/token/", data={"username": "lan", "password": "secret"}
+    )
+    assert ret.status_code == 200
+
+
+def test_create_user_duplicate(client):
+    ret = client.post(
+        "/api/users/", json={"username": "bao", "password": "secret"}
+    )
+    assert ret.status_code == 400
+    assert ret.json()["detail"] == "Error create user"
+
+
+def test_users_staff_only(client, test_fleets):
+    fleet_uuid = test_fleets[0].id
+    client.post(
+        "/api/users/",
+        json={
+            "username": "lan",
+            "password": "secret",
+            "fleet_id": str(fleet_uuid),
+        },
+    )
+    token = create_access_token({"sub": "lan", "fleet": str(fleet_uuid)})
+    ret = client.post(
+        "/api/users/",
+        json={"username": "mai", "password": "secret"},
+        headers={"Authorization": f"Bearer {token}"},
+    )
+    assert ret.status_code == 403
+
+
+def test_disable_user(client):
+    client.post("/api/users/", json={"username": "lan", "password": "secret"})
+    token = create_access_token({"sub": "lan"})
+    headers = {"Authorization": f"Bearer {token}"}
+    assert client.get("/", headers=headers).status_code == 200
+    ret = client.patch("/api/users/lan", json={"disabled": True})
+    assert ret.status_code == 200
+    assert ret.json()["disabled"] is True
+    # the token was cached by the first request, and is refused anyway
+    assert client.get("/", headers=headers).status_code == 401
+    ret = client.post(
+        "/token/", data={"username": "lan", "password": "secret"}
+    )
+    assert ret.status_code == 401
+
+
+def test_disable_unknown_user(client):
+    ret = client.patch("/api/users/nobody", json={"disabled": True})
+    assert ret.status_code == 404
+
+
+def test_delete_fleet_with_users(client, test_fleets):
+    fleet_uuid = test_fleets[0].id
+    client.post(
+        "/api/users/",
+        json={
+            "username": "lan",
+            "password": "secret",
+            "fleet_id": str(fleet_uuid),
+        },
+    )
+    token = create_access_token({"sub": "lan", "fleet": str(fleet_uuid)})
+    headers = {"Authorization": f"Bearer {token}"}
+    assert client.get("/", headers=headers).status_code == 200
+    ret = client.delete(f"/api/fleets/{fleet_uuid}")
+    assert ret.status_code == 409
+    assert client.get("/", headers=headers).status_code == 200
+    assert client.delete("/api/users/lan").status_code == 204
+    assert client.get("/", headers=headers).status_code == 401
+    assert client.delete("/api/users/lan").status_code == 404
+    assert client.delete(f"/api/fleets/{fleet_uuid}").status_code == 204
+
+
+def test_cached_user_has_no_password_hash(client):
+    # the client's own requests cached bao
+    assert client.get("/").status_code == 200
+    cached_user = client.portal.call(redis.redis.get, "user_bao")
+    assert schemas.User.model_validate_json(cached_user).username == "bao"
+    assert b"hashed_password" not in cached_user
+    assert b"hashed_password" not in cache.local.get("user_bao")
@@ -0,0 +1,59 @@
+# test_vehicles.py
+
+from uuid import uuid4
+
+from app import schemas
+
+
+def test_create_vehicle(client, test_fleets):
+    fleet_uuid = test_fleets[0].id
+    ret = client.post(
+        "/api/vehicles/",
+        params={"fleet_id": str(fleet_uuid)},
+        json={"brand": "Ford", "plate": "29A-12345"},
+    )
+    assert ret.status_code == 201
+    assert schemas.Vehicle(**ret.json()).owner_id == fleet_uuid
+
+
+def test_create_vehicle_unknown_fleet(client, test_fleets):
+    fleet_uuid = uuid4()
+    ret = client.post(
+        "/api/vehicles/",
+        params={"fleet_id": str(fleet_uuid)},
+        json={"brand": "Ford", "plate": "29A-12345"},
+    )
+    assert ret.status_code == 404
+    assert ret.json()["detail"] == f"Fleets ['{fleet_uuid}'] do not exist"
+
+
+def test_create_vehicle_duplicate_plate(client, test_fleets):
+    params = {"fleet_id": str(test_fleets[0].id)}
+    vehicle = {"brand": "Ford", "plate": "29A-12345"}
+    client.post("/api/vehicles/", params=params, json=vehicle)
+    # the fleet exists, so the conflict is not reported as a 404
+    ret = client.post("/api/vehicles/", params=params, json=vehicle)
+    assert ret.status_code == 400
+    assert ret.json()["detail"] == "Error create vehicle"
+
+
+def test_create_vehicles_bulk_unknown_fleet(client, test_fleets):
+    fleet_uuid = uuid4()
+    ret = client.post(
+        "/api/vehicles/bulk",
+        json=[
+            {
+                "brand": "Ford",
+                "plate": "29A-12345",
+                "owner_uuid": str(test_fleets[0].id),
+            },
+            {
+                "brand": "Kia",
+                "plate": "29A-67890",
+                "owner_uuid": str(fleet_uuid),
+            },
+        ],
+    )
+    assert ret.status_code == 404
+    assert ret.json()["detail"] == f"Fleets ['{fleet_uuid}'] do not exist"
+    assert client.get("/api/vehicles/").json() == []